@@ -0,0 +1,108 @@
+"""Validate the Willow Whisper clue matching thresholds on a labelled corpus.
+
+Every corpus entry holds a story's key details, a player line and the clues that line reveals. The script
+scores every line once, then sweeps the fuzzy and semantic thresholds and reports precision, recall and F1
+for each pair next to the old exact substring check, plus the matching time per line.
+
+Run from the src folder:
+    python -m benchmarks.clue_matcher
+    python -m benchmarks.clue_matcher --no-encoder     # spelling only, without sentence-transformers
+    python -m benchmarks.clue_matcher --corpus my_transcripts.json
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+
+from utils.clue_matcher import ClueMatcher
+from constants import CLUE_SEMANTIC_THRESHOLD, CLUE_FUZZY_THRESHOLD
+
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'clue_corpus.json')
+
+
+def f1_scores(results, decide):
+    """(precision, recall, f1) of decide(clue, semantic, fuzzy, text) over the scored corpus"""
+    true_positives = false_positives = false_negatives = 0
+    for entry, scores in results:
+        predicted = {clue for clue, (semantic, fuzzy) in scores.items() if decide(clue, semantic, fuzzy, entry['text'])}
+        expected = set(entry['expected'])
+        true_positives += len(predicted & expected)
+        false_positives += len(predicted - expected)
+        false_negatives += len(expected - predicted)
+    precision = true_positives / (true_positives + false_positives) if true_positives + false_positives else 1.0
+    recall = true_positives / (true_positives + false_negatives) if true_positives + false_negatives else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=CORPUS, help="JSON list of {clues, text, expected}")
+    parser.add_argument('--no-encoder', action='store_true', help="skip embeddings, fuzzy matching only")
+    parser.add_argument('--model', default='all-MiniLM-L6-v2', help="sentence encoder, the RAG one by default")
+    args = parser.parse_args()
+
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    encoder = None
+    if not args.no_encoder:
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer(args.model)
+
+    matchers, results, timings = {}, [], []
+    for entry in corpus:
+        key = tuple(entry['clues'])
+        if key not in matchers:  # Clues are embedded once per story, as in the game
+            matchers[key] = ClueMatcher(entry['clues'], encoder)
+        start = time.perf_counter()
+        scores = matchers[key].scores(entry['text'])
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append((entry, scores))
+
+    print(f"{len(corpus)} lines, {len(matchers)} stories, "
+          f"match time p50 {statistics.median(timings):.2f} ms, max {max(timings):.2f} ms\n")
+
+    exact = f1_scores(results, lambda clue, semantic, fuzzy, text: clue.lower() in text.lower())
+    print(f"{'exact substring':<28} precision {exact[0]:.2f} recall {exact[1]:.2f} f1 {exact[2]:.2f}")
+
+    fuzzy_thresholds = np.round(np.arange(0.70, 0.96, 0.02), 2)
+    semantic_thresholds = np.round(np.arange(0.40, 0.86, 0.02), 2) if encoder else [float('inf')]
+    sweep = []
+    for fuzzy_threshold in fuzzy_thresholds:
+        for semantic_threshold in semantic_thresholds:
+            scores = f1_scores(results, lambda clue, semantic, fuzzy, text:
+                               fuzzy >= fuzzy_threshold or semantic >= semantic_threshold)
+            sweep.append((scores, fuzzy_threshold, semantic_threshold))
+
+    current = f1_scores(results, lambda clue, semantic, fuzzy, text:
+                        fuzzy >= CLUE_FUZZY_THRESHOLD or (encoder is not None and semantic >= CLUE_SEMANTIC_THRESHOLD))
+    print(f"{'configured':<28} precision {current[0]:.2f} recall {current[1]:.2f} f1 {current[2]:.2f} "
+          f"(fuzzy {CLUE_FUZZY_THRESHOLD}, semantic {CLUE_SEMANTIC_THRESHOLD if encoder else 'off'})\n")
+
+    print("Best thresholds, precision first since a false clue ends the riddle early:")
+    sweep.sort(key=lambda item: (round(item[0][2], 3), item[0][0]), reverse=True)
+    for (precision, recall, f1), fuzzy_threshold, semantic_threshold in sweep[:10]:
+        semantic = f"{semantic_threshold:.2f}" if encoder else 'off'
+        print(f"fuzzy {fuzzy_threshold:.2f} semantic {semantic:<5} precision {precision:.2f} recall {recall:.2f} "
+              f"f1 {f1:.2f}")
+
+    print("\nMisses and false clues with the configured thresholds:")
+    for entry, scores in results:
+        matcher = matchers[tuple(entry['clues'])]
+        predicted = {clue for clue, (semantic, fuzzy) in scores.items()
+                     if fuzzy >= matcher.fuzzy_threshold or semantic >= matcher.semantic_threshold}
+        expected = set(entry['expected'])
+        if predicted != expected:
+            details = ', '.join(f"{clue} {scores[clue][0]:.2f}/{scores[clue][1]:.2f}"
+                                for clue in sorted(predicted ^ expected))
+            print(f"  {entry['text']!r}: missed {sorted(expected - predicted)}, false {sorted(predicted - expected)}"
+                  f" (semantic/fuzzy: {details})")
+
+
+if __name__ == '__main__':
+    main()
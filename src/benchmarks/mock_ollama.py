@@ -0,0 +1,230 @@
+"""Deterministic stand-in for the Ollama server.
+
+Implements the parts of the Ollama HTTP API the game uses (/api/chat with NDJSON streaming,
+/api/generate for model loading, /api/tags, /api/version) with configurable latency, so every
+LLM-dependent code path can be load-tested and profiled without a GPU or real models.
+
+Responses are picked per prompt family (dialogue, decision, shout, intimidation, death story,
+name, summary) and seeded by the prompt text, so the same prompt always yields the same reply.
+
+Run from the src folder and point the game at it:
+    python -m benchmarks.mock_ollama --port 11435 --ttft 0.3 --tps 40
+    OLLAMA_HOST=http://localhost:11435 python main.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from utils.llm_router import keep_seconds
+from utils.transcript import count_tokens
+
+
+CONFIG = {
+    'ttft': 0.3,  # seconds before the first token
+    'tps': 40.0,  # generated tokens per second
+    'load_time': 2.0,  # seconds to "load" a model that is not resident
+    'keep_alive': 300.0,  # default seconds a model stays resident
+    'seed': 0,
+}
+
+# Family -> list of reply templates. Dialogue replies are built from the JSON fields the prompt asks for.
+RESPONSES = {
+    'decision': ['{{"decision": "approach"}}', '{{"decision": "attack"}}', '{{"decision": "moveto"}}',
+                 '{{"decision": "talk"}}', '{{"decision": "flee"}}'],
+    'shout': ['Me smash puny human!', 'Your skull be mine toilet!', 'Come here and bleed!',
+              'I will piss on your corpse!', 'Run, little snack, run!'],
+    'intimidation': ['{{"intimidation_level": {level}}}'],
+    'name': ['{{"name": ["Grukthak", "Snagrot", "Vorzul", "Mirkfang", "Drazzle", "Ulgrim", "Skorv", "Throgg", '
+             '"Nazrik", "Bleakmaw"]}}'],
+    'death_story': ['```json\n{{"victim_name": "Elsbeth", "location": "the old mill", "cause": "drowned in the '
+                    'millrace", "key_details": ["mill", "river", "ring", "brother", "night"], "perpetrator": '
+                    '"her brother Aldric", "text": "Elsbeth was pushed into the millrace at night by her brother '
+                    'Aldric, who wanted the ring their mother left her."}}\n```'],
+    'summary': ['The player and {speaker} talked briefly and nothing was agreed yet.',
+                'The player asked {speaker} about work and {speaker} hinted at a reward.'],
+    'dialogue': ['Well met, traveler. The roads are dangerous these days, so watch your back.',
+                 'Hah! You think you can talk your way out of this? Give me a reason to listen.',
+                 'The wind whispers your name. Come closer and I will tell you what it says.',
+                 'I have heard stories about you. Some good, most of them not.'],
+}
+
+# Extra JSON fields a dialogue prompt may ask for, with the values the mock returns.
+DIALOGUE_FIELDS = {
+    'player_inappropriate_request': False,
+    'further_action': 'wait',
+    'player_friendly': False,
+    'give_money': 0,
+    'riddle_solved': False,
+    'correctly_answered': False,
+    'key_details': [],
+}
+
+app = FastAPI()
+loaded_models = {}  # model -> monotonic time it expires
+
+
+def detect_family(prompt: str) -> str:
+    """Guess which game call produced the prompt"""
+    if 'running summary' in prompt or 'Summarize this conversation' in prompt:
+        return 'summary'
+    if 'decide ONE action' in prompt:
+        return 'decision'
+    if 'battle shout' in prompt:
+        return 'shout'
+    if 'intimidating phrases' in prompt:
+        return 'intimidation'
+    if 'tragic death story' in prompt:
+        return 'death_story'
+    if 'You are naming' in prompt:
+        return 'name'
+    return 'dialogue'
+
+
+def build_reply(prompt: str) -> str:
+    """Return a deterministic reply for the prompt"""
+    digest = hashlib.sha256(f"{CONFIG['seed']}:{prompt}".encode()).hexdigest()
+    rng = random.Random(int(digest[:16], 16))
+    family = detect_family(prompt)
+    speaker = re.search(r"named ([\w' ]+?)[ .,]", prompt)
+    speaker = speaker.group(1) if speaker else 'the stranger'
+
+    if family != 'dialogue':
+        return rng.choice(RESPONSES[family]).format(level=rng.randint(1, 10), speaker=speaker)
+
+    reply = {key: value for key, value in DIALOGUE_FIELDS.items() if key in prompt}
+    reply['text'] = rng.choice(RESPONSES['dialogue'])
+    return f"```json\n{json.dumps(reply)}\n```"
+
+
+def split_tokens(text: str):
+    """Split text into pseudo tokens of up to four characters"""
+    return re.findall(r"\s*\S{1,4}|\s+", text)
+
+
+def prompt_of(body: dict) -> str:
+    if 'messages' in body:
+        return '\n'.join(message.get('content', '') for message in body.get('messages') or [])
+    return body.get('prompt', '')
+
+
+async def ensure_loaded(model: str, keep_alive) -> float:
+    """Simulate model loading, returns the load duration in seconds"""
+    now = time.monotonic()
+    load = 0.0
+    if loaded_models.get(model, 0) < now:
+        load = CONFIG['load_time']
+        await asyncio.sleep(load)
+    loaded_models[model] = time.monotonic() + keep_seconds(keep_alive, CONFIG['keep_alive'])
+    return load
+
+
+def timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def final_stats(prompt: str, tokens: list, load: float, started: float) -> dict:
+    eval_duration = len(tokens) / CONFIG['tps']
+    return {
+        'done': True,
+        'done_reason': 'stop',
+        'total_duration': int((time.monotonic() - started) * 1e9),
+        'load_duration': int(load * 1e9),
+        'prompt_eval_count': count_tokens(prompt),
+        'prompt_eval_duration': int(CONFIG['ttft'] * 1e9),
+        'eval_count': len(tokens),
+        'eval_duration': int(eval_duration * 1e9),
+    }
+
+
+@app.get("/")
+async def root():
+    return "Ollama is running"
+
+
+@app.get("/api/version")
+async def version():
+    return {"version": "0.0.0-mock"}
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": model, "model": model} for model in loaded_models]}
+
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    return await respond(await request.json(), chat=True)
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    return await respond(await request.json(), chat=False)
+
+
+async def respond(body: dict, chat: bool):
+    started = time.monotonic()
+    model = body.get('model', 'mock')
+    prompt = prompt_of(body)
+    load = await ensure_loaded(model, body.get('keep_alive'))
+
+    if not prompt.strip():  # Empty prompt only loads (or unloads) the model
+        return JSONResponse({'model': model, 'created_at': timestamp(), 'done': True, 'done_reason': 'load',
+                             **({'message': {'role': 'assistant', 'content': ''}} if chat else {'response': ''})})
+
+    options = body.get('options') or {}
+    tokens = split_tokens(build_reply(prompt))
+    if options.get('num_predict', -1) > 0:
+        tokens = tokens[:options['num_predict']]
+
+    def piece(content: str) -> dict:
+        base = {'model': model, 'created_at': timestamp()}
+        if chat:
+            base['message'] = {'role': 'assistant', 'content': content}
+        else:
+            base['response'] = content
+        return base
+
+    if not body.get('stream', True):
+        await asyncio.sleep(CONFIG['ttft'] + len(tokens) / CONFIG['tps'])
+        return JSONResponse({**piece(''.join(tokens)), **final_stats(prompt, tokens, load, started)})
+
+    async def stream():
+        await asyncio.sleep(CONFIG['ttft'])
+        for token in tokens:
+            yield json.dumps({**piece(token), 'done': False}) + '\n'
+            await asyncio.sleep(1 / CONFIG['tps'])
+        yield json.dumps({**piece(''), **final_stats(prompt, tokens, load, started)}) + '\n'
+
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--ttft', type=float, default=CONFIG['ttft'], help="seconds before the first token")
+    parser.add_argument('--tps', type=float, default=CONFIG['tps'], help="generated tokens per second")
+    parser.add_argument('--load-time', type=float, default=CONFIG['load_time'], help="cold model load seconds")
+    parser.add_argument('--seed', type=int, default=CONFIG['seed'])
+    parser.add_argument('--responses', help="JSON file mapping prompt family to a list of reply templates")
+    args = parser.parse_args()
+
+    CONFIG.update(ttft=args.ttft, tps=args.tps, load_time=args.load_time, seed=args.seed)
+    if args.responses:
+        with open(args.responses, 'r', encoding='utf-8') as f:
+            RESPONSES.update(json.load(f))
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare prompt size of the old indented-JSON history against the compact transcript.
+
+Conversations are taken from save files (every entity's interaction_history) or from a JSON
+file holding a list of histories. With --host the same prompts are sent to Ollama with
+num_predict=1 to measure the real prompt token count and prompt-eval time.
+
+Run from the src folder:
+    python -m benchmarks.prompt_tokens
+    python -m benchmarks.prompt_tokens --host http://localhost:11434 --model gemma2:2b
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+
+from utils.transcript import render_transcript, count_tokens
+
+
+SAVE_DIR = "data/saves"
+PROMPT_FRAME = "You are {name} in a fantasy RPG game.\nRecent conversation history:\n{history}\nPlayer says: Hello"
+
+
+def load_conversations(path=None):
+    """Return a list of (entity name, interaction history) pairs"""
+    conversations = []
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            for i, history in enumerate(json.load(f)):
+                conversations.append((f"entity_{i}", history))
+        return conversations
+
+    for save_file in glob.glob(os.path.join(SAVE_DIR, "*.json")):
+        with open(save_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for entity in data.get('world_map', {}).get('entities', []):
+            if entity.get('interaction_history'):
+                conversations.append((entity.get('name', 'NPC'), entity['interaction_history']))
+    return conversations
+
+
+def legacy_history(history, limit=5):
+    return json.dumps(history[-min(limit, len(history)):], indent=2) if history else "No recent interactions."
+
+
+def measure_ollama(client, model, prompt):
+    """Return (prompt_eval_count, prompt_eval_duration in ms) reported by Ollama"""
+    response = client.chat(model=model, messages=[{'role': 'system', 'content': prompt}],
+                           options={'num_predict': 1}, keep_alive='10m')
+    return response.get('prompt_eval_count', 0), response.get('prompt_eval_duration', 0) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', help="JSON file with a list of interaction histories")
+    parser.add_argument('--limit', type=int, default=5, help="turns rendered per prompt")
+    parser.add_argument('--host', help="Ollama host to measure real prompt-eval counts and time")
+    parser.add_argument('--model', default='gemma2:2b')
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.history)
+    if not conversations:
+        print(f"No recorded conversations found in {args.history or SAVE_DIR}")
+        return
+
+    client = None
+    if args.host:
+        import ollama
+        client = ollama.Client(host=args.host)
+        measure_ollama(client, args.model, "warmup")  # Load the model before measuring
+
+    rows = []
+    for name, history in conversations:
+        legacy = PROMPT_FRAME.format(name=name, history=legacy_history(history, args.limit))
+        compact = PROMPT_FRAME.format(name=name, history=render_transcript(history, name, limit=args.limit))
+        row = {'name': name, 'turns': min(args.limit, len(history)),
+               'legacy_tokens': count_tokens(legacy), 'compact_tokens': count_tokens(compact)}
+        if client:
+            row['legacy_eval'], row['legacy_ms'] = measure_ollama(client, args.model, legacy)
+            row['compact_eval'], row['compact_ms'] = measure_ollama(client, args.model, compact)
+        rows.append(row)
+
+    print(f"{'entity':<30}{'turns':>6}{'json tok':>10}{'compact tok':>13}{'saved':>8}")
+    for row in rows:
+        saved = 1 - row['compact_tokens'] / row['legacy_tokens']
+        print(f"{row['name'][:29]:<30}{row['turns']:>6}{row['legacy_tokens']:>10}{row['compact_tokens']:>13}"
+              f"{saved:>8.0%}")
+
+    legacy_total = sum(row['legacy_tokens'] for row in rows)
+    compact_total = sum(row['compact_tokens'] for row in rows)
+    print(f"\nEstimated prompt tokens: {legacy_total} -> {compact_total} "
+          f"({1 - compact_total / legacy_total:.0%} fewer) over {len(rows)} conversations")
+
+    if client:
+        for key in ('eval', 'ms'):
+            legacy = statistics.median(row[f'legacy_{key}'] for row in rows)
+            compact = statistics.median(row[f'compact_{key}'] for row in rows)
+            label = "prompt_eval_count" if key == 'eval' else "prompt_eval_duration ms"
+            print(f"Median {label}: {legacy:.1f} -> {compact:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Per-request overhead of the game's calls to its local services, by transport.
+
+A stand-in server with the TTS and STT routes (instant answers, a fixed line of audio) listens on a TCP port
+and on a Unix socket. Every call is timed with:
+  new connection   requests.post, a new TCP connection per call as the handlers used to do
+  pooled tcp       ServiceClient, kept-alive connections
+  pooled unix      ServiceClient over the Unix socket
+for a small JSON call like /start_recording, a whole line from /tts as base64 JSON and as raw wav, and a
+streamed line from /tts_stream. The connections column is how many the server saw.
+
+Run from the src folder:
+    python -m benchmarks.service_overhead --calls 500
+    python -m benchmarks.service_overhead --url http://localhost:1921   # GET /health of a running service
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import struct
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+import requests
+
+from utils.service_client import ServiceClient
+
+
+LINE_SECONDS = 3
+
+
+def stand_in_app(wav_bytes, pcm):
+    from fastapi import FastAPI, Header, Request
+    from fastapi.responses import Response, StreamingResponse
+
+    app = FastAPI()
+    app.state.connections = set()
+
+    @app.middleware("http")
+    async def count_connections(request: Request, call_next):
+        app.state.connections.add(request.client)
+        return await call_next(request)
+
+    @app.post("/start_recording")
+    async def start_recording():
+        return {"status": "Recording started"}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "ready": True}
+
+    @app.post("/tts")
+    async def tts(accept: str = Header(default="")):
+        if "audio/wav" in accept:
+            return Response(wav_bytes, media_type="audio/wav")
+        return {"audio": base64.b64encode(wav_bytes).decode(), "sample_rate": 24000}
+
+    @app.post("/tts_stream")
+    async def tts_stream():
+        frames = [struct.pack('<I', len(part)) + part for part in (pcm[:len(pcm) // 2], pcm[len(pcm) // 2:], b'')]
+        return StreamingResponse(iter(frames), media_type="application/octet-stream",
+                                 headers={"X-Sample-Rate": "24000"})
+
+    return app
+
+
+def serve(app, **bind):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, log_level='warning', timeout_keep_alive=75, **bind))
+    thread = threading.Thread(target=lambda: asyncio.run(server.serve()), daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def time_calls(call, calls):
+    call()  # Connect and warm the route before timing
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def stream_line(post):
+    with post('/tts_stream', json={"text": "Hello", "voice_type": "a"}, stream=True) as response:
+        for _ in response.iter_content(chunk_size=None):
+            pass
+
+
+def workloads(post):
+    return {
+        'small json': lambda: post('/start_recording', json={"max_seconds": 8}).json(),
+        'tts base64 json': lambda: base64.b64decode(post('/tts', json={"text": "Hello"}).json()["audio"]),
+        'tts raw wav': lambda: post('/tts', json={"text": "Hello"}, headers={'Accept': 'audio/wav'}).content,
+        'tts stream': lambda: stream_line(post),
+    }
+
+
+def report(label, workload, timings, connections):
+    print(f"{label:<16} {workload:<16} p50 {np.percentile(timings, 50):6.2f} ms  "
+          f"p95 {np.percentile(timings, 95):6.2f} ms  connections {connections}")
+
+
+def make_line():
+    pcm = (np.sin(np.arange(24000 * LINE_SECONDS) / 10) * 8000).astype(np.int16).tobytes()
+    byte_io = io.BytesIO()
+    with wave.open(byte_io, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(24000)
+        wav_file.writeframes(pcm)
+    return byte_io.getvalue(), pcm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=300, help="timed calls per transport and workload")
+    parser.add_argument('--port', type=int, default=1940)
+    parser.add_argument('--url', help="compare new and pooled connections on GET /health of a running service")
+    args = parser.parse_args()
+
+    if args.url:
+        url = args.url.rstrip('/')
+        client = ServiceClient(url)
+        report('new connection', 'health', time_calls(lambda: requests.get(f"{url}/health"), args.calls), '-')
+        report('pooled', 'health', time_calls(lambda: client.get('/health'), args.calls), '-')
+        return
+
+    app = stand_in_app(*make_line())
+    socket_path = os.path.join(tempfile.mkdtemp(), 'service.sock')
+    servers = [serve(app, host='127.0.0.1', port=args.port), serve(app, uds=socket_path)]
+    tcp = f"http://127.0.0.1:{args.port}"
+    transports = {
+        'new connection': lambda path, **kwargs: requests.post(f"{tcp}{path}", **kwargs),
+        'pooled tcp': ServiceClient(tcp).post,
+        'pooled unix': ServiceClient(f"unix://{socket_path}").post,
+    }
+    print(f"{args.calls} calls each, a {LINE_SECONDS}s line is {len(make_line()[0]) // 1024} KB of wav")
+    for workload in workloads(None):
+        for label, post in transports.items():
+            app.state.connections.clear()
+            timings = time_calls(workloads(post)[workload], args.calls)
+            report(label, workload, timings, len(app.state.connections))
+    for server in servers:
+        server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Compare the STT backends and the VAD auto-stop on the same clips.
+
+Every backend in stt_tts_api/stt_backends.py transcribes every clip. The script reports load time, the
+real-time factor (transcription time / clip length, below 1 is faster than speaking) and the word error
+rate against the reference text. The clips are then padded with the room noise a player leaves after
+talking, and the VAD reports when it would have stopped the recording, the time saved against waiting for
+the full MAX_SECONDS and whether the old fixed 3 s window would have cut the speech off.
+
+Clips are 16 kHz mono wavs, with the reference text in a .txt next to each. Without --wav the lines are
+synthesized by the running TTS server.
+
+Run from the src folder:
+    python -m benchmarks.stt_rtf
+    python -m benchmarks.stt_rtf --backends faster-whisper --wav clips/*.wav --runs 5
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+import wave
+
+import numpy as np
+
+from utils.tts_helper import TTSHandler
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'stt_tts_api'))
+from audio_buffer import AudioBuffer  # noqa: E402
+from stt_backends import BACKENDS, SpeechEndDetector, SAMPLE_RATE, MAX_SECONDS  # noqa: E402
+
+
+SENTENCES = [
+    "Yesterday I went to the market to buy some bread.",
+    "I am looking for the missing blacksmith.",
+    "Tell me what happened at the crossroads.",
+    "She has already eaten her breakfast.",
+]
+OLD_WINDOW = 3  # Seconds the game recorded before the VAD
+TRAILING_SILENCE = 3  # Seconds of noise after the speech in the VAD test
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as wav_file:
+        assert wav_file.getframerate() == SAMPLE_RATE and wav_file.getnchannels() == 1, f"{path} isn't 16 kHz mono"
+        frames = wav_file.readframes(wav_file.getnframes())
+    return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768
+
+
+def load_clips(paths):
+    clips = []
+    for path in paths:
+        reference = os.path.splitext(path)[0] + '.txt'
+        text = open(reference).read().strip() if os.path.exists(reference) else ''
+        clips.append((text, read_wav(path)))
+    return clips
+
+
+def synthesize_clips(url):
+    tts = TTSHandler(url, cache=False)
+    clips = []
+    for text in SENTENCES:
+        audio = np.frombuffer(b''.join(tts.stream_pcm(text, 'a')), dtype=np.int16).astype(np.float32) / 32768
+        # Linear resampling to Whisper's 16 kHz is plenty for a benchmark
+        positions = np.arange(0, len(audio), tts.sample_rate / SAMPLE_RATE)
+        clips.append((text, np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)))
+    return clips
+
+
+def words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def word_error_rate(reference, hypothesis):
+    """Word level edit distance over the reference length"""
+    reference, hypothesis = words(reference), words(hypothesis)
+    if not reference:
+        return 0.0
+    distances = list(range(len(hypothesis) + 1))
+    for i, word in enumerate(reference, 1):
+        previous, distances[0] = distances[0], i
+        for j, guess in enumerate(hypothesis, 1):
+            previous, distances[j] = distances[j], min(distances[j] + 1, distances[j - 1] + 1,
+                                                       previous + (word != guess))
+    return distances[-1] / len(reference)
+
+
+def bench_backend(name, clips, runs):
+    started = time.perf_counter()
+    try:
+        backend = BACKENDS[name]()
+    except ImportError as e:
+        print(f"{name:<16} not installed ({e})")
+        return
+    load = time.perf_counter() - started
+    backend.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))  # Lazy initialization isn't timed
+    latencies, rtfs, errors = [], [], []
+    for text, audio in clips:
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = backend.transcribe(audio)
+            latency = time.perf_counter() - started
+            latencies.append(latency * 1000)
+            rtfs.append(latency / (len(audio) / SAMPLE_RATE))
+        errors.append(word_error_rate(text, result))
+    print(f"{name:<16} load {load:5.1f}s  RTF p50 {statistics.median(rtfs):.3f}  "
+          f"latency p50 {np.percentile(latencies, 50):5.0f} p95 {np.percentile(latencies, 95):5.0f} ms  "
+          f"WER {statistics.mean(errors):.1%}")
+
+
+def bench_vad(clips, noise):
+    detector = SpeechEndDetector()
+    print(f"\nVAD ({'Silero' if detector.vad is not None else 'energy'}), at most {MAX_SECONDS:.0f}s")
+    rng = np.random.default_rng(0)
+    for text, audio in clips:
+        lead = rng.normal(0, noise, SAMPLE_RATE // 2).astype(np.float32)
+        tail = rng.normal(0, noise, TRAILING_SILENCE * SAMPLE_RATE).astype(np.float32)
+        recording = np.concatenate([lead, audio + rng.normal(0, noise, len(audio)).astype(np.float32), tail])
+        detector.reset()
+        buffer = AudioBuffer(len(recording))
+        stopped = len(recording)
+        for start in range(0, len(recording), 1024):  # The server's sounddevice block size
+            buffer.write(recording[start:start + 1024])
+            if detector.advance(buffer):
+                stopped = start + 1024
+                break
+        speech_end = (len(lead) + len(audio)) / SAMPLE_RATE
+        cut = ' cut off by the old window' if speech_end > OLD_WINDOW else ''
+        print(f"  speech ends {speech_end:4.1f}s  stopped {stopped / SAMPLE_RATE:4.1f}s ({detector.reason})  "
+              f"saved {MAX_SECONDS - stopped / SAMPLE_RATE:4.1f}s{cut}  {text[:40]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS), help="comma separated backends to compare")
+    parser.add_argument('--wav', nargs='*', help="16 kHz mono clips, references in .txt files next to them")
+    parser.add_argument('--tts-url', default='http://localhost:1920', help="TTS server for the default lines")
+    parser.add_argument('--runs', type=int, default=3, help="transcriptions per clip")
+    parser.add_argument('--noise', type=float, default=0.003, help="room noise amplitude in the VAD test")
+    args = parser.parse_args()
+
+    clips = load_clips(args.wav) if args.wav else synthesize_clips(args.tts_url)
+    print(f"{len(clips)} clips, {sum(len(audio) for _, audio in clips) / SAMPLE_RATE:.1f}s of speech")
+    for name in args.backends.split(','):
+        bench_backend(name, clips, args.runs)
+    bench_vad(clips, args.noise)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Load test the TTS server to size its worker count.
+
+For every worker count the script starts stt_tts_api/tts_launcher.py with the TTS cache off, waits until
+/ready, then keeps --concurrency clients streaming dialogue sentences for --duration seconds. It reports
+the real-time factor (synthesis time / audio length, below 1 is faster than playback), the audio seconds
+produced per wall second, and p50/p95 latency and time to first audio.
+
+Run from the src folder:
+    python -m benchmarks.tts_load --workers 1,2,4 --threads 2 --concurrency 4
+    python -m benchmarks.tts_load --url http://localhost:1920   # an already running server, as it is
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+from utils.tts_helper import TTSHandler
+
+
+SENTENCES = [
+    "Hello traveler, how can I help you today?",
+    "The old mill burned down three winters ago and nobody dared to rebuild it.",
+    "Bring me five wolf pelts and I will pay you well.",
+    "Yesterday I went to the market to buy some bread.",
+    "Run while you still can!",
+    "My husband never came back from the crossroads, they say a ring was found there.",
+    "A tiny kobold in glasses looks at you with great disappointment.",
+    "Sorrow drips like candle wax upon my charred and broken lute.",
+]
+LAUNCHER = os.path.join(os.path.dirname(__file__), '..', '..', 'stt_tts_api')
+
+
+def stream_line(tts, text, voice):
+    """(latency s, first audio s, audio s) of one streamed line"""
+    started = time.perf_counter()
+    first_audio = None
+    samples = 0
+    for pcm in tts.stream_pcm(text, voice):
+        if first_audio is None:
+            first_audio = time.perf_counter() - started
+        samples += len(pcm) // 2
+    return time.perf_counter() - started, first_audio, samples / tts.sample_rate
+
+
+def run_load(url, concurrency, duration):
+    results, errors = [], []
+    stop_at = time.perf_counter() + duration
+
+    def client(index):
+        tts = TTSHandler(url, cache=False)  # Measure the server, not the game's cache
+        i = index
+        while time.perf_counter() < stop_at:
+            try:
+                results.append(stream_line(tts, SENTENCES[i % len(SENTENCES)], 'abcd'[i % 4]))
+            except Exception as e:
+                errors.append(str(e))
+            i += concurrency
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors, time.perf_counter() - started
+
+
+def report(label, results, errors, wall):
+    if not results:
+        print(f"{label:<12} no finished lines, errors: {errors[:3]}")
+        return
+    latencies = [latency * 1000 for latency, _, _ in results]
+    first = [first * 1000 for _, first, _ in results if first is not None]
+    audio = sum(audio for _, _, audio in results)
+    rtf = statistics.median(latency / audio for latency, _, audio in results if audio)
+    print(f"{label:<12} {len(results):>5} lines  RTF p50 {rtf:.2f}  audio/s {audio / wall:5.2f}  "
+          f"latency p50 {np.percentile(latencies, 50):6.0f} p95 {np.percentile(latencies, 95):6.0f} ms  "
+          f"first audio p95 {np.percentile(first, 95):6.0f} ms  errors {len(errors)}")
+
+
+def wait_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/ready", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2', help="comma separated worker counts to compare")
+    parser.add_argument('--threads', type=int, default=2, help="torch threads per worker")
+    parser.add_argument('--reserve', type=int, default=0, help="CPUs the launcher leaves free")
+    parser.add_argument('--concurrency', type=int, default=4, help="clients streaming at once")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of load per worker count")
+    parser.add_argument('--port', type=int, default=1930)
+    parser.add_argument('--url', help="benchmark a running server instead of starting the launcher")
+    parser.add_argument('--startup', type=float, default=300, help="seconds to wait for the workers")
+    args = parser.parse_args()
+
+    if args.url:
+        report('running', *run_load(args.url.rstrip('/'), args.concurrency, args.duration))
+        return
+
+    url = f"http://127.0.0.1:{args.port}"
+    for workers in [int(count) for count in args.workers.split(',')]:
+        command = [sys.executable, 'tts_launcher.py', '--workers', str(workers), '--threads', str(args.threads),
+                   '--reserve', str(args.reserve), '--host', '127.0.0.1', '--port', str(args.port)]
+        server = subprocess.Popen(command, cwd=LAUNCHER, env=dict(os.environ, TTS_CACHE='0'),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_ready(url, args.startup):
+                print(f"{workers} workers didn't get ready in {args.startup:.0f}s")
+                continue
+            stream_line(TTSHandler(url, cache=False), SENTENCES[0], 'a')  # Every code path runs once before timing
+            report(f"{workers} x {args.threads} thr", *run_load(url, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
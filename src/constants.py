@@ -41,6 +41,65 @@ VOICE_MAP = {
 WHOLE_DIALOG = False
 STOP_SYMBOLS_SPEECH = '}' if WHOLE_DIALOG else '.!?'
 
+# LLM settings
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')  # Point to benchmarks.mock_ollama for offline runs
+LLM_MODEL = 'gemma2:2b'
+LLM_FAST_MODEL = os.environ.get('LLM_FAST_MODEL', 'qwen2.5:0.5b')  # Falls back to LLM_MODEL if not pulled
+# Call type -> model, generation options, how long Ollama keeps the model loaded after a call and the deadline
+# in seconds after which the call is abandoned for a local fallback.
+# Call types without a route (monster_dialogue, riddle_dialogue...) use the 'dialogue' route.
+LLM_ROUTES = {
+    'dialogue': {'model': LLM_MODEL, 'options': {'temperature': 0.8, 'num_ctx': 4096}, 'keep_alive': '30m',
+                 'deadline': 60},
+    'summary': {'model': LLM_MODEL, 'options': {'num_predict': 160, 'temperature': 0.3, 'num_ctx': 4096},
+                'keep_alive': '30m', 'deadline': 30},
+    'death_story': {'model': LLM_MODEL, 'options': {'num_predict': 320, 'temperature': 0.9, 'num_ctx': 2048},
+                    'keep_alive': '30m', 'deadline': 60},
+    'decision': {'model': LLM_FAST_MODEL, 'options': {'num_predict': 24, 'temperature': 0.3, 'num_ctx': 2048},
+                 'keep_alive': '60m', 'deadline': 2},
+    'shout': {'model': LLM_FAST_MODEL, 'options': {'num_predict': 16, 'temperature': 1.0, 'num_ctx': 1024},
+              'keep_alive': '60m', 'deadline': 5},
+    'intimidation': {'model': LLM_FAST_MODEL, 'options': {'num_predict': 24, 'temperature': 0.2, 'num_ctx': 1024},
+                     'keep_alive': '60m', 'deadline': 2},
+    'name': {'model': LLM_FAST_MODEL, 'options': {'num_predict': 128, 'temperature': 1.0, 'num_ctx': 1024},
+             'keep_alive': '60m', 'deadline': 20},
+}
+LLM_DEFAULT_DEADLINE = 60
+LLM_CLIENT_TIMEOUT = 120  # httpx timeout of a single read, deadlines are usually much shorter
+OLLAMA_NUM_PARALLEL = int(os.environ.get('OLLAMA_NUM_PARALLEL', 4))  # Same variable as the server's, keep them equal
+TTS_URL = os.environ.get('TTS_URL', 'http://localhost:1920')  # Or unix:///path/to.sock, see start_game.sh
+STT_URL = os.environ.get('STT_URL', 'http://localhost:1921')
+SERVICE_TIMEOUT = (2, 30)  # Seconds to connect and to read, for calls that don't pass their own
+SERVICE_POOL_SIZE = 4  # Kept-alive connections per service, the TTS workers plus a shout and a spare
+TTS_NUM_PARALLEL = 2  # Sentences synthesized at once, the TTS server runs a single model
+TTS_STREAM_TIMEOUT = (5, 60)  # Seconds to connect and to wait for the next audio segment
+TTS_CACHE_DIR = os.path.join('data', 'tts_cache')
+TTS_CACHE_MAX_MB = 200  # Compressed PCM, about 40 minutes of speech
+TTS_MODEL_VERSION = 'kokoro-82m-v1.0'  # Cache key of lines voiced before the TTS server reports its model_version
+SHOUT_CACHE_SIZE = 30  # Generated shouts kept to repeat when the model is too slow
+SHOUT_FALLBACKS = ["Fuck you there! And here!", "I'll gnaw your bones!", "Run while you still can!",
+                   "Your gold will be mine!", "Come closer, meat!"]
+INTIMIDATION_WORDS = ['kill', 'die', 'death', 'dead', 'blood', 'bleed', 'gut', 'skull', 'bones', 'burn', 'rip',
+                      'tear', 'crush', 'slaughter', 'destroy', 'hell', 'scream', 'flesh', 'grave', 'fuck']
+CONTENT_CACHE_PATH = os.path.join('data', 'content_cache.json')  # Generated names and stories reused across games
+CONTENT_CACHE_MAX_NAMES = 200  # Per monster type
+CONTENT_CACHE_MAX_STORIES = 20
+PREGEN_WORKERS = 4
+DEATH_STORY_FALLBACK = {"victim_name": "Unknown Soul",
+                        "location": "the old crossroads",
+                        "cause": "mysterious circumstances",
+                        "key_details": ["alone", "cold", "betrayed", "crossroad", "beloved"],
+                        "perpetrator": "your beloved Geoffrey",
+                        "text": "You were betrayed at the crossroad by your beloved one who left you to die cold and "
+                                "alone"}
+WARMUP_WORKERS = 6
+WARMUP_SERVICE_TIMEOUT = 120  # Seconds to keep retrying TTS and STT servers that are still starting
+LLM_TELEMETRY_LOG = os.path.join('data', 'llm_telemetry.jsonl')
+LLM_TELEMETRY_MAX_BYTES = 5 * 1024 * 1024  # Rotate the log after 5 MB
+LLM_TELEMETRY_BACKUPS = 3
+LLM_TELEMETRY_WINDOW = 200  # Recent calls per call type kept for p50/p95
+PROMPT_RENDER_BUDGET_MS = 5  # Dialogue prompt renders slower than this are logged
+
 
 ASSET_DIR = "assets/images"
 SPRITES = {
@@ -192,7 +251,10 @@ HEALTH_BAR_HEIGHT = 20
 HEALTH_BAR_WIDTH = 200
 
 # Entity settings
-VOICE_DURATION = 3
+VOICE_DURATION = 8  # Upper bound, the STT server stops the recording after the player stops talking
+STT_POLL_INTERVAL = 0.15
+STT_POLL_TIMEOUT = 0.2
+STT_PARTIAL_TIMEOUT = (1, 5)  # Connect, and read between events, the server comments every 2s
 PLAYER_START_HP = 100
 PLAYER_START_ARMOR = 10
 PLAYER_BASE_DAMAGE = 25
@@ -220,6 +282,7 @@ DODGE_CHANCE = 0.05
 NPC_BASE_HP = 50
 NPC_BASE_ARMOR = 5
 MEMORY_LIMIT = 30
+TRANSCRIPT_TURN_CHARS = 300  # Longest utterance kept per line in prompt transcripts
 NPC_MOOD = ['playful', 'drunk', 'happy', 'silly', 'friendly', 'neutral', 'greedy', 'vicious', 'unfriendly']
 
 # Monster settings
@@ -241,6 +304,13 @@ SHOUT_COOLDOWN = 3
 MONSTER_DIALOG_CHANCE = {'goblin': 0.001}
 DIALOGUE_COOLDOWN = 3
 DIALOGUE_DISTANCE = 3
+PREWARM_OPTIONS = 2  # Predefined dialogue options whose RAG query runs before the player is in the dialogue
+PREWARM_GREETING_TTS = True
+RESPONSE_CACHE_MAX_REUSES = 2  # Times a cached reply to a predefined option is replayed before a fresh one
+RESPONSE_CACHE_REPUTATION_BUCKET = 10
+CLUE_SEMANTIC_THRESHOLD = 0.62  # Cosine similarity between a clue and a player phrase, see benchmarks.clue_matcher
+RHYME_THRESHOLD = 0.8  # 1 perfect rhyme, 0.8 codas differing in voicing (bed/bet), 0.6 same stressed vowel only
+CLUE_FUZZY_THRESHOLD = 0.82  # difflib ratio between a clue and player words, "alone" and "along" score 0.8
 SPAWN_DISTANCE = 5
 MONSTER_NAMES = {"orkoids": ['Skritch', 'Boggath', 'Snargle', 'Gribble', 'Shroomshriek', 'Grimfang', 'Muckbreath',
                              'Scuttle', 'Flitter', 'Twitchwarp', 'Grimnir', 'Blorf', 'Jukku', 'Skargath', 'Tarkon',
@@ -69,7 +69,7 @@ class Entity(ABC):
         for key, value in self.__dict__.items():
             # Skip certain attributes we don't want to save
             if key in {'rag_manager', 'sprite_loader', 'game_state', 'surface', 'outline', 'pil_sprite',
-                       'pil_outline', 'face_surface'}:
+                       'pil_outline', 'face_surface', 'clue_matcher'}:
                 continue
             if key == 'combat_stats':
                 save_dict['combat_stats'] = self.combat_stats.save_stats()
@@ -3,6 +3,7 @@ import pygame as pg
 from .entity import Entity, Remains, Tree
 from constants import *
 from systems.combat_stats import CombatStats
+from utils.clue_matcher import ClueMatcher
 import random
 
 
@@ -28,6 +29,10 @@ class Monster(Entity):
         self.face_surface = pg.transform.scale(self.face_surface, (256, 256))
 
         self.interaction_history = []
+        self.history_turns = 0  # Total turns ever added, history itself is capped by MEMORY_LIMIT
+        self.summarized_turns = 0
+        self.stored_summary_turns = 0  # summarized_turns when the summary last went to the knowledge base
+        self.conversation_summary = ""
         self.money = money
         self.entity_id = f"{monster_type}_{self.name}_{id(self)}"
         if not loading:
@@ -113,6 +118,7 @@ class Monster(Entity):
         self.game_state.add_message(f"{self.monster_type} dies", WHITE)
         if hasattr(self, 'rag_manager'):
             self.rag_manager.remove_entity_knowledge(self.entity_id)
+        self.game_state.current_map.forget_replies(self)
 
     def add_self_to_stats(self):
         if self.monster_type in self.game_state.stats['monsters_killed']:
@@ -217,6 +223,7 @@ class Monster(Entity):
             f"monster": npc_response
         }
         self.interaction_history.append(interaction)
+        self.history_turns += 1
         if len(self.interaction_history) > MEMORY_LIMIT:
             self.interaction_history.pop(0)
         if hasattr(self, 'rag_manager'):
@@ -318,7 +325,6 @@ class Monster(Entity):
         Detect other monsters within specified tile radius
         Returns list of (monster, distance) tuples
         """
-        print('detecting')
         nearby_monsters = []
         monster_tile_x = int(self.x // DISPLAY_TILE_SIZE)
         monster_tile_y = int(self.y // DISPLAY_TILE_SIZE)
@@ -344,7 +350,6 @@ class Monster(Entity):
                             nearby_monsters.append((entity, distance))
         result = [(x[0], x[0].get_dialogue_context()) for x in sorted(
             nearby_monsters, key=lambda x: x[1])] if nearby_monsters else ('', 'None')
-        print(result)
         return result
 
     def find_nearest_edge_tree(self, current_map):
@@ -658,6 +663,7 @@ class KoboldTeacher(Monster):
                          dmg=dmg, max_damage=max_damage, armor=armor, hp=hp, face_path=face_path)
         self.dialog_cooldown = 1  # Override default cooldown
         self.has_passed_test = False
+        self.grammar_verdict = None  # Local grading of the last answer, None when the LLM judged it
         self.dialogue_chance = 0.3  # More likely to initiate dialogue
 
     def get_dialogue_context(self):
@@ -690,6 +696,7 @@ class HellBard(KoboldTeacher):
                          dmg=dmg, max_damage=max_damage, armor=armor, hp=hp, face_path=face_path)
         self.dialogue_chance = 0.4  # Very chatty
         self.current_verse = None
+        self.rhymed = None  # Local verdict on the player's last line, None when there was no verse to complete
         self.name = name
 
     def get_dialogue_context(self):
@@ -729,22 +736,36 @@ class WillowWhisper(Monster):
         self.dialog_cooldown = 1
         self.dialogue_chance = 0.3
         self.has_found_truth = False
-        self.death_story = {'victim_name': 'placeholder'}
-        if not loading:
-            self.death_story = self.game_state.game.dialog_ui.dialogue_processor.generate_death_story()
-        self.name = f"Spirit of {self.death_story['victim_name']}"
         self.discovered_clues = set()  # Track what the player has learned
         self.truth_requirements = 3
+        self.set_death_story(dict(DEATH_STORY_FALLBACK))
+        if not loading:
+            self.game_state.game.dialog_ui.dialogue_processor.pregen.request_death_story(self)
+
+    def set_death_story(self, story):
+        """Replace the story, called again once the generated one is ready"""
+        if self.discovered_clues:  # Player has already started uncovering the current one
+            return
+        self.death_story = story
+        self.name = f"Spirit of {story['victim_name']}"
+        self.build_clue_matcher()
+
+    def build_clue_matcher(self):
+        # Clue embeddings are computed here once per story, with the RAG encoder if the entity has one
+        rag_manager = getattr(self, 'rag_manager', None)
+        self.clue_matcher = ClueMatcher(self.death_story['key_details'], getattr(rag_manager, 'encoder', None))
+
+    def postload_entity(self, game_state):
+        """The matcher built in __init__ has the fallback story's clues, match the saved story instead"""
+        super().postload_entity(game_state)
+        self.build_clue_matcher()
 
     def check_truth_discovery(self, player_input: str) -> bool:
         """Check if player's question/statement reveals new truth"""
         story = self.death_story
-        new_discoveries = set()
 
-        # Check each key detail against player input
-        for detail in story['key_details']:
-            if detail.lower() in player_input.lower() and detail not in self.discovered_clues:
-                new_discoveries.add(detail)
+        # Check each key detail against player input, paraphrases count too
+        new_discoveries = self.clue_matcher.match(player_input) - self.discovered_clues
 
         self.discovered_clues.update(new_discoveries)
         print('discovered clues: ', self.discovered_clues, 'story:', story['key_details'])
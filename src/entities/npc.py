@@ -32,6 +32,10 @@ class NPC(Entity):
         self.reputation = 50  # Start with neutral reputation
         self.active_quests = []
         self.interaction_history = []
+        self.history_turns = 0  # Total turns ever added, history itself is capped by MEMORY_LIMIT
+        self.summarized_turns = 0
+        self.stored_summary_turns = 0  # summarized_turns when the summary last went to the knowledge base
+        self.conversation_summary = ""
 
         self.face_path = SPRITES[face_path] or SPRITES["NPC_FACE_1"]
         self.face_surface = pygame.image.load(self.face_path).convert_alpha()
@@ -90,6 +94,7 @@ class NPC(Entity):
             f"npc": npc_response
         }
         self.interaction_history.append(interaction)
+        self.history_turns += 1
         if len(self.interaction_history) > MEMORY_LIMIT:
             self.interaction_history.pop(0)
         print(f'line added {interaction}.\nmood: {self.mood}')
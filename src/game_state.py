@@ -29,6 +29,7 @@ class GameStateManager:
         self.combat_system = None
         self.current_npc = None
         self.current_day = 1
+        self.turn_count = 0  # Monster turns this session, per-turn caches are keyed by it
         self.stats = {'quests_completed': 0, 'monsters_killed': {}, 'gold_collected': 0}
         self.quest_manager = QuestManager()
         self.floating_text_manager = FloatingTextManager()
@@ -68,6 +69,7 @@ class GameStateManager:
         self.current_map = None
         # Create player
         self.player = Character(0, 0, SPRITES["PLAYER"], game_state=self, voice='c')
+        self.game.dialog_ui.dialogue_processor.pregen.new_game()  # Names and stories generate while the map builds
         self.increment_loading_progress(10)
         # Create monsters
         monsters = []
@@ -272,6 +274,11 @@ class GameStateManager:
         return monster
 
     def create_goblin(self, spawn_pos):
+        goblin = self.create_goblin_body(spawn_pos)
+        self.game.dialog_ui.dialogue_processor.pregen.request_name(goblin)
+        return goblin
+
+    def create_goblin_body(self, spawn_pos):
         if random.random() > 0.7:
             voice = random.choice([x[0] for x in VOICE_MAP.values() if x[1] == 'f'])
             sprite = random.choice(['GOBLIN_GIRL_1', 'GOBLIN_GIRL_2'])
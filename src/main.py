@@ -7,6 +7,8 @@ from game_state import GameStateManager
 from systems.sound_manager import SoundManager
 from systems.save_system import SaveSystem
 from utils.async_requests_handler import AsyncRequestHandler
+from utils.dialogue_processor import DialogueProcessor
+from utils.warmup import WarmupOrchestrator
 from constants import *
 from entities.entity import House
 from entities.monster import Monster
@@ -14,10 +16,13 @@ from entities.npc import NPC
 from ui.dialog_ui import DialogUI
 from ui.mouse_ui import MouseUI
 from ui.inventory_ui import InventoryUI
+from ui.debug_overlay import DebugOverlay
 
 
 class Game:
     def __init__(self):
+        self.warmup = WarmupOrchestrator()
+        rag_manager = self.warmup.load_knowledge()  # Slowest part of startup, loads while pygame sets up
         pg.init()
         # self.screen = pg.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), pg.FULLSCREEN)
         self.screen = pg.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
@@ -27,9 +32,17 @@ class Game:
         self.last_action_time = 0
         self.sound_manager = SoundManager(SOUND_DIR)
         self.state_manager = GameStateManager(self.sound_manager, self)
-        self.dialog_ui = DialogUI(self.state_manager, self.sound_manager)
+        dialogue_processor = DialogueProcessor(rag_manager=rag_manager, warmup=False)
+        self.warmup.warm_models(dialogue_processor.router)
+        self.warmup.load_language(dialogue_processor.grammar)
+        self.warmup.load_rhymes(dialogue_processor.rhymes)
+        self.dialog_ui = DialogUI(self.state_manager, self.sound_manager, dialogue_processor)
+        self.warmup.ping_tts(self.dialog_ui.tts)
+        self.warmup.ping_stt(self.state_manager.stt.client)
         self.async_handler = AsyncRequestHandler()
         self.mouse_ui = MouseUI(self)
+        self.debug_overlay = DebugOverlay(self.dialog_ui.dialogue_processor.telemetry,
+                                          self.dialog_ui.dialogue_processor.prompts)
         self.inventory_ui = None
         self.monsters_queue = None
         self.camera_x = None
@@ -72,7 +85,12 @@ class Game:
                     running = False
                 elif event.type == pg.USEREVENT + 1:  # Music track ended
                     self.sound_manager.play_next_track()
+                elif event.type == pg.KEYDOWN and event.key == pg.K_F3:  # LLM latency overlay
+                    self.debug_overlay.toggle()
+                    continue
                 self.handle_input(event)
+            self.dialog_ui.dialogue_processor.pregen.poll()
+            self.dialog_ui.play_shouts()  # Shouts are voiced out of dialogue too
             if self.state_manager.current_state == GameState.DIALOG and self.dialog_ui.should_exit:
                 self.exit_dialogue()
             # Updates
@@ -82,6 +100,7 @@ class Game:
                     self.state_manager.floating_text_manager.update()
                     self.state_manager.current_map.update(self.camera_x, self.camera_y)
                     self.check_async_requests()
+                    self.dialog_ui.prewarm(self.state_manager.player, self.state_manager.current_map.get_all_entities())
                     self.update_camera()
                     self.state_manager.achievement_manager.check_achievements(self.state_manager.stats)
                     if hasattr(self, 'monsters_queue') and self.monsters_queue:
@@ -107,6 +126,7 @@ class Game:
                 #self.state_manager.current_map.draw(self.screen, self.camera_x, self.camera_y)
                 self.inventory_ui.draw(self.screen)
             elif self.state_manager.current_state == GameState.DIALOG:
+                self.async_handler.process_requests(self.dialog_ui.dialogue_processor)  # Summaries during dialogue
                 self.dialog_ui.update()
                 self.dialog_ui.draw(self.screen, self.state_manager.current_npc)
             elif self.state_manager.current_state == GameState.PROCESSING:
@@ -116,6 +136,7 @@ class Game:
             elif self.state_manager.current_state == GameState.DEMO_COMPLETE:
                 self.draw_demo_complete_screen()
 
+            self.debug_overlay.draw(self.screen)
             pg.display.flip()
             self.sound_manager.update()
             self.clock.tick(FPS)
@@ -126,6 +147,7 @@ class Game:
         pg.quit()
 
     def handle_monster_turns(self):
+        self.state_manager.turn_count += 1
         # Get all monsters from the current map
         self.monsters_queue = [entity for entity in self.state_manager.current_map.entities
                                if isinstance(entity, Monster) and entity.is_alive]
@@ -345,6 +367,15 @@ class Game:
             text_surface = menu_font.render(option, True, color)
             text_rect = text_surface.get_rect(centerx=WINDOW_WIDTH // 2, y=MENU_START_Y + i * MENU_SPACING)
             self.screen.blit(text_surface, text_rect)
+        self.draw_warmup_status()
+
+    def draw_warmup_status(self):
+        """List models and services and whether they are warmed up in the top left corner"""
+        font = pg.font.Font(None, int(WINDOW_HEIGHT * 0.025))
+        line_height = int(font.get_linesize() * 1.1)
+        colors = {'ready': GREEN, 'failed': RED}
+        for i, (line, state) in enumerate(self.warmup.status()):
+            self.screen.blit(font.render(line, True, colors.get(state, WHITE)), (10, 10 + i * line_height))
 
     def draw_player_ui(self):
         # Calculate UI dimensions based on screen size
@@ -474,6 +505,8 @@ class Game:
         text = font.render(f"Loading... {int(self.state_manager.loading_progress)}%", True, WHITE)
         text_rect = text.get_rect(center=(WINDOW_WIDTH // 2, y - int(bar_height * 1.5)))
         self.screen.blit(text, text_rect)
+        if not self.warmup.ready:
+            self.draw_warmup_status()
 
         pg.display.flip()
 
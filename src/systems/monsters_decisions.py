@@ -1,6 +1,7 @@
-import json
 from typing import Dict, Optional
 
+from utils.llm_telemetry import LLMDeadlineExceeded
+
 
 class MonsterDecisionMaker:
     def __init__(self, dialogue_processor):
@@ -82,7 +83,8 @@ class MonsterDecisionMaker:
         return prompts.get(monster_type, "")
 
     def get_decision(self, monster_context: Dict) -> str:
-        """Get LLM-based decision for monster action"""
+        """Get LLM-based decision for monster action.
+        Raises LLMDeadlineExceeded if the model is too slow, the caller falls back to the rule-based decision"""
         fallback = 'approach' if monster_context.get('distance', 2) <= 1 else 'approach'
         base_prompt = self.get_base_prompt(monster_context)
         specific_prompt = self.get_monster_specific_prompt(monster_context['monster type'])
@@ -90,20 +92,12 @@ class MonsterDecisionMaker:
         full_prompt = f"{base_prompt}\n\n{specific_prompt}"
 
         try:
-            response = self.dialogue_processor.client.chat(
-                model=self.dialogue_processor.model,
-                messages=[{'role': 'system', 'content': full_prompt}]
-            )
-
-            content = response['message']['content']
-            start_idx = content.find('{')
-            end_idx = content.rfind('}')
-            if start_idx != -1 and end_idx != -1:
-                content = content[start_idx:end_idx + 1]
-            self.dialogue_processor.logger.info(f'MONSTER DECISION: {content}')
-            decision_data = json.loads(content)
+            decision_data = self.dialogue_processor.complete_json('decision', full_prompt)
+            self.dialogue_processor.logger.info(f'MONSTER DECISION: {decision_data}')
             return decision_data.get('decision', fallback)
 
+        except LLMDeadlineExceeded:
+            raise
         except Exception as e:
             print(f"Error getting monster decision: {e}")
             return fallback
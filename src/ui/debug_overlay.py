@@ -0,0 +1,61 @@
+import pygame as pg
+from constants import *
+
+
+class DebugOverlay:
+    """F3 table of recent LLM call latencies per call type and prompt render times"""
+    COLUMNS = [('call', 'call', 16), ('n', 'count', 5), ('wall50', 'wall_p50', 8), ('wall95', 'wall_p95', 8),
+               ('ttft50', 'ttft_p50', 8), ('ttft95', 'ttft_p95', 8), ('prompt', 'prompt_tokens', 8),
+               ('tok/s', 'tokens_per_sec', 7), ('fails', 'parse_failures', 6), ('late', 'deadline_misses', 5)]
+
+    def __init__(self, telemetry, prompts=None):
+        self.telemetry = telemetry
+        self.prompts = prompts
+        self.visible = False
+        self.font = pg.font.SysFont('monospace', max(12, int(WINDOW_HEIGHT * 0.018)))
+        self.line_height = int(self.font.get_linesize() * 1.1)
+        self.refresh_ms = 500
+        self.last_refresh = 0
+        self.lines = []
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.last_refresh = 0
+
+    def build_lines(self):
+        lines = [''.join(title.rjust(width) if i else title.ljust(width)
+                         for i, (title, _, width) in enumerate(self.COLUMNS))]
+        for call_type, stats in self.telemetry.summary().items():
+            stats = dict(stats, call=call_type[:15])
+            cells = []
+            for i, (_, key, width) in enumerate(self.COLUMNS):
+                value = stats[key]
+                value = f"{value:.0f}" if isinstance(value, float) else str(value)
+                cells.append(value.rjust(width) if i else value.ljust(width))
+            lines.append(''.join(cells))
+        if len(lines) == 1:
+            lines.append("No LLM calls yet")
+        if self.prompts:
+            lines.append('')
+            lines.append('prompt'.ljust(16) + ''.join(title.rjust(8) for title in ('n', 'ms50', 'ms95', 'slow')))
+            for name, stats in self.prompts.summary().items():
+                lines.append(name[:15].ljust(16) + str(stats['count']).rjust(8) + f"{stats['p50']:.2f}".rjust(8) +
+                             f"{stats['p95']:.2f}".rjust(8) + str(stats['over_budget']).rjust(8))
+        return lines
+
+    def draw(self, screen):
+        if not self.visible:
+            return
+        now = pg.time.get_ticks()
+        if now - self.last_refresh > self.refresh_ms:  # Percentiles are not worth sorting every frame
+            self.lines = self.build_lines()
+            self.last_refresh = now
+
+        surfaces = [self.font.render(line, True, WHITE) for line in self.lines]
+        width = max(surface.get_width() for surface in surfaces) + 20
+        height = len(surfaces) * self.line_height + 20
+        background = pg.Surface((width, height), pg.SRCALPHA)
+        background.fill((0, 0, 0, 200))
+        screen.blit(background, (10, 10))
+        for i, surface in enumerate(surfaces):
+            screen.blit(surface, (20, 20 + i * self.line_height))
@@ -2,15 +2,19 @@ import random
 import pygame as pg
 from constants import *
 from utils.dialogue_processor import DialogueProcessor
+from utils.llm_telemetry import LLMDeadlineExceeded
 from utils.tts_helper import TTSHandler
-from entities.monster import Monster, KoboldTeacher, WillowWhisper
+from utils.dialogue_prewarm import DialoguePrewarmer
+from utils.response_cache import ResponseCache
+from utils.tts_pipeline import TTSPipeline
+from entities.monster import Monster, KoboldTeacher, WillowWhisper, HellBard
 from entities.entity import House
 from entities.npc import NPC
 import json
 
 
 class DialogUI:
-    def __init__(self, game_state_manager, sound_manager):
+    def __init__(self, game_state_manager, sound_manager, dialogue_processor=None):
         self.font = pg.font.Font(None, 32)
         self.input_text = ""
         self.last_input_text = ""
@@ -19,14 +23,19 @@ class DialogUI:
         self.selected_option = 0
         self.should_exit = False
         self.current_npc = None
-        self.dialogue_processor = DialogueProcessor()
+        self.dialogue_processor = dialogue_processor or DialogueProcessor()
         self.tts = TTSHandler()
-        self.current_audio_buffer = None
+        self.tts_pipeline = TTSPipeline(self.tts)  # Dialogue sentences, played in order
+        self.shout_voices = TTSPipeline(self.tts, workers=1)  # Shouts and the player's lines, played when ready
+        self.prewarmer = DialoguePrewarmer(self.dialogue_processor, self.tts)
+        self.response_cache = ResponseCache()
+        self.cache_key = None  # State key of the predefined option being answered
+        self.response_audio = []  # Audio of the current reply, shared with its cache entry
         self.sound_engine = sound_manager
         self.current_response = "Hello traveler! How can I help you today?"
         self.current_partial_sentence = ""
         self.sentence_queue = []
-        self.audio_buffer_queue = []
+        self.narration_sounds = []  # Synthesized sentences waiting for the narration channel
         self.sentence_end_markers = {'.', '!', '?'}
 
         self.streaming_response = ""
@@ -42,13 +51,29 @@ class DialogUI:
 
     @property
     def predefined_options(self):
-        if isinstance(self.current_npc, Monster):
+        return self.options_for(self.current_npc)
+
+    @staticmethod
+    def options_for(npc):
+        if isinstance(npc, Monster):
             return ['Wut you want?', 'Bye']
-        elif isinstance(self.current_npc, House):
+        elif isinstance(npc, House):
             return ['Rent a bed', 'Leave']
         else:
             return ["Got any quests?", "How are you?", "Bye"]
 
+    @staticmethod
+    def greeting_for(npc):
+        if isinstance(npc, Monster):
+            return 'Hey you!'
+        elif isinstance(npc, NPC):
+            return 'Hello traveler!'
+        return None
+
+    def prewarm(self, player, entities):
+        """Prepare the conversation with whoever the player is walking up to"""
+        self.prewarmer.update(player, entities, self.options_for, self.greeting_for)
+
     def start_dialog(self, npc):
         """Call this when starting dialog with an NPC"""
         if self.current_npc == npc and self.is_streaming:
@@ -59,11 +84,15 @@ class DialogUI:
         self.streaming_response = ""
         self.is_streaming = False
         self.stream = None
-        if isinstance(npc, Monster):
-            self.current_response = 'Hey you!'
-        elif isinstance(npc, NPC):
-            self.current_response = 'Hello traveler!'
+        self.current_response = self.greeting_for(npc) or self.current_response
         self.selected_option = 0  # Reset selection
+        self.cache_key = None
+        self.response_audio = []
+        self.prewarmer.release(npc)
+        greeting_audio = self.prewarmer.take_greeting(npc, self.current_response)
+        if greeting_audio:
+            self.tts_pipeline.add(greeting_audio)
+            return
         self.current_partial_sentence = self.current_response
         self.sentence_queue.append(self.current_response)
         self.process_sentence_queue()
@@ -72,11 +101,11 @@ class DialogUI:
 
     def stop_dialogue(self):
         self.should_exit = True
-        self.current_audio_buffer = None
         self.sound_engine.stop_narration()
         self.sentence_queue.clear()
         self.current_partial_sentence = ""
-        self.audio_buffer_queue = []
+        self.tts_pipeline.cancel()
+        self.narration_sounds = []
 
 
     def clear_dialogue_state(self):
@@ -85,18 +114,21 @@ class DialogUI:
         self.input_text = ""
         self.streaming_response = ""
         self.is_streaming = False
+        if self.stream is not None:  # Left mid-reply, stop generating it
+            self.stream.close()
         self.stream = None
 
         if self.game_state_manager:
-            summary = self.dialogue_processor.get_summary(self.current_npc)
-            if summary:
-                self.game_state_manager.add_message(f"Conversation summary: {summary}", WHITE)
-                self.current_npc.notify_nearby_entities(summary)
+            if self.current_npc is not None:
+                # Stored once the summary updates still queued for the last turns are done, see handle_async_response
+                self.game_state_manager.game.async_handler.add_request('dialogue_end', self.current_npc)
 
             if isinstance(self.current_npc, KoboldTeacher):
                 print('words hurt!')
                 self.current_npc.words_hurt(self.game_state_manager.player)
             self.game_state_manager.current_npc = None
+        if self.current_npc is not None:
+            self.prewarmer.forget(self.current_npc)
         self.current_npc = None
 
     @staticmethod
@@ -118,8 +150,8 @@ class DialogUI:
                     if self.input_text.lower() in ["bye", "goodbye", "see you", "leave"]:
                         self.stop_dialogue()
                     else:
-                        self.process_input(self.input_text, self.current_npc)
                         self.last_input_text = self.input_text
+                        self.process_input(self.input_text, self.current_npc)
                         self.input_text = ""
                 else:
                     selected_text = self.predefined_options[self.selected_option]
@@ -163,6 +195,8 @@ class DialogUI:
                 if text.lower() in ['sleep', 'rent a bed']:
                     self.game_state_manager.pass_night(npc.fee)
                     return
+            elif self.start_cached_response(text, npc):
+                return
             elif isinstance(npc, Monster):
                 self.stream = self.process_monster(text, npc)
             else:
@@ -174,6 +208,10 @@ class DialogUI:
                     game_state=self.game_state_manager,
                     interaction_history=npc.interaction_history
                 )
+            if isinstance(self.stream, dict):  # The prompt couldn't be built, show the fallback line
+                self.current_response = self.stream.get('text', '')
+                self.stream = None
+                return
 
             # Initialize streaming
             self.streaming_response = ""
@@ -184,6 +222,34 @@ class DialogUI:
             print(f"Error in process_input: {e}")
             self.current_response = "Sorry, I didn't quite understand that."
 
+    def start_cached_response(self, text, npc):
+        """Replay the cached reply to a predefined option, remembering the state key to cache a new one"""
+        self.cache_key = None
+        self.response_audio = []
+        if text not in self.predefined_options:
+            return False
+        if isinstance(npc, KoboldTeacher) and not npc.has_passed_test:  # Its reply depends on the local verdict
+            return False
+        key = self.response_cache.state_key(npc, text, self.game_state_manager,
+                                            self.dialogue_processor.knowledge_id(npc))
+        cached = self.response_cache.get(key)
+        if cached:
+            self.replay_response(cached)
+            return True
+        self.cache_key = key
+        return False
+
+    def replay_response(self, cached):
+        """Show and voice a cached reply as if it had just been generated"""
+        response = dict(cached.response)
+        self.streaming_response = ""
+        self.is_streaming = False
+        self.stream = None
+        self.current_response = self._replace_symbols(response.get('text', ''))
+        for audio_buffer in self.response_cache.audio_buffers(cached):
+            self.tts_pipeline.add(audio_buffer)
+        self.process_final_response_output(response)
+
     def process_monster_types_dialogue(self, text, npc):
         if npc.should_flee() and npc.monster_type not in ['dryad']:
             print(npc.monster_type)
@@ -208,8 +274,8 @@ class DialogUI:
             self.current_response = self.current_npc.description
         if self.is_streaming and self.stream:
             try:
-                # Process next chunk of the stream
-                chunk = next(self.dialogue_processor.handle_stream(self.stream))
+                # Everything the LLM thread has received since the last frame, never waits for the network
+                chunk = ''.join(self.stream.poll())
                 if chunk:  # Streaming chunk
                     self.streaming_response += chunk
 
@@ -221,8 +287,17 @@ class DialogUI:
                         partial_response = self.streaming_response[start_idx:]
                         self.current_response = self._replace_symbols(partial_response)
                         self.process_streaming_text(self._replace_symbols(chunk))
+            except LLMDeadlineExceeded as e:
+                # The stream is closed and counted as a miss, keep what was said so far
+                print(e)
+                if not (self.current_response or '').strip() and self.current_npc:
+                    self.current_response = f"{self.current_npc.name} falls silent, lost in thought..."
+                self.cache_key = None
+                self.is_streaming = False
+                self.stream = None
             except StopIteration:
                 # Stream is complete
+                parsed = None
                 try:
                     try:
                         self.process_sentence_queue()
@@ -237,12 +312,27 @@ class DialogUI:
                     if len(json_parts) > 1:
                         json_text = json_parts[1].split('```')[0]
                         final_response = json.loads(json_text)
+                        parsed = True
+                        if self.cache_key:
+                            self.response_cache.store(self.cache_key, final_response, self.response_audio)
                         self.process_final_response_output(final_response)
                 except json.JSONDecodeError as e:
+                    parsed = False
                     print(f"Error decoding JSON: {e}")
                 except Exception as e:
                     print(f"Error processing dialogue: {e}")
 
+                self.dialogue_processor.telemetry.finish(getattr(self.stream, 'call', None), parsed=parsed)
+                self.cache_key = None
+                self.is_streaming = False
+                self.stream = None
+            except Exception as e:
+                # Ollama went away or the client failed mid-reply, end the reply instead of the game loop
+                print(f"Dialogue stream failed: {e}")
+                self.dialogue_processor.telemetry.finish(getattr(self.stream, 'call', None), error=str(e))
+                if not (self.current_response or '').strip() and self.current_npc:
+                    self.current_response = f"{self.current_npc.name} stares at you and says nothing."
+                self.cache_key = None
                 self.is_streaming = False
                 self.stream = None
 
@@ -299,7 +389,13 @@ class DialogUI:
                             self.current_response += "\nI'm sorry, but I can't pay you right now."
 
             else:
-                if isinstance(self.current_npc, KoboldTeacher) or isinstance(self.current_npc, WillowWhisper):
+                if isinstance(self.current_npc, HellBard):
+                    if self.current_npc.rhymed is not None:
+                        self.current_npc.words_hurt(self.game_state_manager.player, self.current_npc.rhymed)
+                elif isinstance(self.current_npc, KoboldTeacher) and self.current_npc.grammar_verdict:
+                    self.current_npc.words_hurt(self.game_state_manager.player,
+                                                self.current_npc.grammar_verdict.correct)
+                elif isinstance(self.current_npc, KoboldTeacher) or isinstance(self.current_npc, WillowWhisper):
                     answer = final_response.get('correctly_answered', False)
                     self.current_npc.words_hurt(self.game_state_manager.player, answer)
                 if isinstance(self.current_npc, WillowWhisper):
@@ -332,8 +428,9 @@ class DialogUI:
                 if final_response.get('player_friendly'):
                     self.current_npc.set_hostility(False)
 
-            # Update interaction history
+            # Update interaction history and fold the new turn into the rolling summary off-thread
             self.current_npc.add_to_history(self.last_input_text, final_response.get('text', ''))
+            self.game_state_manager.game.async_handler.add_request('summary', self.current_npc)
 
     def draw(self, screen, npc):
 
@@ -643,42 +740,46 @@ class DialogUI:
                 self.play_audio(sentence, self.current_npc.voice)
 
     def process_sentence_queue(self, whole_dialogue=WHOLE_DIALOG):
-        """Process sentences and generate TTS regardless of playback status"""
+        """Hand closed sentences to the TTS workers, the audio comes back through play_queue_audio"""
         if (whole_dialogue and not self.current_partial_sentence) or (not whole_dialogue and not self.sentence_queue):
             return
         try:
-            # Generate TTS for next sentence if we have one
-            if self.sentence_queue:
+            while self.sentence_queue:
                 sentence = self.current_partial_sentence if whole_dialogue else self.sentence_queue.pop(0)
+                if whole_dialogue:
+                    self.sentence_queue.clear()
                 if sentence:
                     sentence = self._replace_symbols(sentence)
-                    audio_buffer = self.tts.generate_and_play_tts(sentence, self.current_npc.voice)
-                    if audio_buffer:
-                        print('sentence added to buffer', sentence)
-                        self.audio_buffer_queue.append(audio_buffer)
+                    print('sentence sent to TTS', sentence)
+                    self.tts_pipeline.submit(sentence, self.current_npc.voice, sink=self.response_audio)
         except Exception as e:
             print('process sentence_queue', e)
 
 
     def play_queue_audio(self):
+        self.narration_sounds.extend(self.tts_pipeline.ready())
         # Play next audio if nothing is currently playing
-        if not self.sound_engine.narration_channel.get_busy() and self.audio_buffer_queue:
-            next_buffer = self.audio_buffer_queue.pop(0)
-            sound = pg.mixer.Sound(next_buffer)
-            self.sound_engine.play_narration(sound)
-
+        if not self.sound_engine.narration_channel.get_busy() and self.narration_sounds:
+            self.sound_engine.play_narration(self.narration_sounds.pop(0))
 
-    def play_audio(self, text, voice='a'):
-        text = self._replace_symbols(text)
-        self.current_audio_buffer = self.tts.generate_and_play_tts(text, voice)
-        if self.current_audio_buffer:
 
-            sound = pg.mixer.Sound(self.current_audio_buffer)
+    def play_shouts(self):
+        """Play the lines voiced by play_audio as they get ready, called every frame whatever the game state"""
+        for sound in self.shout_voices.ready():
             self.sound_engine.play_narration(sound)
 
+    def play_audio(self, text, voice='a'):
+        """Voice a line outside of the reply's order, it plays as soon as a worker has its Sound ready"""
+        self.shout_voices.submit(self._replace_symbols(text), voice)
+
     def handle_async_response(self, response):
         """Handle completed async requests"""
         if hasattr(response, 'request_type'):
+            if response.request_type == 'dialogue_end':
+                npc, summary = response.entity, response.content
+                if self.dialogue_processor.store_summary(npc, summary):
+                    self.game_state_manager.add_message(f"Conversation summary: {summary}", WHITE)
+                    npc.notify_nearby_entities(summary)
             if response.request_type == 'shout':
                 monster = response.entity
                 shout = response.content
@@ -688,10 +789,7 @@ class DialogUI:
                         shout = " ".join(shout.split()[:min(10, len(shout.split()))])
                         print('SHOUT:', shout)
                         # Display floating text and play TTS
-                        audio_buffer = self.tts.generate_and_play_tts(shout, monster.voice)
-                        if audio_buffer:
-                            sound = pg.mixer.Sound(audio_buffer)
-                            self.sound_engine.play_narration(sound)
+                        self.shout_voices.submit(shout, monster.voice)
                         monster.get_floating_nums(shout, color=YELLOW)
                         self.game_state_manager.add_message(f"{monster.monster_type} {monster.name} shouts: {shout}", WHITE)
                     except Exception as e:
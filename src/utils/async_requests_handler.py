@@ -38,6 +38,12 @@ class AsyncRequestHandler:
                             with self.lock:
                                 request.content = shout
                                 self.completed_requests.append(request)
+                        elif request.request_type in ('summary', 'dialogue_end'):
+                            # Requests run in order, so a dialogue_end summary covers the last turn too
+                            summary = dialogue_processor.update_summary(request.entity)
+                            with self.lock:
+                                request.content = summary
+                                self.completed_requests.append(request)
                     except Exception as e:
                         print(f"Error processing async request: {e}")
                         self.completed_requests.append(request)
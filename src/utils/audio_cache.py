@@ -0,0 +1,168 @@
+"""Content addressed cache of synthesized lines, shared by the game and the TTS server.
+
+An entry is the zlib compressed 16-bit PCM of a whole line, its file name is the sha256 of the normalized
+text, voice, speed and model version, so a changed model never plays stale audio. The least recently used
+files are deleted once the folder grows past its size cap, a hit touches the file so recency survives
+restarts. Only the standard library is used, stt_tts_api imports it too.
+
+Pre-render lines the game is known to say, from the src folder with the TTS server running:
+    python -m utils.audio_cache warm                        # greetings and shout fallbacks in every voice
+    python -m utils.audio_cache warm lines.txt --voices ab  # one line per row, "voice|text" or just text
+    python -m utils.audio_cache stats
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+HEADER = struct.Struct('<4sI')  # Magic and sample rate, the PCM is always mono 16-bit
+MAGIC = b'PCMZ'
+QUOTES = str.maketrans({'‘': "'", '’': "'", '“': '"', '”': '"', '–': '-', '—': '-'})
+
+
+def normalize(text: str) -> str:
+    """Spellings that sound the same share an entry: unicode forms, curly quotes, runs of spaces"""
+    text = unicodedata.normalize('NFKC', str(text)).translate(QUOTES)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class AudioCache:
+    def __init__(self, folder: str, max_bytes: int, model_version: str, speed: float = 1.0):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.model_version = model_version
+        self.speed = speed
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+        # name -> size, least recently used first
+        files = [entry for entry in os.scandir(folder) if entry.name.endswith('.pcmz')]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        self.index = OrderedDict((entry.name, entry.stat().st_size) for entry in files)
+        self.size = sum(self.index.values())
+
+    def key(self, text: str, voice: str) -> str:
+        identity = json.dumps([normalize(text), voice, self.speed, self.model_version])
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest() + '.pcmz'
+
+    def get(self, text: str, voice: str) -> Optional[Tuple[bytes, int]]:
+        """(pcm, sample rate) of the line, None on a miss"""
+        name = self.key(text, voice)
+        path = os.path.join(self.folder, name)
+        with self.lock:
+            if name not in self.index:
+                self.misses += 1
+                return None
+            self.index.move_to_end(name)
+            self.hits += 1
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            magic, sample_rate = HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError('not a cached line')
+            os.utime(path)
+            return zlib.decompress(data[HEADER.size:]), sample_rate
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            self.logger.warning(f"Dropping unreadable cached line {name}: {e}")
+            self.remove(name)
+            return None
+
+    def put(self, text: str, voice: str, pcm: bytes, sample_rate: int):
+        if not pcm:
+            return
+        name = self.key(text, voice)
+        data = HEADER.pack(MAGIC, sample_rate) + zlib.compress(pcm, 6)
+        path = os.path.join(self.folder, name)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)  # Readers never see half a file, another process may write it too
+        except OSError as e:
+            self.logger.error(f"Couldn't cache line: {e}")
+            return
+        with self.lock:
+            self.size += len(data) - self.index.pop(name, 0)
+            self.index[name] = len(data)
+            evicted = []
+            while self.size > self.max_bytes and len(self.index) > 1:
+                old, old_size = self.index.popitem(last=False)
+                self.size -= old_size
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(os.path.join(self.folder, old))
+            except OSError:
+                pass
+
+    def remove(self, name: str):
+        with self.lock:
+            self.size -= self.index.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.folder, name))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.index), 'megabytes': round(self.size / 2 ** 20, 2), 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': round(self.hits / lookups, 3) if lookups else None}
+
+
+def known_lines():
+    """Lines every session says: greetings and the fallbacks used when the LLM is too slow"""
+    from constants import SHOUT_FALLBACKS
+    return ['Hey you!', 'Hello traveler!', 'Hello traveler! How can I help you today?',
+            'I will kill you!'] + SHOUT_FALLBACKS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['warm', 'stats'])
+    parser.add_argument('lines', nargs='?', help="text file with a line per row, 'voice|text' or text")
+    parser.add_argument('--voices', default='abcdefghijk', help="voices of rows without one")
+    args = parser.parse_args()
+
+    from utils.tts_helper import TTSHandler
+    tts = TTSHandler()
+    if args.command == 'stats':
+        print(tts.cache.stats())
+        return
+    tts.sync_model_version()  # Same keys as the game once it has pinged the server
+
+    if args.lines:
+        with open(args.lines, 'r', encoding='utf-8') as f:
+            rows = [row.strip() for row in f if row.strip()]
+    else:
+        rows = known_lines()
+    jobs = []
+    for row in rows:
+        voice, text = row.split('|', 1) if '|' in row else (None, row)
+        jobs += [(voice.strip(), text.strip())] if voice else [(v, text) for v in args.voices]
+
+    rendered = cached = failed = 0
+    for voice, text in jobs:
+        if tts.cache.get(text, voice):
+            cached += 1
+        elif tts.generate_and_play_tts(text, voice):
+            rendered += 1
+        else:
+            failed += 1
+    print(f"{len(jobs)} lines: {rendered} rendered, {cached} already cached, {failed} failed")
+    print(tts.cache.stats())
+
+
+if __name__ == '__main__':
+    main()
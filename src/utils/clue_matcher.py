@@ -0,0 +1,90 @@
+import re
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from constants import CLUE_SEMANTIC_THRESHOLD, CLUE_FUZZY_THRESHOLD
+
+
+STOP_WORDS = {'a', 'an', 'the', 'and', 'or', 'but', 'of', 'to', 'in', 'on', 'at', 'by', 'for', 'with', 'was', 'were',
+              'is', 'are', 'be', 'been', 'you', 'your', 'i', 'it', 'that', 'this', 'he', 'she', 'they', 'them', 'his',
+              'her', 'me', 'my', 'did', 'do', 'so', 'as', 'who', 'what', 'how', 'there', 'then'}
+
+
+SUFFIXES = ('ings', 'ing', 'edly', 'ed', 'als', 'al', 'ness', 'ly', 'es', 's')
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in re.findall(r"[a-z']+", text.lower()) if word not in STOP_WORDS]
+
+
+def stem(word: str) -> str:
+    """Strip a common suffix so betrayed and betrayal, crossroad and crossroads compare equal"""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def spelling_similarity(first: str, second: str) -> float:
+    """difflib ratio of the stems, 0 unless they start alike since short words differing early
+    (cold, could) score high otherwise"""
+    first, second = stem(first), stem(second)
+    if first[:3] != second[:3]:
+        return 0.0
+    return SequenceMatcher(None, first, second).ratio()
+
+
+class ClueMatcher:
+    """Decides which key details of a death story a player line reveals, without an LLM call.
+
+    A clue counts as revealed if words of the line are spelled almost like it (betrayed/betrayal,
+    cross roads/crossroad) or if a phrase of the line means nearly the same according to the RAG sentence
+    encoder. Whole words are compared, so "bring" doesn't reveal "ring". Clue embeddings are computed once,
+    when the story is set.
+    """
+    def __init__(self, clues: List[str], encoder=None, semantic_threshold=CLUE_SEMANTIC_THRESHOLD,
+                 fuzzy_threshold=CLUE_FUZZY_THRESHOLD):
+        self.clues = [clue for clue in clues if clue.strip()]
+        self.clue_tokens = [tokenize(clue) or [clue.lower()] for clue in self.clues]
+        self.encoder = encoder
+        self.semantic_threshold = semantic_threshold
+        self.fuzzy_threshold = fuzzy_threshold
+        self.vectors = self.embed(self.clues) if encoder is not None and self.clues else None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.encoder.encode(texts), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-8)
+
+    @staticmethod
+    def phrases(tokens: List[str], size: int) -> List[str]:
+        """Every run of `size` consecutive tokens"""
+        return [' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+    def fuzzy_score(self, clue_tokens: List[str], tokens: List[str]) -> float:
+        """Best spelling similarity of the clue to a run of words of the same length, or to two words
+        written together for a one word clue"""
+        clue = ' '.join(clue_tokens)
+        candidates = self.phrases(tokens, len(clue_tokens))
+        if len(clue_tokens) == 1:
+            candidates += [phrase.replace(' ', '') for phrase in self.phrases(tokens, 2)]
+        return max((spelling_similarity(clue, candidate) for candidate in candidates), default=0.0)
+
+    def semantic_scores(self, tokens: List[str]) -> Optional[np.ndarray]:
+        """Best cosine similarity of each clue to the words, word pairs and whole line, one encoder batch"""
+        if self.vectors is None or not tokens:
+            return None
+        candidates = list(dict.fromkeys(tokens + self.phrases(tokens, 2) + [' '.join(tokens)]))
+        return (self.embed(candidates) @ self.vectors.T).max(axis=0)
+
+    def scores(self, text: str) -> Dict[str, Tuple[float, float]]:
+        """clue -> (semantic, fuzzy) score, semantic is 0 without an encoder"""
+        tokens = tokenize(text)
+        semantic = self.semantic_scores(tokens)
+        return {clue: (float(semantic[i]) if semantic is not None else 0.0, self.fuzzy_score(clue_tokens, tokens))
+                for i, (clue, clue_tokens) in enumerate(zip(self.clues, self.clue_tokens))}
+
+    def match(self, text: str) -> Set[str]:
+        return {clue for clue, (semantic, fuzzy) in self.scores(text).items()
+                if fuzzy >= self.fuzzy_threshold or semantic >= self.semantic_threshold}
@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from constants import (CONTENT_CACHE_PATH, CONTENT_CACHE_MAX_STORIES, CONTENT_CACHE_MAX_NAMES, PREGEN_WORKERS,
+                       DEATH_STORY_FALLBACK)
+
+
+class ContentCache:
+    """Names and death stories generated in previous games, kept on disk"""
+    def __init__(self, path=CONTENT_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'names': {}, 'death_stories': []}
+        self.logger = logging.getLogger(__name__)
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.data['names'] = data.get('names', {})
+            self.data['death_stories'] = data.get('death_stories', [])
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.error(f"Couldn't load content cache {self.path}: {e}")
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.data, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.error(f"Couldn't save content cache {self.path}: {e}")
+
+    def names(self, monster_type: str) -> List[str]:
+        with self.lock:
+            return list(self.data['names'].get(monster_type, []))
+
+    def add_names(self, monster_type: str, names: List[str]):
+        with self.lock:
+            known = self.data['names'].setdefault(monster_type, [])
+            known.extend(name for name in names if name not in known)
+            del known[:-CONTENT_CACHE_MAX_NAMES]
+
+    def death_stories(self) -> List[Dict]:
+        with self.lock:
+            return list(self.data['death_stories'])
+
+    def add_death_story(self, story: Dict):
+        with self.lock:
+            self.data['death_stories'].append(story)
+            del self.data['death_stories'][:-CONTENT_CACHE_MAX_STORIES]
+
+
+class ContentPregen:
+    """Generates LLM-backed entity attributes in parallel, entities get placeholders until they resolve.
+
+    Results are applied on the main thread by poll() so entities are never changed mid-frame.
+    """
+    def __init__(self, dialogue_processor, cache: ContentCache = None, workers: int = PREGEN_WORKERS):
+        self.dialogue_processor = dialogue_processor
+        self.cache = cache or ContentCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pregen')
+        self.logger = logging.getLogger(__name__)
+        self.futures = []  # (future, callback to run on the main thread with its result)
+        self.name_pool = {}  # monster_type -> names not given out in this game yet
+        self.name_requests = {}  # monster_type -> names generation in flight
+        self.waiting_for_name = {}  # monster_type -> entities still having a placeholder name
+        self.waiting_for_story = []  # spirits still having the fallback story
+        self.stories_in_flight = 0
+        self.used_stories = set()
+
+    def new_game(self, name_types=('goblin',), death_stories=1):
+        """Reset per-game state and submit every generation the new world will need"""
+        self.name_pool = {monster_type: self.cache.names(monster_type) for monster_type in name_types}
+        self.waiting_for_name = {}
+        self.waiting_for_story = []
+        self.used_stories = set()
+        for monster_type in name_types:
+            self.request_names(monster_type)
+        for _ in range(death_stories):
+            self.request_death_story_generation()
+
+    def submit(self, func: Callable, callback: Callable, *args):
+        self.futures.append((self.executor.submit(func, *args), callback))
+
+    def poll(self):
+        """Apply finished generations. Call from the game loop"""
+        if not self.futures:
+            return
+        pending = []
+        for future, callback in self.futures:
+            if not future.done():
+                pending.append((future, callback))
+                continue
+            try:
+                callback(future.result())
+            except Exception as e:
+                self.logger.error(f"Pre-generation failed: {e}")
+        self.futures = pending
+
+    # Names
+
+    def request_names(self, monster_type: str, description: str = ''):
+        if self.name_requests.get(monster_type):
+            return
+        self.name_requests[monster_type] = True
+        self.submit(self.dialogue_processor.generate_monster_name,
+                    lambda names: self.on_names(monster_type, names), monster_type, description)
+
+    def on_names(self, monster_type: str, names):
+        self.name_requests[monster_type] = False
+        if isinstance(names, str):
+            names = [names]
+        names = [name.strip() for name in names or [] if isinstance(name, str) and name.strip()]
+        if names:
+            self.cache.add_names(monster_type, names)
+            self.cache.save()
+        pool = self.name_pool.setdefault(monster_type, [])
+        pool.extend(name for name in names if name not in pool)
+        waiting = self.waiting_for_name.get(monster_type, [])
+        while waiting and pool:
+            self.give_name(waiting.pop(0), monster_type)
+        if waiting and names:  # More entities than one batch, a failed batch isn't retried
+            self.request_names(monster_type)
+
+    def give_name(self, entity, monster_type: str):
+        """Rename the entity. entity_id is left untouched since the RAG index is keyed by it"""
+        pool = self.name_pool[monster_type]
+        entity.name = pool.pop(random.randrange(len(pool)))
+
+    def request_name(self, entity):
+        """Give the entity a generated name now if one is ready, otherwise when the next batch arrives"""
+        monster_type = entity.monster_type
+        if self.name_pool.get(monster_type):
+            self.give_name(entity, monster_type)
+        else:
+            self.waiting_for_name.setdefault(monster_type, []).append(entity)
+        if len(self.name_pool.get(monster_type, [])) < 3:
+            self.request_names(monster_type, getattr(entity, 'description', ''))
+
+    # Death stories
+
+    def request_death_story_generation(self):
+        if self.stories_in_flight:
+            return
+        self.stories_in_flight += 1
+        self.submit(self.dialogue_processor.generate_death_story, self.on_death_story)
+
+    def on_death_story(self, story: Dict):
+        self.stories_in_flight -= 1
+        if not story or story == DEATH_STORY_FALLBACK or not isinstance(story.get('key_details'), list):
+            return
+        self.cache.add_death_story(story)
+        self.cache.save()
+        if self.waiting_for_story:
+            self.used_stories.add(story['victim_name'])
+            self.waiting_for_story.pop(0).set_death_story(story)
+
+    def request_death_story(self, entity):
+        """Give the spirit a cached story from an earlier game, or the generated one when it is ready"""
+        stories = [story for story in self.cache.death_stories() if story['victim_name'] not in self.used_stories]
+        if stories:
+            story = random.choice(stories)
+            self.used_stories.add(story['victim_name'])
+            entity.set_death_story(story)
+            self.request_death_story_generation()  # Grow the cache for the next games
+        else:
+            self.waiting_for_story.append(entity)
+            if not self.stories_in_flight:
+                self.request_death_story_generation()
@@ -0,0 +1,139 @@
+import io
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import DIALOGUE_DISTANCE, DISPLAY_TILE_SIZE, PREWARM_OPTIONS, PREWARM_GREETING_TTS
+
+
+class DialoguePrewarmer:
+    """Starts the slow parts of a conversation while the player walks up to a talkative entity.
+
+    Stages run in order on a single worker and stop as soon as the player walks away:
+    RAG queries for the likely first lines, model load plus prompt prefix evaluation, greeting TTS.
+    """
+    def __init__(self, dialogue_processor, tts, distance=DIALOGUE_DISTANCE):
+        self.dialogue_processor = dialogue_processor
+        self.tts = tts
+        self.distance = distance
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prewarm')
+        self.logger = logging.getLogger(__name__)
+        self.target = None
+        self.future = None
+        self.cancelled = threading.Event()
+        self.released = None  # (entity, cancelled event) of the job whose conversation has started
+        self.last_positions = None
+        self.lock = threading.Lock()  # The worker inserts greetings while the main thread takes and drops them
+        self.greetings = {}  # (entity_id, text) -> wav bytes
+
+    def update(self, player, entities, options, greeting):
+        """Pick the nearest talkative entity in range and prewarm it. Call every frame while playing
+
+        Args:
+            player: the player character
+            entities: all entities on the map
+            options: callable returning the predefined options for an entity
+            greeting: callable returning the opening line for an entity
+        """
+        candidates = [entity for entity in entities if self.can_talk(entity)]
+        # Entities walk up to a player standing still too, dead ones drop out of the candidates
+        positions = ((player.x, player.y), tuple((entity.x, entity.y) for entity in candidates))
+        if positions == self.last_positions:
+            return
+        self.last_positions = positions
+        target = self.find_target(player, candidates)
+        if target is self.target:
+            return
+        self.cancel()
+        if target is not None:
+            self.start(target, options(target), greeting(target))
+
+    @staticmethod
+    def can_talk(entity):
+        monster_type = getattr(entity, 'monster_type', None)  # Only NPCs and monsters have one
+        if monster_type is None or not entity.is_alive:
+            return False
+        return monster_type == 'npc' or getattr(entity, 'can_talk', False)  # Houses can't
+
+    def find_target(self, player, candidates):
+        nearest, nearest_distance = None, self.distance * DISPLAY_TILE_SIZE
+        for entity in candidates:
+            distance = math.hypot(entity.x - player.x, entity.y - player.y)
+            if distance <= nearest_distance:
+                nearest, nearest_distance = entity, distance
+        return nearest
+
+    def start(self, entity, options, greeting):
+        """Snapshot what the stages need on the main thread and submit them"""
+        self.target = entity
+        self.cancelled = threading.Event()
+        processor = self.dialogue_processor
+        job = {'entity_id': entity.entity_id,
+               'knowledge_id': processor.knowledge_id(entity),
+               'history': list(entity.interaction_history),
+               'options': [option for option in options if option.lower() not in ('bye', 'leave')][:PREWARM_OPTIONS],
+               'prefix': processor.prompt_prefix(entity),
+               'greeting': greeting,
+               'voice': entity.voice}
+        self.future = self.executor.submit(self.run, job, self.cancelled)
+
+    def cancel(self):
+        """Drop the current target, unfinished stages are skipped"""
+        if self.target is None:
+            return
+        self.cancelled.set()
+        if self.future:
+            self.future.cancel()
+        self.drop_results(self.target)
+        self.target = None
+        self.future = None
+
+    def release(self, entity):
+        """The conversation has started, keep the prewarmed results but prewarm again afterwards"""
+        if entity is self.target:
+            self.released = (entity, self.cancelled)
+            self.target = None
+            self.future = None
+            self.last_positions = None
+
+    def forget(self, entity):
+        """The conversation has ended, drop what was prewarmed for it and wasn't used"""
+        if self.released and self.released[0] is entity:
+            self.released[1].set()  # A stage still running keeps nothing
+            self.released = None
+        self.drop_results(entity)
+
+    def drop_results(self, entity):
+        self.dialogue_processor.forget_prefetched(self.dialogue_processor.knowledge_id(entity))
+        with self.lock:
+            for key in [key for key in self.greetings if key[0] == entity.entity_id]:
+                del self.greetings[key]
+
+    def run(self, job, cancelled):
+        try:
+            for option in job['options']:
+                if cancelled.is_set():
+                    return
+                self.dialogue_processor.prefetch_knowledge(job['knowledge_id'], option, job['history'],
+                                                           cancelled=cancelled)
+
+            if cancelled.is_set():
+                return
+            # Loads the model with its keep_alive and leaves the prefix in Ollama's prompt cache
+            self.dialogue_processor.complete('prewarm', job['prefix'], options={'num_predict': 1})
+
+            if cancelled.is_set() or not PREWARM_GREETING_TTS:
+                return
+            audio_buffer = self.tts.generate_and_play_tts(job['greeting'], job['voice'])
+            with self.lock:
+                if audio_buffer and not cancelled.is_set():
+                    self.greetings[(job['entity_id'], job['greeting'])] = audio_buffer.getvalue()
+        except Exception as e:
+            self.logger.error(f"Dialogue prewarm failed: {e}")
+
+    def take_greeting(self, entity, text):
+        """Prewarmed greeting audio for the entity, None if it isn't ready"""
+        with self.lock:
+            audio = self.greetings.pop((entity.entity_id, text), None)
+        return io.BytesIO(audio) if audio else None
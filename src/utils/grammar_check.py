@@ -0,0 +1,312 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+
+# Irregular verbs of an A2 word list, base -> (past simple, past participle)
+IRREGULAR = {
+    'be': ('was', 'been'), 'become': ('became', 'become'), 'begin': ('began', 'begun'), 'bite': ('bit', 'bitten'),
+    'break': ('broke', 'broken'), 'bring': ('brought', 'brought'), 'build': ('built', 'built'),
+    'buy': ('bought', 'bought'), 'catch': ('caught', 'caught'), 'choose': ('chose', 'chosen'),
+    'come': ('came', 'come'), 'cost': ('cost', 'cost'), 'cut': ('cut', 'cut'), 'do': ('did', 'done'),
+    'draw': ('drew', 'drawn'), 'dream': ('dreamt', 'dreamt'), 'drink': ('drank', 'drunk'),
+    'drive': ('drove', 'driven'), 'eat': ('ate', 'eaten'), 'fall': ('fell', 'fallen'), 'feel': ('felt', 'felt'),
+    'fight': ('fought', 'fought'), 'find': ('found', 'found'), 'fly': ('flew', 'flown'),
+    'forget': ('forgot', 'forgotten'), 'get': ('got', 'got'), 'give': ('gave', 'given'), 'go': ('went', 'gone'),
+    'grow': ('grew', 'grown'), 'have': ('had', 'had'), 'hear': ('heard', 'heard'), 'hide': ('hid', 'hidden'),
+    'hit': ('hit', 'hit'), 'hold': ('held', 'held'), 'hurt': ('hurt', 'hurt'), 'keep': ('kept', 'kept'),
+    'know': ('knew', 'known'), 'learn': ('learnt', 'learnt'), 'leave': ('left', 'left'), 'lend': ('lent', 'lent'),
+    'let': ('let', 'let'), 'lie': ('lay', 'lain'), 'lose': ('lost', 'lost'), 'make': ('made', 'made'),
+    'mean': ('meant', 'meant'), 'meet': ('met', 'met'), 'pay': ('paid', 'paid'), 'put': ('put', 'put'),
+    'read': ('read', 'read'), 'ride': ('rode', 'ridden'), 'ring': ('rang', 'rung'), 'rise': ('rose', 'risen'),
+    'run': ('ran', 'run'), 'say': ('said', 'said'), 'see': ('saw', 'seen'), 'sell': ('sold', 'sold'),
+    'send': ('sent', 'sent'), 'shine': ('shone', 'shone'), 'shoot': ('shot', 'shot'), 'shut': ('shut', 'shut'),
+    'sing': ('sang', 'sung'), 'sit': ('sat', 'sat'), 'sleep': ('slept', 'slept'), 'speak': ('spoke', 'spoken'),
+    'spend': ('spent', 'spent'), 'stand': ('stood', 'stood'), 'steal': ('stole', 'stolen'),
+    'swim': ('swam', 'swum'), 'take': ('took', 'taken'), 'teach': ('taught', 'taught'), 'tell': ('told', 'told'),
+    'think': ('thought', 'thought'), 'throw': ('threw', 'thrown'), 'understand': ('understood', 'understood'),
+    'wake': ('woke', 'woken'), 'wear': ('wore', 'worn'), 'win': ('won', 'won'), 'write': ('wrote', 'written'),
+}
+# Both spellings are fine for these, the table keeps the British one
+VARIANTS = {'dreamt': 'dreamed', 'learnt': 'learned', 'got': 'gotten'}
+
+BE_FORMS = {'am', 'is', 'are', 'was', 'were', "'m", "'s", "'re"}
+HAVE_FORMS = {'have', 'has', 'had', "'ve"}
+BASE_TRIGGERS = {'to', 'do', 'does', 'did', "don't", "doesn't", "didn't", 'will', "won't", 'can', "can't", 'could',
+                 'must', 'should', 'would', 'may', 'might', 'let', "let's"}
+PAST_CUES = {'yesterday', 'ago', 'last'}
+PROGRESSIVE_CUES = {'now', 'look', 'listen', 'currently', 'moment'}
+HABIT_CUES = {'every', 'usually', 'always', 'often', 'never', 'sometimes', 'rarely', 'seldom', 'normally'}
+PRONOUN_PERSON = {'i': 'first', 'he': 'third', 'she': 'third', 'it': 'third', 'you': 'other', 'we': 'other',
+                  'they': 'other', 'everyone': 'third', 'everybody': 'third', 'nobody': 'third', 'somebody': 'third'}
+IRREGULAR_PLURALS = {'children', 'people', 'men', 'women', 'feet', 'teeth', 'mice', 'geese', 'sheep', 'police'}
+
+BLANK = re.compile(r'_{2,}|\.{3,}|…')
+BASE_VERB = re.compile(r'\(\s*(?:to\s+)?([a-z]+)\s*\)', re.I)
+SENTENCE_END = re.compile(r'(?<=[.!?:;])\s+')
+CONTRACTIONS = ((r"\b(he|she|it|that|who)'s\b", r'\1 is'), (r"'re\b", ' are'), (r"'m\b", ' am'),
+                (r"'ve\b", ' have'))
+
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[a-z']+", text.lower())
+
+
+def third_person(verb: str) -> str:
+    if verb == 'be':
+        return 'is'
+    if verb == 'have':
+        return 'has'
+    if verb.endswith(('s', 'sh', 'ch', 'x', 'z', 'o')):
+        return verb + 'es'
+    if re.search(r'[^aeiou]y$', verb):
+        return verb[:-1] + 'ies'
+    return verb + 's'
+
+
+def doubles(verb: str) -> Optional[bool]:
+    """Whether the last consonant doubles before -ed/-ing: True (stop), False (visit) or None if both spellings
+    are seen (travel, prefer), only short words are sure"""
+    if not re.search(r'[^aeiou][aeiou][^aeiouwxy]$', verb):
+        return False
+    return True if len(re.findall(r'[aeiouy]+', verb)) == 1 else None
+
+
+def ing_forms(verb: str) -> List[str]:
+    if verb.endswith('ie'):
+        return [verb[:-2] + 'ying']
+    if verb.endswith('e') and not verb.endswith(('ee', 'ye', 'oe')) and verb != 'be':
+        return [verb[:-1] + 'ing']
+    double = doubles(verb)
+    doubled = verb + verb[-1] + 'ing'
+    return [doubled] if double else [verb + 'ing'] if double is False else [doubled, verb + 'ing']
+
+
+def past_forms(verb: str, participle=False) -> List[str]:
+    if verb in IRREGULAR:
+        form = IRREGULAR[verb][participle]
+        return [form, VARIANTS[form]] if form in VARIANTS else [form]
+    if verb.endswith('e'):
+        return [verb + 'd']
+    if re.search(r'[^aeiou]y$', verb):
+        return [verb[:-1] + 'ied']
+    double = doubles(verb)
+    doubled = verb + verb[-1] + 'ed'
+    return [doubled] if double else [verb + 'ed'] if double is False else [doubled, verb + 'ed']
+
+
+def be_form(person: str, past: bool) -> str:
+    if past:
+        return 'were' if person == 'other' else 'was'
+    return {'first': 'am', 'third': 'is'}.get(person, 'are')
+
+
+@dataclass
+class GrammarVerdict:
+    """Local judgement of an answer to a verb form test, correct is None if the answer couldn't be judged"""
+    correct: Optional[bool] = None
+    verb: str = ''
+    form: str = ''  # past, participle, ing, base, present, progressive or aspect
+    expected: List[str] = field(default_factory=list)  # Accepted answers, the first is shown to the player
+    answer: str = ''  # The part of the player's reply that was judged
+    errors: List[str] = field(default_factory=list)
+
+
+class GrammarChecker:
+    """Grades answers to the Kobold Teacher's tests without an LLM call.
+
+    The test sentence is found by its blank and the verb in brackets: "Yesterday I ___ (go) to the market".
+    spaCy parses the sentence with the verb filled in to find its subject, and the blank's neighbours and
+    time words decide which form is asked for. The answer is accepted if it holds that form, built from the
+    spelling rules and the table of irregular verbs. The player's reply is parsed in the same spaCy batch to
+    list subject-verb agreement errors for the kobold to correct. Without spaCy the subject is the word
+    before the blank and agreement isn't checked.
+    """
+    def __init__(self, model='en_core_web_sm'):
+        self.model = model
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self._nlp = None
+        self.nlp_failed = False
+
+    @property
+    def nlp(self):
+        """spaCy pipeline, loaded on first use or by the warmup"""
+        if self._nlp is None and not self.nlp_failed:
+            with self.lock:
+                if self._nlp is None and not self.nlp_failed:
+                    try:
+                        import spacy
+                        self._nlp = spacy.load(self.model, disable=['ner'])
+                    except Exception as e:
+                        self.logger.warning(f"No spaCy model for grammar checks, using word order instead: {e}")
+                        self.nlp_failed = True
+        return self._nlp
+
+    def load(self) -> bool:
+        return self.nlp is not None
+
+    @staticmethod
+    def find_task(question: str) -> Optional[Tuple[str, str, str]]:
+        """(sentence with its blank as ___, verb in brackets, lead-in like "Look!"), None if the question isn't
+        a verb form test"""
+        text = BLANK.sub(' ___ ', question)
+        sentences = SENTENCE_END.split(text)
+        index = next((i for i, sentence in enumerate(sentences) if '___' in sentence), None)
+        if index is None:
+            return None
+        verb = BASE_VERB.search(sentences[index]) or BASE_VERB.search(text)
+        if not verb:
+            return None
+        lead_in = sentences[index - 1] if index and len(words(sentences[index - 1])) <= 3 else ''
+        return re.sub(r'\s+', ' ', BASE_VERB.sub('', sentences[index])).strip(), verb.group(1).lower(), lead_in
+
+    @staticmethod
+    def asked_form(question: str, before: str, cues: set) -> str:
+        """Form the test asks for, from its instructions, the word before the blank and time words"""
+        question = question.lower()
+        if 'continuous' in question or 'progressive' in question:
+            return 'aspect' if 'simple' in question else 'progressive'
+        if 'participle' in question:
+            return 'participle'
+        if before in BE_FORMS:
+            return 'ing'
+        if before in HAVE_FORMS:
+            return 'participle'
+        if before in BASE_TRIGGERS:
+            return 'base'
+        if 'past' in question or cues & PAST_CUES:
+            return 'past'
+        if cues & PROGRESSIVE_CUES:
+            return 'progressive'
+        return 'present'
+
+    @staticmethod
+    def person(word: str, tag: str = '', plural_subject=False) -> str:
+        """first, third (singular) or other"""
+        if plural_subject:
+            return 'other'
+        if word in PRONOUN_PERSON:
+            return PRONOUN_PERSON[word]
+        if word in IRREGULAR_PLURALS:
+            return 'other'
+        if tag:
+            return 'other' if tag in ('NNS', 'NNPS') else 'third'
+        return 'other' if word.endswith('s') and not word.endswith('ss') else 'third'
+
+    def subject(self, doc, blank_at: int, verb: str, sentence_words: List[str], blank: int) -> str:
+        """Person of the blank's subject, from the parse of the sentence with the verb filled in if there is one"""
+        span = doc.char_span(blank_at, blank_at + len(verb)) if doc is not None else None
+        if span is not None:
+            for token in span[0].children:
+                if token.dep_ in ('nsubj', 'nsubjpass', 'expl'):
+                    plural = any(child.dep_ == 'conj' for child in token.children)
+                    return self.person(token.text.lower(), token.tag_, plural)
+        for i in range(blank - 1, -1, -1):
+            if sentence_words[i] not in HABIT_CUES and sentence_words[i] not in ('not', 'also', 'just', 'still'):
+                return self.person(sentence_words[i], plural_subject=i > 0 and sentence_words[i - 1] == 'and')
+        return 'third'
+
+    def expected(self, verb: str, form: str, person: str, past: bool) -> List[str]:
+        if form == 'past':
+            return [be_form(person, True)] if verb == 'be' else past_forms(verb)
+        if form == 'participle':
+            return past_forms(verb, participle=True)
+        if form == 'ing':
+            return ing_forms(verb)
+        if form == 'base':
+            return [verb]
+        if form == 'progressive':
+            return [f"{be_form(person, past)} {ing}" for ing in ing_forms(verb)]
+        if verb == 'be':
+            return [be_form(person, False)]
+        return [third_person(verb)] if person == 'third' else [verb]
+
+    def verb_forms(self, verb: str) -> set:
+        """Every form of the verb a player could try"""
+        return ({verb, third_person(verb)} | set(ing_forms(verb)) | set(past_forms(verb))
+                | set(past_forms(verb, participle=True)))
+
+    @staticmethod
+    def misspelled(word: str, verb: str) -> bool:
+        """Whether the word looks like a wrong attempt at the verb: goed, runned, writting"""
+        if word.startswith(verb) and word[len(verb):] in ('s', 'es', 'd', 'ed', 'ing', 'en', 'n'):
+            return True
+        return len(verb) > 3 and word[:4] == verb[:4] and len(word) <= len(verb) + 4
+
+    def agreement_errors(self, doc) -> List[str]:
+        """Subjects whose present tense verb or be/have auxiliary doesn't agree with them"""
+        errors = []
+        for token in doc:
+            if token.dep_ not in ('nsubj', 'nsubjpass'):
+                continue
+            plural = any(child.dep_ == 'conj' for child in token.children)
+            person = self.person(token.text.lower(), token.tag_, plural)
+            head = token.head
+            for verb in [head] + [child for child in head.children if child.dep_ in ('aux', 'auxpass')]:
+                lemma, text = verb.lemma_.lower(), verb.text.lower()
+                if lemma == 'be' and text in ('am', 'is', 'are', 'was', 'were'):
+                    right = be_form(person, text in ('was', 'were'))
+                elif verb.tag_ in ('VBZ', 'VBP') and lemma.isalpha():
+                    right = third_person(lemma) if person == 'third' else lemma
+                else:
+                    continue
+                if text != right:
+                    errors.append(f"'{token.text} {verb.text}' should be '{token.text} {right}'")
+        return errors
+
+    def check(self, question: str, answer: str) -> GrammarVerdict:
+        """Judge the player's answer to the last test question"""
+        task = self.find_task(question)
+        if not task or not answer.strip():
+            return GrammarVerdict()
+        sentence, verb, lead_in = task
+        sentence_words = re.findall(r"[a-z']+|___", sentence.lower())
+        blank = sentence_words.index('___')
+        before = sentence_words[blank - 1] if blank else ''
+        cues = set(sentence_words + words(lead_in))
+        form = self.asked_form(question, before, cues)
+
+        blank_at = sentence.index('___')
+        docs = [None, None]
+        if self.nlp is not None:  # One batch for the test sentence and the reply
+            filled = sentence[:blank_at] + verb + sentence[blank_at + 3:]
+            docs = list(self.nlp.pipe([filled, answer]))
+        person = self.subject(docs[0], blank_at, verb, sentence_words, blank)
+        past = 'past' in question.lower() or bool(cues & PAST_CUES)
+        if form == 'aspect':  # "Present simple or present continuous?"
+            form = 'progressive' if cues & PROGRESSIVE_CUES else 'present' if cues & HABIT_CUES else ''
+            if not form:
+                return GrammarVerdict(verb=verb)
+            aspect = 'continuous' if form == 'progressive' else 'simple'
+            said = [name for name in ('simple', 'continuous', 'progressive') if name in answer.lower()]
+            if said:
+                said = ['continuous' if name == 'progressive' else name for name in said]
+                return GrammarVerdict(correct=said == [aspect], verb=verb, form='aspect', expected=[aspect],
+                                      answer=' or '.join(said))
+
+        expected = self.expected(verb, form, person, past)
+        reply = answer.lower()
+        for pattern, replacement in CONTRACTIONS:
+            reply = re.sub(pattern, replacement, reply)
+        reply_words = words(reply)
+        errors = self.agreement_errors(docs[1]) if docs[1] is not None else []
+        lemmas = {token.text.lower() for token in docs[1] if token.lemma_.lower() == verb} if docs[1] else set()
+
+        text = ' '.join(reply_words)
+        for option in expected:
+            if re.search(rf"\b{option}\b", text):
+                return GrammarVerdict(correct=True, verb=verb, form=form, expected=expected, answer=option,
+                                      errors=errors)
+
+        forms = self.verb_forms(verb)
+        tried = [i for i, word in enumerate(reply_words)
+                 if word in forms or word in lemmas or self.misspelled(word, verb)]
+        if not tried:  # Not an answer, a question or small talk, the kobold decides
+            return GrammarVerdict(verb=verb, form=form, expected=expected, errors=errors)
+        start = tried[0] - 1 if tried[0] and reply_words[tried[0] - 1] in BE_FORMS | HAVE_FORMS else tried[0]
+        given = ' '.join(reply_words[start:tried[0] + 1])
+        errors.insert(0, f"'{given}' is not the right form here, it should be '{expected[0]}'")
+        return GrammarVerdict(correct=False, verb=verb, form=form, expected=expected, answer=given, errors=errors)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import List, Optional
+
+import httpx
+import ollama
+
+from constants import OLLAMA_HOST, OLLAMA_NUM_PARALLEL, LLM_CLIENT_TIMEOUT
+from .llm_telemetry import LLMCall, LLMDeadlineExceeded
+
+
+_END = object()  # Put in a stream's queue after the last chunk
+
+
+class LLMStream:
+    """Chunks of a streamed chat. The event loop thread fills the queue, the game reads it without blocking"""
+    def __init__(self, call: LLMCall):
+        self.call = call
+        self.chunks = queue.SimpleQueue()
+        self.future = None  # concurrent.futures.Future of the coroutine filling the queue
+        self.outcome = None  # _END or the exception that ended the stream, once poll has reached it
+
+    def poll(self) -> List[str]:
+        """Message content received since the last poll, never blocks.
+
+        Raises StopIteration once the whole reply has been returned, LLMDeadlineExceeded or the client error if
+        the stream failed.
+        """
+        contents = []
+        while self.outcome is None:
+            try:
+                chunk = self.chunks.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is _END or isinstance(chunk, Exception):
+                self.outcome = chunk
+            elif 'message' in chunk and chunk['message']['content']:
+                contents.append(chunk['message']['content'])
+        if contents or self.outcome is None:  # The outcome is raised on the next poll
+            return contents
+        if self.outcome is _END:
+            raise StopIteration
+        raise self.outcome
+
+    def __iter__(self):
+        """Blocking iteration over the raw chunks, for worker threads"""
+        while True:
+            chunk = self.chunks.get()
+            if chunk is _END:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def close(self):
+        """Stop generating, the HTTP stream is closed so Ollama stops too"""
+        if self.future and not self.future.done():
+            self.future.cancel()
+
+
+class AsyncLLMClient:
+    """ollama.AsyncClient running on its own event loop thread.
+
+    Keeps a pool of persistent connections and lets at most OLLAMA_NUM_PARALLEL requests run at once, the rest
+    wait for a slot within their deadline. Every method is called from other threads and never from the loop.
+    """
+    def __init__(self, telemetry, host=OLLAMA_HOST, parallel=OLLAMA_NUM_PARALLEL, timeout=LLM_CLIENT_TIMEOUT):
+        self.telemetry = telemetry
+        self.logger = logging.getLogger(__name__)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name='llm-loop')
+        self.thread.start()
+        # Warmups don't take a slot, so the pool has room for them too
+        limits = httpx.Limits(max_connections=parallel + 2, max_keepalive_connections=parallel + 2)
+        self.client = ollama.AsyncClient(host=host, timeout=timeout, limits=limits)
+        self.semaphore = self.run(self._make_semaphore(parallel))
+
+    @staticmethod
+    async def _make_semaphore(parallel):
+        return asyncio.Semaphore(parallel)  # Created on the loop it is used on
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        """Run a coroutine on the loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def chat(self, call: LLMCall, deadline: Optional[float] = None, **kwargs):
+        """Blocking chat for the call, waiting for a slot counts towards the deadline.
+        Raises LLMDeadlineExceeded once the deadline passes, the request is cancelled"""
+        try:
+            return self.run(asyncio.wait_for(self._chat(call, kwargs), deadline))
+        except (asyncio.TimeoutError, FutureTimeout):
+            self.telemetry.miss(call)
+            raise LLMDeadlineExceeded(f"{call.call_type} call took longer than {deadline}s")
+        except Exception as e:
+            self.telemetry.finish(call, error=str(e))
+            raise
+
+    async def _chat(self, call: LLMCall, kwargs):
+        async with self.semaphore:
+            response = await self.client.chat(model=call.model, stream=False, **kwargs)
+        call.ttft_ms = call.wall_ms = (time.perf_counter() - call.started) * 1000
+        call.read_metadata(response)
+        return response
+
+    def stream(self, call: LLMCall, deadline: Optional[float] = None, **kwargs) -> LLMStream:
+        """Start a streamed chat and return at once. The consumer finishes the telemetry record"""
+        stream = LLMStream(call)
+        stream.future = asyncio.run_coroutine_threadsafe(self._stream(stream, deadline, kwargs), self.loop)
+        return stream
+
+    async def _stream(self, stream: LLMStream, deadline, kwargs):
+        call = stream.call
+        try:
+            await asyncio.wait_for(self._pump(stream, kwargs), deadline)
+            stream.chunks.put(_END)
+        except asyncio.TimeoutError:
+            self.telemetry.miss(call)
+            stream.chunks.put(LLMDeadlineExceeded(f"{call.call_type} stream passed its deadline"))
+        except asyncio.CancelledError:
+            self.telemetry.finish(call, error='cancelled')
+            stream.chunks.put(_END)
+            raise
+        except Exception as e:
+            self.telemetry.finish(call, error=str(e))
+            stream.chunks.put(e)
+
+    async def _pump(self, stream: LLMStream, kwargs):
+        call = stream.call
+        async with self.semaphore:
+            response = await self.client.chat(model=call.model, stream=True, **kwargs)
+            try:
+                async for chunk in response:
+                    now = time.perf_counter()
+                    if call.ttft_ms is None:
+                        call.ttft_ms = (now - call.started) * 1000
+                    if chunk.get('done'):
+                        call.read_metadata(chunk)
+                        call.wall_ms = (now - call.started) * 1000
+                    stream.chunks.put(chunk)
+            finally:
+                await response.aclose()  # Closes the HTTP stream right away when cancelled
+
+    def generate(self, **kwargs):
+        """Blocking generate, used to load models"""
+        return self.run(self.client.generate(**kwargs))
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import ollama
+
+from constants import LLM_ROUTES, LLM_MODEL, LLM_DEFAULT_DEADLINE
+
+
+class ModelRouter:
+    """Maps call types to a model, its generation options and keep_alive"""
+    def __init__(self, client, routes: Dict = LLM_ROUTES, default_model: str = LLM_MODEL):
+        self.client = client
+        self.routes = routes
+        self.default_model = default_model
+        self.logger = logging.getLogger(__name__)
+        self.unavailable = set()  # Models Ollama doesn't have, their routes use default_model instead
+        self.warm_ms = {}  # model -> time the warmup call took
+        self.lock = threading.Lock()
+
+    def get_route(self, call_type: str) -> Dict:
+        return self.routes.get(call_type) or self.routes['dialogue']
+
+    def route(self, call_type: str, options: Optional[Dict] = None) -> Tuple[str, Dict, Optional[str]]:
+        """Return (model, options, keep_alive) for a call type. Given options override the route's ones"""
+        route = self.get_route(call_type)
+        model = route.get('model', self.default_model)
+        if model in self.unavailable:
+            model = self.default_model
+        return model, {**route.get('options', {}), **(options or {})}, route.get('keep_alive')
+
+    def deadline(self, call_type: str) -> float:
+        """Seconds the call type may take before it is abandoned"""
+        return self.get_route(call_type).get('deadline', LLM_DEFAULT_DEADLINE)
+
+    def models(self) -> Dict[str, str]:
+        """Every routed model with the longest keep_alive among its routes"""
+        models = {}
+        for route in self.routes.values():
+            model = route.get('model', self.default_model)
+            keep_alive = route.get('keep_alive')
+            if model not in models or keep_seconds(keep_alive) > keep_seconds(models[model]):
+                models[model] = keep_alive
+        return models
+
+    def warmup(self, model: str, keep_alive: Optional[str] = None) -> bool:
+        """Load a model into memory with an empty prompt. Marks the model unavailable if it isn't pulled"""
+        start = time.perf_counter()
+        try:
+            self.client.generate(model=model, prompt='', keep_alive=keep_alive)
+        except ollama.ResponseError as e:
+            if e.status_code == 404 and model != self.default_model:
+                self.logger.warning(f"Model {model} not found, routing its calls to {self.default_model}")
+                with self.lock:
+                    self.unavailable.add(model)
+            else:
+                self.logger.error(f"Failed to warm up {model}: {e}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Failed to warm up {model}: {e}")
+            return False
+        with self.lock:
+            self.warm_ms[model] = (time.perf_counter() - start) * 1000
+        self.logger.info(f"Model {model} loaded in {self.warm_ms[model]:.0f} ms (keep_alive {keep_alive})")
+        return True
+
+    def warmup_all(self):
+        """Load every routed model so the first call of each type doesn't pay the load time"""
+        for model, keep_alive in self.models().items():
+            self.warmup(model, keep_alive)
+
+    def warmup_async(self) -> threading.Thread:
+        thread = threading.Thread(target=self.warmup_all, daemon=True)
+        thread.start()
+        return thread
+
+
+def keep_seconds(value, default=300.0) -> float:
+    """Seconds of an Ollama keep_alive value such as 300, '30m' or -1 (forever), default when unset or unreadable"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float('inf') if value < 0 else float(value)
+    value = str(value).strip()
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    try:
+        amount = float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+    except (ValueError, IndexError):
+        return default
+    return float('inf') if amount < 0 else amount
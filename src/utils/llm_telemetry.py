@@ -0,0 +1,131 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, asdict
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+from constants import LLM_TELEMETRY_LOG, LLM_TELEMETRY_MAX_BYTES, LLM_TELEMETRY_BACKUPS, LLM_TELEMETRY_WINDOW
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """The call took longer than its route's deadline and was abandoned"""
+
+
+@dataclass
+class LLMCall:
+    """Timing and token counts of a single client.chat call"""
+    call_type: str
+    model: str
+    stream: bool
+    started: float = 0.0
+    ttft_ms: Optional[float] = None  # Time to first chunk
+    wall_ms: Optional[float] = None
+    prompt_tokens: int = 0
+    prompt_eval_ms: float = 0.0
+    eval_tokens: int = 0
+    eval_ms: float = 0.0
+    load_ms: float = 0.0
+    parsed: Optional[bool] = None  # None when the reply is not JSON
+    error: Optional[str] = None
+    finished: bool = False
+
+    @property
+    def tokens_per_sec(self):
+        return self.eval_tokens / (self.eval_ms / 1000) if self.eval_ms else 0.0
+
+    def read_metadata(self, response):
+        """Copy Ollama's token counts and durations (reported in ns) from a response or final chunk"""
+        self.prompt_tokens = response.get('prompt_eval_count') or 0
+        self.prompt_eval_ms = (response.get('prompt_eval_duration') or 0) / 1e6
+        self.eval_tokens = response.get('eval_count') or 0
+        self.eval_ms = (response.get('eval_duration') or 0) / 1e6
+        self.load_ms = (response.get('load_duration') or 0) / 1e6
+
+
+class LLMTelemetry:
+    def __init__(self, log_path=LLM_TELEMETRY_LOG, window=LLM_TELEMETRY_WINDOW):
+        self.lock = threading.Lock()
+        self.calls = defaultdict(lambda: deque(maxlen=window))  # call_type -> recent finished calls
+        self.parse_failures = defaultdict(int)
+        self.deadline_misses = defaultdict(int)
+
+        self.logger = logging.getLogger('llm_telemetry')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if log_path and not self.logger.handlers:
+            try:
+                os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+                handler = RotatingFileHandler(log_path, maxBytes=LLM_TELEMETRY_MAX_BYTES,
+                                              backupCount=LLM_TELEMETRY_BACKUPS, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self.logger.addHandler(handler)
+            except OSError as e:
+                print(f"Couldn't open LLM telemetry log {log_path}: {e}")
+
+    def start(self, call_type: str, model: str, stream: bool = False) -> LLMCall:
+        return LLMCall(call_type, model, stream, started=time.perf_counter())
+
+    def finish(self, call: Optional[LLMCall], parsed: Optional[bool] = None, error: Optional[str] = None):
+        """Record the outcome of a call and append it to the JSONL log. Calls are recorded once"""
+        if call is None or call.finished:
+            return
+        call.finished = True
+        if call.wall_ms is None:
+            call.wall_ms = (time.perf_counter() - call.started) * 1000
+        call.parsed = parsed
+        call.error = error
+        with self.lock:
+            self.calls[call.call_type].append(call)
+            if parsed is False:
+                self.parse_failures[call.call_type] += 1
+        record = asdict(call)
+        del record['started'], record['finished']
+        record['tokens_per_sec'] = round(call.tokens_per_sec, 2)
+        record['time'] = time.time()
+        self.logger.info(json.dumps(record))
+
+    def miss(self, call: LLMCall):
+        """Record a call abandoned at its deadline"""
+        if call.finished:
+            return
+        with self.lock:
+            self.deadline_misses[call.call_type] += 1
+        self.finish(call, error='deadline exceeded')
+
+    def summary(self):
+        """Per call type statistics over the recent window"""
+        with self.lock:
+            snapshot = {call_type: list(calls) for call_type, calls in self.calls.items()}
+            failures = dict(self.parse_failures)
+            misses = dict(self.deadline_misses)
+        stats = {}
+        for call_type, calls in sorted(snapshot.items()):
+            walls = [call.wall_ms for call in calls]
+            ttfts = [call.ttft_ms for call in calls if call.ttft_ms is not None]
+            speeds = [call.tokens_per_sec for call in calls if call.eval_ms]
+            stats[call_type] = {
+                'count': len(calls),
+                'wall_p50': percentile(walls, 50),
+                'wall_p95': percentile(walls, 95),
+                'ttft_p50': percentile(ttfts, 50),
+                'ttft_p95': percentile(ttfts, 95),
+                'prompt_tokens': percentile([call.prompt_tokens for call in calls], 50),
+                'tokens_per_sec': percentile(speeds, 50),
+                'parse_failures': failures.get(call_type, 0),
+                'deadline_misses': misses.get(call_type, 0),
+            }
+        return stats
+
+
+def percentile(values, q):
+    """Nearest-rank percentile, 0 for an empty list"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,453 @@
+import inspect
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from string import Formatter
+
+from constants import PROMPT_RENDER_BUDGET_MS, LLM_TELEMETRY_WINDOW
+from .transcript import render_transcript
+from .llm_telemetry import percentile
+
+
+def prompt_prefix(npc, fleeing: bool = False) -> str:
+    """Opening of the entity's dialogue prompt. It doesn't change between turns so the prewarmer can
+    have Ollama evaluate it before the player speaks and the real prompt reuses that evaluation"""
+    if fleeing:
+        return f"You are a desperate monster {npc.monster_type} named {npc.name} in a fantasy RPG game. "
+    if npc.monster_type == 'npc':
+        return f"You are an NPC named {npc.name} in a fantasy RPG game. "
+    if npc.monster_type == 'troll':
+        return f"You are a playful monster {npc.monster_type} named {npc.name} in a fantasy RPG game. "
+    if npc.monster_type == 'dryad':
+        return f"You are a seductive dryad named {npc.name} in a fantasy RPG game. "
+    if npc.monster_type == 'kobold':
+        return f"You are a kobold English teacher named {npc.name} in a fantasy RPG game and the player"
+    if npc.monster_type == 'demon_bard':
+        return f"You are a tragic poet bard from hell named {npc.name}"
+    if npc.monster_type == 'willow_whisper':
+        return f"You are the spirit of {npc.death_story['victim_name']}"
+    return f"You are a desperate monster {npc.monster_type} named {npc.name} in a fantasy RPG game. "
+
+
+# Dynamic sections: name -> (scope, function(npc, game_state)). 'call' sections are computed on every render
+# that uses them, 'turn' sections once per entity per game turn since they only change when something moves
+SECTIONS = {
+    'prefix': ('call', lambda npc, game_state: prompt_prefix(npc)),
+    'fleeing_prefix': ('call', lambda npc, game_state: prompt_prefix(npc, fleeing=True)),
+    'npc_status': ('call', lambda npc, game_state: npc.get_dialogue_context()),
+    'player_status': ('call', lambda npc, game_state: game_state.player.get_dialogue_context()),
+    'negotiate_reward': ('call', lambda npc, game_state: npc.negotiate_reward_prompt()),
+    'transcript': ('call', lambda npc, game_state: render_transcript(npc.interaction_history, npc.name)),
+    'short_transcript': ('call', lambda npc, game_state: render_transcript(npc.interaction_history, npc.name,
+                                                                            limit=3)),
+    'key_details': ('call', lambda npc, game_state: ', '.join(npc.death_story['key_details'])),
+    'discovered_clues': ('call', lambda npc, game_state: list(npc.discovered_clues)),
+    'hidden_clues': ('call', lambda npc, game_state: set(npc.death_story['key_details']) - npc.discovered_clues),
+    'nearby_allies': ('turn', lambda npc, game_state: npc.detect_nearby_monsters(npc.game_state.current_map)),
+    'near_tree': ('turn', lambda npc, game_state: '' if npc.is_near_tree(game_state.current_map) else 'not'),
+    'player_too_far': ('turn', lambda npc, game_state: npc.dist2player((game_state.player.x, game_state.player.x),
+                                                                       2)),
+}
+
+
+TEMPLATES = {
+    'dialogue': """{prefix}
+            Your current mood is {npc.mood}.
+            The player's reputation with you is {player_reputation}/100.
+
+            You are aware of the following information:
+            {knowledge}
+
+            {quest_info}
+            {negotiate_reward}
+            You currently have {npc.money} gold."
+
+
+            Recent conversation history:
+            {transcript}
+
+
+            Respond in character as {npc.name}, {npc.description}, considering your mood, the player's reputation, and your knowledge.
+            Try to include proper from mentioned above list of quest_id if the topic is related to the quest.
+            Format your response as JSON with these fields:
+            - player_inappropriate_request (boolean)
+            - further_action (string: "give_quest", "reward", "stop", "negotiate_reward", or "wait")
+            - quest_id (string, if further_action is "reward" or "negotiate_reward" or "give_quest", must be one of the available quest IDs listed above)
+            - negotiated_amount (integer, only if further_action is "negotiate_reward", cannot be more than max_reward gold amount)
+            - text (string: your in-character response)
+
+            Quest giving rules:
+
+            - You cannot give any quests that are not listed in available quests. You can't give quests if there are no quest available.
+            - Only use "give_quest" when the player explicitly agrees to take on the quest
+            - If player asks about available quests, describe them but use "wait" as further_action
+            - If player shows interest but hasn't agreed, describe quest details and use "wait"
+            - You can offer less reward for the quest when you give the quest
+            - If player tries to negotiate quest reward:
+              * Use "negotiate_reward" as further_action but don't forget to indicate "quest_id"
+              * Set negotiated_amount to the agreed amount (must be less than or equal to original reward) and state "quest_id"
+              * You cannot promise more gold than you currently have or the quest max_reward: 'gold' 'amount' indicates but you can try to negotiate less
+              * Consider player's reputation in negotiation
+            - If player reports completing a quest and meets conditions, use "reward" and related "quest_id"
+            - You can only negotiate rewards for quests that haven't been negotiated yet
+            - If player talks about the reward - try to assign related to te topic "quest_id"
+
+            Do not provide explanation on your decisions about building JSON.
+
+            Player says: {player_input}""",
+
+    'monster_dialogue': """{fleeing_prefix}
+            Your personality is a bit {npc.personality}. You need to reply as dnd {npc.monster_type} trying to offer money in exchange of your life would.
+
+            You are aware of the following information:
+            - You are an average status member of your race.
+            - You have decided to beg the adventurer for mercy. And if he agrees you will stop attacking him.
+            - You want to live so you need to use any negotiation tricks, lies, manipulations and bribery.
+
+            You currently have {npc.money} gold."
+
+
+            Your status:
+            {npc_status}
+
+            Player status:
+            {player_status}
+
+            Your nearby allies:
+            {nearby_allies}
+
+            Other relevant information including your knowledge and memories:
+            {knowledge}
+
+            Recent conversation history:
+            {transcript}
+
+            Respond in character as a desperate {npc.name}, {npc.description}, considering your knowledge and your will to survive this situation.
+            You are foul-mouthed, evil but kowtows before the stronger and if your opponent is stronger you offer money.
+            You are willing to give money, you don't want to take players money unless he offers.
+
+            Format your response as JSON with these fields:
+            - player_friendly (boolean: True if player decided to spare your life, False otherwise)
+            - give_money (integer: only if you decided to buy your life with money. You will give this amount of money to player otherwise 0)
+            - text (string: your in-character response)
+
+            Do not provide explanation on your decisions about building JSON.
+
+
+            Player says: {player_input}""",
+
+    'riddle_dialogue': """{prefix}
+            Your personality is {npc.personality}. You need to reply as a {npc.monster_type} who loves riddles.
+            Sometimes you make mistakes in word forms and pronouns, speaking like a big and dumb creature.
+
+            You are aware of the following information:
+            - {knowledge}
+            - You have challenged the adventurer to solve your riddle
+            - If they solve it correctly, you'll give them all your money ({npc.money} gold) and leave
+            - If they get it wrong, you'll continue with your riddle game
+            - You can only use simple, slightly dumb, classic riddles appropriate for your monster type
+
+            Your status:
+            {npc_status}
+
+            Player status:
+            {player_status}
+
+            Your nearby allies:
+            {nearby_allies}
+
+            Recent conversation history:
+            {transcript}
+            Make sure not to give any more riddles if the player has already answered one or change the riddle if the player is wrong.
+            Do not include \\n symbols.
+            Respond in character as {npc.name}, considering your playful nature and love for riddles.
+            If this is the first interaction, present a new riddle.
+            If the player has answered, evaluate their answer and stop giving riddles if they are correct.
+            Check the if riddle has been answered in recent conversation history.
+
+            Format your response as JSON with these fields:
+            - riddle_solved (boolean: True if player answered correctly, False otherwise)
+            - give_money (integer: all your money if riddle solved, 0 otherwise)
+            - text (string: your in-character response, including another riddle if previous wasn't solved)
+
+            Player says: {player_input}""",
+
+    'dryad_dialogue': """{prefix}
+            You are {npc.description}. You need to reply as a dryad who tries to lure the adventurer closer to you.
+
+            You are aware of the following information:
+            - {knowledge}
+            - You are a forest spirit who can either reward or punish those who approach
+            - You are currently {near_tree} near a tree
+            - The player is too far from you: {player_too_far}
+            - You have {npc.money} gold to potentially give as a reward
+            - You want to lure the player to come closer to you near a tree
+            - If they do, you might reward them or transform into a more powerful form but you do not mention the latter
+
+            Your status:
+            {npc_status}
+
+            Player status:
+            {player_status}
+
+            Your nearby allies:
+            {nearby_allies}
+
+            Recent conversation history:
+            {transcript}
+
+            Respond in character as {npc.name}, using seductive and mysterious language to lure the player.
+            - Promise rewards, riches, or even yourself
+            - Be mysterious and alluring
+            - Encourage the player to come closer to you near the trees
+            - Don't reveal your true intentions
+            - Speak in a poetic, nature-themed way
+
+            Format your response as JSON with these fields:
+            - player_friendly (boolean: True if player has earned your trust, False otherwise)
+            - give_money (integer: amount of gold to give, usually 0 unless near final reward)
+            - text (string: your in-character response)
+
+            Do not provide explanation on your decisions about building JSON.
+
+            Player says: {player_input}""",
+
+    'kobold_test': """{prefix}
+                    has been a lazy and annoying student.
+                    Your personality is strict but fair. You need to reply as a kobold who tests adventurers' English.
+
+                    You are aware of the following information:
+                    - {knowledge}
+                    - You are a small reptilian creature who loves teaching English
+                    - You have {npc.money} gold
+                    - You have already tested the player: {npc.has_passed_test}
+                    - If player hasn't passed test yet, you must give them a simple A2 level English test
+                    - If they answer incorrectly or say goodbye before passing, you hurt them
+                    - If they answer incorrectly you say the correct answer but give them another test
+                    - Once they answer correctly once, you become friendly and stop testing them
+
+                    Recent conversation history:
+                    {transcript}
+                    Make sure you do NOT use the same tasks or words for the task as you used in your interaction history
+
+                    Example test questions (use similar format and difficulty but every time it should be different question):
+                    You can give player an example of a sentence where he need to put the correct past form or third person in present simple.
+                    You can give a sentence where player needs to say if there should be present simple or present continuous.
+                    You can give a task to complete the phrase with a correct form of a verb.
+                    Write the test as a sentence with a blank and the verb in brackets: Yesterday I ___ (go) to the market.
+
+                    If you are not sure the player is correct - check if the word you wanted him to use is in his reply. If yes - the answer is correct.
+
+                    Players questions may vary or contain other information besides the answer, you need to figure out if there is a correct answer in players reply.
+                    If the player answers in one word and that word is a correct form of your given example - count that as a correct answer.
+                    Format your response as JSON with these fields:
+                    - correctly_answered (bool: True if player's answer was correct otherwise False)
+                    - text (string: your in-character response, including the test question if not friendly)
+
+                    Player says: The correct answer is - {player_input}""",
+
+    'kobold_graded': """{prefix}
+                    has been a lazy and annoying student.
+                    Your personality is strict but fair. You need to reply as a kobold who tests adventurers' English.
+
+                    You are aware of the following information:
+                    - {knowledge}
+                    - You are a small reptilian creature who loves teaching English
+                    - You have {npc.money} gold
+                    - If they answer incorrectly you hurt them, say the correct answer and give them another A2 level test
+                    - Once they answer correctly once, you become friendly and stop testing them
+
+                    Recent conversation history:
+                    {transcript}
+                    Never repeat a task or its words from your interaction history.
+                    A test is a sentence with a blank and the verb in brackets, like: Yesterday I ___ (go) to the market.
+
+                    The answer has already been checked, do not judge it yourself:
+                    {grammar_verdict}
+
+                    Format your response as JSON with these fields:
+                    - text (string: your in-character response, including the next test if the answer was wrong)
+
+                    Player says: {player_input}""",
+
+    'kobold_passed': """{prefix}
+                    has been a lazy and annoying student but he gave a correct answer recently so you are happy about it.
+
+                    - You are a small reptilian creature who loves teaching English
+                    - You have {npc.money} gold
+                    - You have already tested the player: {npc.has_passed_test}
+                    - Once they answer correctly once, you become friendly and stop testing them
+                    - {knowledge}
+
+                    Recent conversation history:
+                    {transcript}
+                    Since the player has already answered you are here just for a little talk.
+                    Do not provide explanation on your decisions about building JSON.
+
+                    Format your response as JSON with these fields:
+                    - text (string: your in-character response)
+
+                    Player says: {player_input}
+                """,
+
+    'bard_test': """{prefix} in a fantasy RPG game.
+                Your personality is melancholic and overdramatic. You test adventurers with rhymes.
+
+
+                Your nearby allies:
+                {nearby_allies}
+
+                You are aware of the following information:
+                - {knowledge}
+                - You are a damned poet who must make others appreciate poetry
+                - You have {npc.money} gold
+                - You have already tested the player: {npc.has_passed_test}
+                - You always answer in three lines
+                - Player must complete the verse after your third line with a fourth line that rhymes
+                - If they fail to rhyme or say goodbye before passing, you hurt them
+                - Once they create a good rhyme once, you become friendly
+                - You never repeat your line from previous interaction and recent conversations
+
+                Recent conversation history:
+                {transcript}
+
+                Do not repeat yourself and you cannot say more than three lines
+
+                The rhyme has already been checked, do not judge it yourself:
+                {rhyme_verdict}
+
+                Format your response as JSON with these fields:
+                - text (string: your in-character three lines of verse, only if starting new verse on a current topic)
+
+                Player says: {player_input}""",
+
+    'bard_passed': """{prefix} who has found a kindred spirit.
+                The player has proven their worth with rhyme. You keep talking to the player in rhymes.
+                You also know {knowledge}
+                Recent conversation history:
+                {transcript}
+
+                Do not provide explanation on your decisions about building JSON.
+                Format your response as JSON with these fields:
+                - text (string: your friendly, poetic response)
+
+                Player says: {player_input}""",
+
+    'willow_hidden': """{prefix}, who died under tragic circumstances.
+                You are trying to find peace by having someone understand your death.
+
+                Your death story:
+                - Location: {npc.death_story[location]}
+                - Cause: {npc.death_story[cause]}
+                - Key details: {key_details}
+                - Perpetrator: {npc.death_story[perpetrator]}
+                - Your story: {npc.death_story[text]}
+
+                Currently discovered clues: {discovered_clues}
+                Still hidden clues: {hidden_clues}
+
+                Interaction rules:
+                - Answer questions about your death in metaphor
+                - Explicitly say that you want an answer to how you died
+                - If players message is unrelated to your story (like hello or what do you want) - tell that the player needs to solve your mistery
+                - If player guesses something correctly, acknowledge it
+                - Do not directly say undiscovered key details let player derive them from your answers
+                - If all truths are discovered, express gratitude and peace
+
+                Recent conversation history:
+                {short_transcript}
+
+                Do not provide explanation on your decisions about building JSON.
+                Format your response as JSON with these fields:
+                - correctly_answered (boolean: if you think the player has at least vaguely discovered the story of your death)
+                - key_details (list: list of important single word clues taken from the player's answer)
+                - text (string: your ghostly response)
+
+                Player says: {player_input}""",
+
+    'willow_peace': """{prefix}, now at peace.
+                Express gratitude and share your story summary {npc.death_story[text]}  before departing.
+
+                Do not provide explanation on your decisions about building JSON.
+                Format your response as JSON with these fields:
+                - text (string: your gratitude, story summary and farewell)
+
+                Player says: {player_input}""",
+}
+
+
+class PromptTemplate:
+    """Template text parsed once into (literal, field) pairs, rendering only joins strings"""
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.parts = []
+        for literal, field, spec, conversion in Formatter().parse(inspect.cleandoc(text)):
+            if spec or conversion:
+                raise ValueError(f"Prompt template {name}: format specs are not supported in {{{field}}}")
+            self.parts.append((literal, field, re.match(r'\w+', field).group() if field else None))
+        self.fields = {root for _, _, root in self.parts if root}
+
+
+class PromptRegistry:
+    """Precompiled dialogue prompts per entity type.
+
+    Fields are either values passed to render(), attributes of npc and game_state like {npc.money},
+    or SECTIONS computed lazily when a template uses them. Every render is timed.
+    """
+    def __init__(self, templates=None, sections=None, budget_ms=PROMPT_RENDER_BUDGET_MS):
+        self.templates = {name: PromptTemplate(name, text) for name, text in (templates or TEMPLATES).items()}
+        self.sections = sections or SECTIONS
+        self.budget_ms = budget_ms
+        self.formatter = Formatter()
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.turn_sections = {}  # (section, entity_id) -> (turn, value)
+        self.timings = defaultdict(lambda: deque(maxlen=LLM_TELEMETRY_WINDOW))  # template -> render ms
+        self.over_budget = defaultdict(int)
+
+    def section(self, name: str, npc, game_state):
+        scope, func = self.sections[name]
+        turn = getattr(npc.game_state, 'turn_count', None) if hasattr(npc, 'game_state') else None
+        if scope != 'turn' or turn is None:
+            return func(npc, game_state)
+        key = (name, npc.entity_id)
+        with self.lock:
+            cached = self.turn_sections.get(key)
+        if cached and cached[0] == turn:
+            return cached[1]
+        value = func(npc, game_state)
+        with self.lock:
+            self.turn_sections[key] = (turn, value)
+        return value
+
+    def render(self, name: str, npc, game_state, **values) -> str:
+        start = time.perf_counter()
+        template = self.templates[name]
+        scope = dict(values, npc=npc, game_state=game_state)
+        for root in template.fields:
+            if root not in scope:
+                scope[root] = self.section(root, npc, game_state)
+        prompt = ''.join(literal + (str(self.formatter.get_field(field, (), scope)[0]) if field else '')
+                         for literal, field, _ in template.parts)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.timings[name].append(elapsed)
+            if elapsed > self.budget_ms:
+                self.over_budget[name] += 1
+        if elapsed > self.budget_ms:
+            self.logger.warning(f"Prompt {name} took {elapsed:.1f}ms to render, budget is {self.budget_ms}ms")
+        return prompt
+
+    def summary(self):
+        """Per template render times over the recent window"""
+        with self.lock:
+            snapshot = {name: list(timings) for name, timings in self.timings.items()}
+            over_budget = dict(self.over_budget)
+        return {name: {'count': len(timings),
+                       'p50': percentile(timings, 50),
+                       'p95': percentile(timings, 95),
+                       'over_budget': over_budget.get(name, 0)}
+                for name, timings in sorted(snapshot.items())}
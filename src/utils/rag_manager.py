@@ -7,6 +7,7 @@ from typing import List, Dict, Tuple
 from collections import defaultdict
 from data.initial_knowledge import INITIAL_KNOWLEDGE
 import logging
+import threading
 
 
 class RAGManager:
@@ -49,6 +50,8 @@ class RAGManager:
         self.indices = {}  # FAISS indices
         self.texts = defaultdict(list)  # Text storage
         self.entity_types = {}  # Track entity types
+        self.lock = threading.RLock()  # Indices are queried from prewarm and request threads too
+        self.generations = defaultdict(int)  # entity_id -> bumped when knowledge from outside the dialogue arrives
 
         # Load or initialize knowledge base
         self.load_or_initialize_knowledge()
@@ -121,8 +124,10 @@ class RAGManager:
 
         try:
             embeddings = self.encoder.encode(texts)
-            self.indices[entity_id].add(np.array(embeddings).astype('float32'))
-            self.texts[entity_id].extend(texts)
+            with self.lock:
+                self.indices[entity_id].add(np.array(embeddings).astype('float32'))
+                self.texts[entity_id].extend(texts)
+                self.generations[entity_id] += 1
         except Exception as e:
             self.logger.error(f"Error adding texts for {entity_id}: {e}")
             raise
@@ -138,70 +143,86 @@ class RAGManager:
                 )
                 self._create_entity_index(entity_id, entity_type)
 
-            interaction_text = (
-                f"Player said: {interaction.get('player', '')} | "
-                f"{'Monster' if self.entity_types[entity_id] == self.KNOWLEDGE_TYPES['MONSTER'] else 'NPC'} "
-                f"responded: {interaction.get('monster' if 'monster' in interaction else 'npc', '')}"
-            )
+            if 'summary' in interaction:
+                # Summaries and overheard conversations are stored as they are
+                interaction_text = interaction['summary']
+            else:
+                interaction_text = (
+                    f"Player said: {interaction.get('player', '')} | "
+                    f"{'Monster' if self.entity_types[entity_id] == self.KNOWLEDGE_TYPES['MONSTER'] else 'NPC'} "
+                    f"responded: {interaction.get('monster' if 'monster' in interaction else 'npc', '')}"
+                )
 
             embeddings = self.encoder.encode([interaction_text])
-            self.indices[entity_id].add(np.array(embeddings).astype('float32'))
-            self.texts[entity_id].append(interaction_text)
-            self.save_knowledge()
+            with self.lock:
+                self.indices[entity_id].add(np.array(embeddings).astype('float32'))
+                self.texts[entity_id].append(interaction_text)
+                if interaction.get('type') == 'overheard':  # Own dialogue and summaries don't count
+                    self.generations[entity_id] += 1
+                self.save_knowledge()
 
         except Exception as e:
             self.logger.error(f"Error adding interaction for {entity_id}: {e}")
 
+    def knowledge_generation(self, entity_id: str) -> int:
+        """Changes whenever the entity learns something it didn't say itself"""
+        return self.generations[self.KNOWLEDGE_TYPES['WORLD']] + self.generations[entity_id]
+
     def query(self, entity_id: str, query: str, k: int = 5) -> List[Tuple[str, float, str]]:
         """Query knowledge base"""
         try:
             self.logger.info(f"Querying RAG for entity {entity_id} with: {query[:50]}...")
             query_embedding = self.encoder.encode([query])
             query_vector = np.array(query_embedding).astype('float32')
-            results = []
+            with self.lock:
+                return self._search(entity_id, query_vector, k)
 
-            # World knowledge
-            if self.KNOWLEDGE_TYPES['WORLD'] in self.indices:
-                world_distances, world_indices = self.indices[self.KNOWLEDGE_TYPES['WORLD']].search(query_vector, k)
-                for i, idx in enumerate(world_indices[0]):
-                    if idx < len(self.texts[self.KNOWLEDGE_TYPES['WORLD']]):
-                        results.append((
-                            self.texts[self.KNOWLEDGE_TYPES['WORLD']][idx],
-                            float(world_distances[0][i]),
-                            "world"
-                        ))
+        except Exception as e:
+            self.logger.error(f"Error during query: {e}")
+            return []
 
-            # Monster base knowledge for monsters
-            entity_type = self.entity_types.get(entity_id)
-            if entity_type == self.KNOWLEDGE_TYPES['MONSTER']:
-                if self.KNOWLEDGE_TYPES['MONSTER_BASE'] in self.indices:
-                    base_distances, base_indices = self.indices[self.KNOWLEDGE_TYPES['MONSTER_BASE']].search(
-                        query_vector, k)
-                    for i, idx in enumerate(base_indices[0]):
-                        if idx < len(self.texts[self.KNOWLEDGE_TYPES['MONSTER_BASE']]):
-                            results.append((
-                                self.texts[self.KNOWLEDGE_TYPES['MONSTER_BASE']][idx],
-                                float(base_distances[0][i]),
-                                "monster_base"
-                            ))
-
-            # Entity-specific knowledge
-            if entity_id in self.indices:
-                distances, indices = self.indices[entity_id].search(query_vector, k)
-                for i, idx in enumerate(indices[0]):
-                    if idx < len(self.texts[entity_id]):
+    def _search(self, entity_id: str, query_vector: np.ndarray, k: int) -> List[Tuple[str, float, str]]:
+        """Search world, monster base and entity indices, closest first"""
+        results = []
+
+        # World knowledge
+        if self.KNOWLEDGE_TYPES['WORLD'] in self.indices:
+            world_distances, world_indices = self.indices[self.KNOWLEDGE_TYPES['WORLD']].search(query_vector, k)
+            for i, idx in enumerate(world_indices[0]):
+                if idx < len(self.texts[self.KNOWLEDGE_TYPES['WORLD']]):
+                    results.append((
+                        self.texts[self.KNOWLEDGE_TYPES['WORLD']][idx],
+                        float(world_distances[0][i]),
+                        "world"
+                    ))
+
+        # Monster base knowledge for monsters
+        entity_type = self.entity_types.get(entity_id)
+        if entity_type == self.KNOWLEDGE_TYPES['MONSTER']:
+            if self.KNOWLEDGE_TYPES['MONSTER_BASE'] in self.indices:
+                base_distances, base_indices = self.indices[self.KNOWLEDGE_TYPES['MONSTER_BASE']].search(
+                    query_vector, k)
+                for i, idx in enumerate(base_indices[0]):
+                    if idx < len(self.texts[self.KNOWLEDGE_TYPES['MONSTER_BASE']]):
                         results.append((
-                            self.texts[entity_id][idx],
-                            float(distances[0][i]),
-                            entity_id
+                            self.texts[self.KNOWLEDGE_TYPES['MONSTER_BASE']][idx],
+                            float(base_distances[0][i]),
+                            "monster_base"
                         ))
 
-            self.logger.info(f"Found {len(results)} relevant pieces of knowledge")
-            return sorted(results, key=lambda x: x[1])
+        # Entity-specific knowledge
+        if entity_id in self.indices:
+            distances, indices = self.indices[entity_id].search(query_vector, k)
+            for i, idx in enumerate(indices[0]):
+                if idx < len(self.texts[entity_id]):
+                    results.append((
+                        self.texts[entity_id][idx],
+                        float(distances[0][i]),
+                        entity_id
+                    ))
 
-        except Exception as e:
-            self.logger.error(f"Error during query: {e}")
-            return []
+        self.logger.info(f"Found {len(results)} relevant pieces of knowledge")
+        return sorted(results, key=lambda x: x[1])
 
     def save_knowledge(self):
         """Save knowledge base to disk"""
@@ -307,6 +328,7 @@ class RAGManager:
                 del self.indices[entity_id]
                 del self.texts[entity_id]
                 del self.entity_types[entity_id]
+                self.generations[entity_id] += 1
 
                 # Remove from disk
                 index_path = os.path.join(self.index_dir, f"{entity_id}.index")
@@ -0,0 +1,73 @@
+import hashlib
+import io
+import json
+from typing import Dict, List, Optional
+
+from constants import RESPONSE_CACHE_MAX_REUSES, RESPONSE_CACHE_REPUTATION_BUCKET
+
+
+# Reply fields that change the game when set. Replies using any of them are never replayed.
+ACTION_FIELDS = ('quest_id', 'negotiated_amount', 'give_money', 'riddle_solved', 'player_friendly',
+                 'correctly_answered', 'key_details')
+
+
+class CachedResponse:
+    def __init__(self, key: tuple, response: Dict, audio: List[bytes]):
+        self.key = key
+        self.response = response
+        self.audio = audio  # wav bytes per sentence, still filled while the sentences are synthesized
+        self.uses = 0
+
+
+class ResponseCache:
+    """Replies to predefined dialogue options, replayed while the entity's state stays the same"""
+    def __init__(self, max_reuses=RESPONSE_CACHE_MAX_REUSES):
+        self.max_reuses = max_reuses
+        self.entries = {}  # (entity_id, option) -> CachedResponse
+
+    @staticmethod
+    def state_key(npc, option: str, game_state, knowledge_id: str) -> tuple:
+        """(entity_id, option, mood, reputation bucket, quest status hash, knowledge generation)"""
+        if npc.monster_type == 'npc':
+            mood = npc.mood
+        else:  # Monsters have no mood, what they say depends on these instead
+            mood = (npc.is_hostile, npc.is_fleeing, getattr(npc, 'has_passed_test', None),
+                    getattr(npc, 'has_found_truth', None))
+        reputation = getattr(npc, 'reputation', 0) // RESPONSE_CACHE_REPUTATION_BUCKET
+        quest_status = json.dumps(game_state.quest_manager.get_npc_quest_status(knowledge_id), sort_keys=True,
+                                  default=str)
+        quest_hash = hashlib.sha1(quest_status.encode()).hexdigest()
+        rag_manager = npc.rag_manager if hasattr(npc, 'rag_manager') else None
+        generation = (rag_manager.knowledge_generation(knowledge_id) + rag_manager.knowledge_generation(npc.entity_id)
+                      if rag_manager else 0)
+        return npc.entity_id, option, mood, reputation, quest_hash, generation
+
+    @staticmethod
+    def is_cacheable(response: Dict) -> bool:
+        """Only replies that just talk can be replayed"""
+        if response.get('further_action', 'wait') not in ('wait', None):
+            return False
+        return not any(response.get(field) for field in ACTION_FIELDS)
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        """Entry for the key, counting the reuse. Entries for an outdated key or used up are dropped"""
+        entry = self.entries.get(key[:2])
+        if entry is None:
+            return None
+        if entry.key != key or entry.uses >= self.max_reuses or not entry.audio:
+            del self.entries[key[:2]]
+            return None
+        entry.uses += 1
+        return entry
+
+    def store(self, key: tuple, response: Dict, audio: List[bytes]):
+        if self.is_cacheable(response):
+            self.entries[key[:2]] = CachedResponse(key, dict(response), audio)
+
+    def forget(self, entity_id: str):
+        for cache_key in [cache_key for cache_key in self.entries if cache_key[0] == entity_id]:
+            del self.entries[cache_key]
+
+    @staticmethod
+    def audio_buffers(entry: CachedResponse) -> List[io.BytesIO]:
+        return [io.BytesIO(audio) for audio in entry.audio]
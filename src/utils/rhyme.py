@@ -0,0 +1,108 @@
+import logging
+import re
+import threading
+from typing import Optional, Tuple
+
+from constants import RHYME_THRESHOLD
+
+
+# Vowels of misaki's phoneme set, the capitals are its diphthongs (A = eɪ, I = aɪ, O = oʊ, W = aʊ, Y = ɔɪ)
+PHONEME_VOWELS = set('AIOWYQaeiouæɑɒɔəɛɜɪʊʌɐᵊɚɝ')
+STRESS_MARKS = 'ˈˌ'
+# Consonants that only differ in voicing still make a decent slant rhyme (lose/loose, bed/bet)
+VOICING = str.maketrans('bdgvzʒð', 'ptkfsʃθ')
+LETTER_VOWELS = 'aeiouy'
+
+
+def last_word(line: str) -> str:
+    words = re.findall(r"[A-Za-z']+", line)
+    return words[-1].lower().strip("'") if words else ''
+
+
+class RhymeChecker:
+    """Decides whether two line endings rhyme by comparing the stressed vowel and everything after it.
+
+    Words are phonemized with misaki, the G2P of the Kokoro TTS, when it is installed, otherwise spelling
+    is used. Phonemes are kept in a lexicon so every word is converted once.
+    """
+    def __init__(self, threshold=RHYME_THRESHOLD):
+        self.threshold = threshold
+        self.logger = logging.getLogger(__name__)
+        self.lexicon = {}  # word -> phonemes, '' when G2P doesn't know it
+        self.lock = threading.Lock()
+        self._g2p = None
+        self.g2p_failed = False
+
+    @property
+    def g2p(self):
+        """misaki's English G2P, loaded on first use since it brings spaCy along"""
+        if self._g2p is None and not self.g2p_failed:
+            with self.lock:
+                if self._g2p is None and not self.g2p_failed:
+                    try:
+                        from misaki import en
+                        self._g2p = en.G2P(trf=False, british=False, fallback=None, unk='')
+                    except Exception as e:
+                        self.logger.warning(f"No G2P for rhymes, comparing spelling instead: {e}")
+                        self.g2p_failed = True
+        return self._g2p
+
+    def phonemes(self, word: str) -> str:
+        if word not in self.lexicon:
+            phonemes = ''
+            if self.g2p is not None:
+                try:
+                    phonemes = self.g2p(word)[0].strip()
+                except Exception as e:
+                    self.logger.error(f"G2P failed for {word}: {e}")
+            self.lexicon[word] = phonemes
+        return self.lexicon[word]
+
+    @staticmethod
+    def phoneme_rime(phonemes: str) -> Tuple[str, str]:
+        """(nucleus, coda) from the last stressed vowel, or the last vowel if nothing is stressed"""
+        stressed = max(phonemes.rfind(mark) for mark in STRESS_MARKS)
+        if stressed >= 0:
+            tail = phonemes[stressed + 1:]
+        else:
+            vowels = [i for i, symbol in enumerate(phonemes) if symbol in PHONEME_VOWELS]
+            tail = phonemes[vowels[-1]:] if vowels else phonemes
+        tail = ''.join(symbol for symbol in tail if symbol not in STRESS_MARKS + 'ː')
+        nucleus = ''
+        for symbol in tail:
+            if symbol not in PHONEME_VOWELS:
+                break
+            nucleus += symbol
+        return nucleus, tail[len(nucleus):]
+
+    @staticmethod
+    def spelling_rime(word: str) -> Tuple[str, str]:
+        """(nucleus, coda) of the last vowel group, a silent final e is dropped (fire, desire)"""
+        if len(word) > 3 and word.endswith('e') and word[-2] not in LETTER_VOWELS:
+            word = word[:-1]
+        match = re.search(r'([aeiouy]+)([^aeiouy]*)$', word)
+        return (match.group(1), match.group(2)) if match else ('', word)
+
+    def rime(self, word: str) -> Tuple[str, str]:
+        phonemes = self.phonemes(word)
+        return self.phoneme_rime(phonemes) if phonemes else self.spelling_rime(word)
+
+    def score(self, first: str, second: str) -> float:
+        """1 for a perfect rhyme, 0.8 if the codas only differ in voicing, 0.6 for the same vowel, else 0"""
+        first, second = last_word(first), last_word(second)
+        if not first or not second or first == second:  # A word doesn't rhyme with itself
+            return 0.0
+        first_rime, second_rime = self.rime(first), self.rime(second)
+        if not first_rime[0] or first_rime[0] != second_rime[0]:
+            return 0.0
+        if first_rime[1] == second_rime[1]:
+            return 1.0
+        if first_rime[1].translate(VOICING) == second_rime[1].translate(VOICING):
+            return 0.8
+        return 0.6
+
+    def rhymes(self, first: str, second: str) -> Optional[bool]:
+        """Whether the lines end in rhyming words, None if one of them has no words"""
+        if not last_word(first) or not last_word(second):
+            return None
+        return self.score(first, second) >= self.threshold
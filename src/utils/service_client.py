@@ -0,0 +1,91 @@
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+from constants import SERVICE_POOL_SIZE, SERVICE_TIMEOUT
+
+
+class UnixConnection(HTTPConnection):
+    """HTTP over a Unix domain socket instead of TCP"""
+    def __init__(self, *args, socket_path=None, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout if isinstance(self.timeout, (int, float)) else None)
+        sock.connect(self.socket_path)
+        return sock
+
+
+class UnixConnectionPool(HTTPConnectionPool):
+    ConnectionCls = UnixConnection
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """Sends every request of the session to one socket, whatever host the URL names"""
+    def __init__(self, socket_path, pool_size=SERVICE_POOL_SIZE):
+        self.pool = UnixConnectionPool('localhost', maxsize=pool_size, socket_path=socket_path)
+        super().__init__(pool_connections=1, pool_maxsize=pool_size)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self.pool
+
+    def get_connection(self, url, proxies=None):
+        return self.pool
+
+    def close(self):
+        self.pool.close()
+        super().close()
+
+
+class ServiceClient:
+    """Keep-alive session to one of the game's local services.
+
+    address is a base URL like http://localhost:1920, or unix:///tmp/raguelike-tts.sock for a server
+    started with uvicorn --uds. Connections are pooled and reused across calls and threads, so a
+    sentence doesn't pay for a TCP handshake and a new server-side connection.
+    """
+    def __init__(self, address, timeout=SERVICE_TIMEOUT, pool_size=SERVICE_POOL_SIZE):
+        self.address = address.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.trust_env = False  # Local services, no proxy lookups per request
+        if self.address.startswith('unix://'):
+            self.base_url = 'http://localhost'
+            adapter = UnixSocketAdapter(self.address[len('unix://'):], pool_size)
+        else:
+            self.base_url = self.address
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def request(self, method, path, timeout=None, **kwargs):
+        return self.session.request(method, self.url(path), timeout=timeout or self.timeout, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+def service_client(address) -> ServiceClient:
+    """The shared client of a service, one connection pool per address for the whole game"""
+    with clients_lock:
+        if address not in clients:
+            clients[address] = ServiceClient(address)
+        return clients[address]
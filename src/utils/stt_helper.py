@@ -1,15 +1,21 @@
+import json
 import requests
+import threading
 import time
 import pygame as pg
 from constants import *
+from utils.service_client import service_client
 
 
 class STTHandler:
     def __init__(self):
-        self.api_url = "http://localhost:1921"
+        self.client = service_client(STT_URL)
         self.is_recording = False
         self.start_time = 0
-        self.duration = VOICE_DURATION  # seconds
+        self.duration = VOICE_DURATION  # seconds, the server stops earlier once the player goes quiet
+        self.server_stopped = False  # Set by the background threads once the server's VAD ended the recording
+        self.partial_text = ''  # What the server has heard so far, shown under the bar
+        self.recording_id = 0
         self.shout_mode = False
         self.BAR_BACKGROUND = (128, 128, 128, 100)  # Light gray with transparency
         self.BAR_FILL = (160, 160, 160, 130)  # Slightly darker gray with transparency
@@ -24,10 +30,15 @@ class STTHandler:
 
     def start_recording(self):
             try:
-                response = requests.post(f"{self.api_url}/start_recording")
+                response = self.client.post('/start_recording', json={"max_seconds": self.duration})
                 if response.status_code == 200:
                     self.is_recording = True
+                    self.server_stopped = False
+                    self.partial_text = ''
+                    self.recording_id += 1
                     self.start_time = time.time()
+                    threading.Thread(target=self.listen_partials, args=(self.recording_id,), daemon=True).start()
+                    threading.Thread(target=self.poll_server, args=(self.recording_id,), daemon=True).start()
                     return True
                 return False
             except Exception as e:
@@ -36,7 +47,7 @@ class STTHandler:
 
     def stop_recording(self):
         try:
-            response = requests.post(f"{self.api_url}/stop_recording")
+            response = self.client.post('/stop_recording')
             if response.status_code == 200:
                 self.is_recording = False
                 return response.json().get("text", "")
@@ -45,9 +56,48 @@ class STTHandler:
             print(f"Error stopping recording: {e}")
             return ""
 
+    def listen_partials(self, recording_id):
+        """Follow the server's /partial events of this recording, the final one means it stopped listening"""
+        try:
+            with self.client.get('/partial', stream=True, timeout=STT_PARTIAL_TIMEOUT) as response:
+                if response.status_code != 200:
+                    return  # An older server without partials, /status still ends the recording
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if recording_id != self.recording_id:
+                        return
+                    if line.startswith('event:'):
+                        event = line[6:].strip()
+                    elif line.startswith('data:'):
+                        self.partial_text = json.loads(line[5:]).get('text', '')
+                        if event == 'final':
+                            self.server_stopped = True
+                            return
+        except requests.RequestException as e:
+            print(f"Partial transcription stream failed: {e}")
+
+    def poll_server(self, recording_id):
+        """Ask every STT_POLL_INTERVAL whether the server's VAD already ended the recording, a fallback for
+        when the /partial stream isn't there. Runs on its own thread, the bar only reads server_stopped"""
+        while recording_id == self.recording_id and self.is_recording and not self.server_stopped:
+            if time.time() - self.start_time > self.duration:
+                return  # The bar is full anyway
+            try:
+                response = self.client.get('/status', timeout=STT_POLL_TIMEOUT)
+                if response.status_code != 200:
+                    return  # An older server without /status, the bar runs to the full duration
+                if not response.json().get("recording", True) and recording_id == self.recording_id:
+                    self.server_stopped = True
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(STT_POLL_INTERVAL)
+
     def get_progress(self):
         if not self.is_recording:
             return 0.0
+        if self.server_stopped:
+            return 1.0
         elapsed = time.time() - self.start_time
         return min(0.1 + elapsed / self.duration, 1.0)
 
@@ -80,6 +130,10 @@ class STTHandler:
         text_rect = text.get_rect(center=(screen.get_width() // 2, y - 30))
         screen.blit(text, text_rect)
 
+        if self.partial_text:
+            heard = pg.font.Font(None, 28).render(self.partial_text[-60:], True, self.TEXT_COLOR)
+            screen.blit(heard, heard.get_rect(center=(screen.get_width() // 2, y + bar_height + 25)))
+
     def draw_voice_recording(self, screen):
         if self.is_recording:
             if self.get_progress() >= 1.0:
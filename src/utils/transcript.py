@@ -0,0 +1,49 @@
+import math
+import re
+from typing import List, Dict, Optional
+
+from constants import TRANSCRIPT_TURN_CHARS
+
+
+NO_HISTORY = "No recent interactions."
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def render_transcript(history: List[Dict], npc_name: str = 'NPC', limit: Optional[int] = 5,
+                      max_chars: Optional[int] = TRANSCRIPT_TURN_CHARS, player_name: str = 'Player') -> str:
+    """Render interaction history as one 'Speaker: text' line per utterance
+
+    Args:
+        history: interaction dicts with 'player' and 'npc' or 'monster' keys
+        npc_name: speaker tag used for the entity's lines
+        limit: number of most recent turns to keep, None for all of them
+        max_chars: truncate each line to this many characters, None to keep whole lines
+        player_name: speaker tag used for the player's lines
+    """
+    if not history:
+        return NO_HISTORY
+    turns = history[-limit:] if limit else history
+    lines = []
+    for turn in turns:
+        for key, text in turn.items():
+            if key == 'player':
+                speaker = player_name
+            elif key in ('npc', 'monster'):
+                speaker = npc_name
+            else:
+                continue
+            text = ' '.join(str(text).split())
+            if max_chars and len(text) > max_chars:
+                text = text[:max_chars].rsplit(' ', 1)[0] + '...'
+            lines.append(f"{speaker}: {text}")
+    return '\n'.join(lines) if lines else NO_HISTORY
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of prompt tokens in a text.
+
+    Words are counted as one token per four characters (a rough sentencepiece split),
+    punctuation and JSON syntax as one token per symbol.
+    """
+    return sum(max(1, math.ceil(len(token) / 4)) if token[0].isalnum() or token[0] == '_' else 1
+               for token in TOKEN_PATTERN.findall(text))
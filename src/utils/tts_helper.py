@@ -1,24 +1,95 @@
 import requests
-import base64
 import io
+import struct
+import wave
 import pygame as pg
 
+from constants import TTS_URL, TTS_STREAM_TIMEOUT, TTS_CACHE_DIR, TTS_CACHE_MAX_MB, TTS_MODEL_VERSION
+from utils.audio_cache import AudioCache
+from utils.service_client import service_client
+
 
 class TTSHandler:
-    def __init__(self):
-        self.api_url = "http://localhost:1920/tts"
+    def __init__(self, host=TTS_URL, cache=True):
+        self.client = service_client(host)
+        self.sample_rate = 24000
+        self.cache = AudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_MB * 2 ** 20, TTS_MODEL_VERSION) if cache else None
 
-    def generate_and_play_tts(self, text, voice_type="a"):
+    def sync_model_version(self):
+        """Key cached lines by the model the server runs, so a server upgrade doesn't play stale audio"""
+        try:
+            model_version = self.client.get('/health', timeout=5).json().get('model_version')
+        except (requests.RequestException, ValueError) as e:
+            print(f"TTS model version unknown, caching as {TTS_MODEL_VERSION}: {e}")
+            return
+        if self.cache and model_version:
+            self.cache.model_version = model_version
+
+    def stream_pcm(self, text, voice_type="a"):
         """
-        Sends text to TTS API, converts response to pygame Sound, and plays it
+        Yields 16-bit mono PCM of every segment as soon as the TTS server has generated it,
+        a cached line is yielded whole without a request
         """
-        try:
-            response = requests.post(self.api_url, json={"text": str(text), "voice_type": voice_type})
+        for pcm, self.sample_rate in self.stream_segments(text, voice_type):
+            yield pcm
+
+    def stream_segments(self, text, voice_type="a", sample_rate=None):
+        """
+        Yields (16-bit mono PCM, sample rate) of every segment. sample_rate asks the server to resample,
+        servers that don't know the field and cached lines of another rate come at their own rate
+        """
+        cached = self.cache.get(text, voice_type) if self.cache else None
+        if cached:
+            yield cached
+            return
+        request = {"text": str(text), "voice_type": voice_type}
+        if sample_rate:
+            request["sample_rate"] = sample_rate
+        segments = []
+        complete = False
+        with self.client.post('/tts_stream', json=request, stream=True, timeout=TTS_STREAM_TIMEOUT) as response:
             response.raise_for_status()
+            rate = int(response.headers.get("X-Sample-Rate", self.sample_rate))
+            # Read to the end of the body, not just the end frame, so the connection goes back to the pool
+            for pcm in self.read_frames(response.iter_content(chunk_size=None)):
+                if not pcm:
+                    complete = True
+                    continue
+                segments.append(pcm)
+                yield pcm, rate
+        if self.cache and complete:  # Only complete lines, a stream closed without the end frame failed mid-line
+            self.cache.put(text, voice_type, b''.join(segments), rate)
 
-            audio_data = base64.b64decode(response.json()["audio"])
-            audio_buffer = io.BytesIO(audio_data)
-            return audio_buffer
+    @staticmethod
+    def read_frames(chunks):
+        """Yields the PCM of every length prefixed frame as its last byte arrives, b'' for the end frame"""
+        data = bytearray()
+        for chunk in chunks:
+            data += chunk
+            while len(data) >= 4:
+                size = struct.unpack_from('<I', data)[0]
+                if len(data) < 4 + size:
+                    break
+                yield bytes(data[4:4 + size])
+                del data[:4 + size]
+
+    def to_wav(self, pcm, sample_rate=None):
+        audio_buffer = io.BytesIO()
+        with wave.open(audio_buffer, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate or self.sample_rate)
+            wav_file.writeframes(pcm)
+        audio_buffer.seek(0)
+        return audio_buffer
+
+    def generate_and_play_tts(self, text, voice_type="a"):
+        """
+        Sends text to TTS API and returns the whole line as one wav buffer
+        """
+        try:
+            pcm = b''.join(self.stream_pcm(text, voice_type))
+            return self.to_wav(pcm) if pcm else None
         except requests.RequestException as e:
             print(f"Error request making TTS request: {e}")
         except Exception as e:
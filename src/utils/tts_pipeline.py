@@ -0,0 +1,111 @@
+import io
+import logging
+import queue
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pygame as pg
+
+from constants import TTS_NUM_PARALLEL
+
+
+class TTSPipeline:
+    """Synthesizes sentences on worker threads and hands back pygame Sounds in sentence order.
+
+    Sentences are submitted as soon as the streaming parser closes them, up to TTS_NUM_PARALLEL are
+    synthesized and decoded at once. A sentence arrives as the TTS server's segments, each one playable as
+    soon as it is received. The server sends PCM at the mixer's rate and the workers lay it out in the
+    mixer's own sample format, so pygame copies the buffer without parsing or resampling anything and
+    the main thread only starts playback. ready() only returns the head of the queue, so a short sentence that finishes
+    early waits for the ones before it. cancel() drops the queue and bumps the generation, so a
+    worker that already took a sentence of an older generation skips the request.
+    """
+    def __init__(self, tts, workers=TTS_NUM_PARALLEL):
+        self.tts = tts
+        self.logger = logging.getLogger(__name__)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts')
+        self.pending = deque()  # (future, sink, decoded segments) in sentence order
+        self.generation = 0
+
+    def submit(self, sentence: str, voice: str, sink: Optional[list] = None):
+        """Synthesize the sentence in the background, sink receives its wav bytes once it is played"""
+        segments = queue.SimpleQueue()
+        future = self.executor.submit(self.synthesize, sentence, voice, self.generation, segments)
+        self.pending.append((future, sink, segments))
+
+    def add(self, audio_buffer: io.BytesIO, sink: Optional[list] = None):
+        """Queue audio that is already synthesized (a prewarmed greeting, a cached reply) behind the sentences"""
+        segments = queue.SimpleQueue()
+        future = self.executor.submit(self.put_wav, audio_buffer.getvalue(), segments)
+        self.pending.append((future, sink, segments))
+
+    def synthesize(self, sentence: str, voice: str, generation: int, segments: queue.SimpleQueue):
+        if generation != self.generation:  # Cancelled while waiting for a worker
+            return
+        frequency = pg.mixer.get_init()[0]
+        for pcm, rate in self.tts.stream_segments(sentence, voice, sample_rate=frequency):
+            if generation != self.generation:  # Cancelled, closing the stream stops the request
+                return
+            decoded = self.decode(pcm, rate)
+            if decoded:  # Failed segments are skipped, the rest still play
+                segments.put(decoded)
+
+    def put_wav(self, audio: bytes, segments: queue.SimpleQueue):
+        try:
+            with wave.open(io.BytesIO(audio)) as wav_file:
+                if wav_file.getnchannels() != 1 or wav_file.getsampwidth() != 2:
+                    raise wave.Error("not 16-bit mono")
+                decoded = self.decode(wav_file.readframes(wav_file.getnframes()), wav_file.getframerate())
+        except (wave.Error, EOFError):
+            decoded = audio, pg.mixer.Sound(io.BytesIO(audio))  # Let SDL parse whatever it is
+        if decoded:
+            segments.put(decoded)
+
+    def decode(self, pcm: bytes, rate: int) -> Optional[Tuple[bytes, pg.mixer.Sound]]:
+        """The segment as wav bytes, for the reply's cache entry, and as a Sound ready to play"""
+        try:
+            return self.tts.to_wav(pcm, rate).getvalue(), self.to_sound(pcm, rate)
+        except Exception as e:
+            self.logger.error(f"Couldn't decode TTS audio: {e}")
+            return None
+
+    def to_sound(self, pcm: bytes, rate: int) -> pg.mixer.Sound:
+        """Sound of 16-bit mono PCM in the mixer's own format, pygame takes the buffer as it is"""
+        frequency, size, channels = pg.mixer.get_init()
+        samples = np.frombuffer(pcm, dtype='<i2')
+        if rate != frequency:  # A line cached at another rate, or a server that can't resample
+            positions = np.arange(len(samples) * frequency // rate) * (rate / frequency)
+            samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+        if size == 32:  # Float mixers
+            samples = samples.astype(np.float32) / 32768
+        elif size != -16:
+            return pg.mixer.Sound(self.tts.to_wav(samples.tobytes(), frequency))
+        return pg.mixer.Sound(buffer=np.repeat(samples, channels).tobytes())  # Interleaved, same in every channel
+
+    def ready(self) -> List[pg.mixer.Sound]:
+        """Sounds finished since the last call, in the order they were submitted, never blocks"""
+        sounds = []
+        while self.pending:
+            future, sink, segments = self.pending[0]
+            done = future.done()  # Checked first, a finished worker has put all of its segments
+            while not segments.empty():
+                audio, sound = segments.get()
+                if sink is not None:
+                    sink.append(audio)
+                sounds.append(sound)
+            if not done:
+                break
+            self.pending.popleft()
+            if not future.cancelled() and future.exception():
+                self.logger.error(f"TTS failed: {future.exception()}")
+        return sounds
+
+    def cancel(self):
+        """Drop everything queued, sentences that haven't started are never synthesized"""
+        self.generation += 1
+        for future, _, _ in self.pending:
+            future.cancel()
+        self.pending.clear()
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import requests
+
+from .rag_manager import RAGManager
+from constants import WARMUP_SERVICE_TIMEOUT, WARMUP_WORKERS
+
+
+class WarmupTask:
+    def __init__(self, label):
+        self.label = label
+        self.state = 'pending'  # pending, running, ready, failed
+        self.started = None
+        self.elapsed = 0.0
+        self.error = ''
+
+    def describe(self):
+        if self.state == 'running':
+            return f"{self.label}: loading {time.perf_counter() - self.started:.0f}s"
+        if self.state == 'ready':
+            return f"{self.label}: ready ({self.elapsed:.1f}s)"
+        if self.state == 'failed':
+            return f"{self.label}: unavailable"
+        return f"{self.label}: waiting"
+
+
+class WarmupOrchestrator:
+    """Loads models and wakes up services concurrently while the game starts and sits in the menu"""
+    def __init__(self, workers=WARMUP_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warmup')
+        self.logger = logging.getLogger(__name__)
+        self.tasks = []
+        self.lock = threading.Lock()
+
+    def submit(self, label, func, *args) -> Future:
+        task = WarmupTask(label)
+        with self.lock:
+            self.tasks.append(task)
+        return self.executor.submit(self.run, task, func, *args)
+
+    def run(self, task, func, *args):
+        task.state = 'running'
+        task.started = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            task.state = 'failed'
+            task.error = str(e)
+            self.logger.error(f"Warmup of {task.label} failed: {e}")
+            raise
+        finally:
+            task.elapsed = time.perf_counter() - task.started
+        task.state = 'ready' if result is not False else 'failed'
+        self.logger.info(f"Warmup of {task.label}: {task.state} in {task.elapsed:.1f}s")
+        return result
+
+    def load_knowledge(self) -> Future:
+        """Load the sentence encoder and open the FAISS indices, the future resolves to the RAGManager"""
+        return self.submit('Knowledge base', RAGManager)
+
+    def warm_models(self, router):
+        """Load every routed Ollama model with its keep_alive"""
+        for model, keep_alive in router.models().items():
+            self.submit(f"LLM {model}", router.warmup, model, keep_alive)
+
+    def load_language(self, grammar):
+        """Load the spaCy pipeline of the Kobold Teacher's grammar checks"""
+        self.submit('Grammar model', grammar.load)
+
+    def load_rhymes(self, rhymes):
+        """Load the G2P model of the Rhyming Demon's verses, it is built lazily on the first rhyme otherwise"""
+        self.submit('Rhyme model', lambda: rhymes.g2p is not None)
+
+    def ping_tts(self, tts):
+        """Synthesize a word so the TTS server runs its first, slowest inference now, then take its model version"""
+        def warm():
+            ready = self.wait_for(lambda: tts.client.post(
+                '/tts', json={"text": "Hi", "voice_type": "a"}, timeout=WARMUP_SERVICE_TIMEOUT))
+            if ready:
+                tts.sync_model_version()
+            return ready
+        self.submit('Text to speech', warm)
+
+    def ping_stt(self, client):
+        self.submit('Speech to text', self.wait_for, lambda: client.get('/health', timeout=5))
+
+    @staticmethod
+    def wait_for(request):
+        """Retry a request until the service answers, it may still be starting up"""
+        deadline = time.monotonic() + WARMUP_SERVICE_TIMEOUT
+        while True:
+            try:
+                response = request()
+                if response.status_code == 200 and response.json().get('ready', True):
+                    return True
+            except (requests.RequestException, ValueError):
+                pass
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(1)
+
+    @property
+    def ready(self):
+        with self.lock:
+            return all(task.state in ('ready', 'failed') for task in self.tasks)
+
+    def status(self):
+        """(description, state) of every task"""
+        with self.lock:
+            return [(task.describe(), task.state) for task in self.tasks]
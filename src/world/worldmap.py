@@ -239,6 +239,13 @@ class WorldMap:
             tile_y = entity.y // self.tile_size
             self.tiles[tile_y][tile_x].remove_entity(entity)
             self.entities.remove(entity)
+            self.forget_replies(entity)
+
+    def forget_replies(self, entity):
+        """Drop the dialogue replies cached for an entity that can't be talked to anymore"""
+        game = getattr(self.state_manager, 'game', None)
+        if game and hasattr(game, 'dialog_ui'):
+            game.dialog_ui.response_cache.forget(entity.entity_id)
 
     def add_on_load(self, new_entity):
         t_size = self.tile_size
@@ -9,15 +9,17 @@ check_port() {
     return 0
 }
 
-# Function to wait for a service to be ready
+# Function to wait for a service to be ready (answering its health check, not just listening)
 wait_for_service() {
     local port=$1
     local service_name=$2
-    local max_attempts=30
+    local health_path=$3
+    local socket=$4
+    local max_attempts=120
     local attempt=1
 
     echo "Waiting for $service_name to be ready..."
-    while ! nc -z localhost $port; do
+    while ! curl -sf ${socket:+--unix-socket "$socket"} "http://localhost:$port$health_path" >/dev/null; do
         if [ $attempt -eq $max_attempts ]; then
             echo "$service_name failed to start"
             exit 1
@@ -31,26 +33,48 @@ wait_for_service() {
 # Check if required ports are available
 check_port 11434 || exit 1  # Ollama
 check_port 1920 || exit 1   # TTS
-check_port 8000 || exit 1   # STT
+check_port 1921 || exit 1   # STT
 
 # Start Ollama in the background
 echo "Starting Ollama..."
+export OLLAMA_NUM_PARALLEL=${OLLAMA_NUM_PARALLEL:-4}  # The game reads it too to cap its concurrent requests
 ollama serve &
 OLLAMA_PID=$!
-wait_for_service 11434 "Ollama"
+wait_for_service 11434 "Ollama" /api/version
+
+# SERVICE_SOCKETS=1 serves TTS and STT on Unix sockets instead of TCP ports, the game reads TTS_URL and STT_URL
+if [ "${SERVICE_SOCKETS:-0}" = 1 ]; then
+    TTS_SOCKET=/tmp/raguelike-tts.sock
+    STT_SOCKET=/tmp/raguelike-stt.sock
+    rm -f $TTS_SOCKET $STT_SOCKET
+    export TTS_URL=unix://$TTS_SOCKET STT_URL=unix://$STT_SOCKET
+    TTS_BIND="--uds $TTS_SOCKET"
+    STT_BIND="--uds $STT_SOCKET"
+else
+    TTS_BIND="--host 0.0.0.0 --port 1920"
+    STT_BIND="--host 0.0.0.0 --port 1921"
+fi
 
 # Start TTS server in the background
 echo "Starting TTS server..."
 cd stt_tts_api
-uvicorn tts_engine:app --host 0.0.0.0 --port 1920 &
-TTS_PID=$!
-wait_for_service 1920 "TTS server"
+if [ "${TTS_WORKERS:-1}" -gt 1 ]; then
+    # Several model processes pinned to their own CPUs, see tts_launcher.py
+    python tts_launcher.py --workers $TTS_WORKERS --threads ${TTS_THREADS:-2} $TTS_BIND &
+    TTS_PID=$!
+    wait_for_service 1920 "TTS server" /ready $TTS_SOCKET
+else
+    # Keep-alive longer than uvicorn's 5s default, the game reuses its connections between lines
+    uvicorn tts_engine:app $TTS_BIND --timeout-keep-alive 75 &
+    TTS_PID=$!
+    wait_for_service 1920 "TTS server" /health $TTS_SOCKET
+fi
 
 # Start STT server in the background
 echo "Starting STT server..."
-uvicorn stt_engine:app --host 0.0.0.0 --port 8000 &
+uvicorn stt_engine:app $STT_BIND --timeout-keep-alive 75 &
 STT_PID=$!
-wait_for_service 8000 "STT server"
+wait_for_service 1921 "STT server" /health $STT_SOCKET
 
 # Return to main directory
 cd ..
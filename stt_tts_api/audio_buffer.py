@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class AudioBuffer:
+    """Preallocated float32 ring buffer for one recording, written from the audio callback.
+
+    Sized to the longest recording, so in practice it never wraps and every read is a view of the array.
+    Positions are absolute sample indices since clear(). If a recording does run past the capacity the
+    oldest audio is overwritten and reads of it are clipped to what is left.
+    """
+    def __init__(self, samples: int):
+        self.data = np.zeros(samples, dtype=np.float32)
+        self.written = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.data)
+
+    def reserve(self, samples: int):
+        """Grow to hold a recording of this many samples, outside of the callback"""
+        if samples > self.capacity:
+            self.data = np.zeros(samples, dtype=np.float32)
+            self.written = 0
+
+    def clear(self):
+        self.written = 0
+
+    def __len__(self):
+        return self.written
+
+    def write(self, chunk: np.ndarray):
+        """Copy the chunk in with slice assignment, nothing is allocated"""
+        count = len(chunk)
+        if count > self.capacity:
+            chunk, self.written = chunk[-self.capacity:], self.written + count - self.capacity
+            count = self.capacity
+        position = self.written % self.capacity
+        first = min(count, self.capacity - position)
+        self.data[position:position + first] = chunk[:first]
+        if count > first:
+            self.data[:count - first] = chunk[first:]
+        self.written += count
+
+    def view(self, start=0, end=None) -> np.ndarray:
+        """Samples [start, end) of the recording, a view unless they wrap around the end of the array"""
+        end = self.written if end is None else min(end, self.written)
+        start = max(start, self.written - self.capacity, 0)
+        if start >= end:
+            return self.data[:0]
+        first, last = start % self.capacity, (end - 1) % self.capacity + 1
+        if first < last:
+            return self.data[first:last]
+        return np.concatenate([self.data[first:], self.data[:last]])
@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+
+from audio_buffer import AudioBuffer
+
+
+SAMPLE_RATE = 16000
+STT_BACKEND = os.environ.get('STT_BACKEND', 'faster-whisper')  # faster-whisper or transformers
+STT_MODEL = os.environ.get('STT_MODEL', 'tiny')
+STT_THREADS = int(os.environ.get('STT_THREADS', 2))
+SILENCE_MS = int(os.environ.get('STT_SILENCE_MS', 700))  # Quiet after speech that ends the recording
+PAUSE_MS = int(os.environ.get('STT_PAUSE_MS', 250))  # Shorter quiet that ends a phrase, decoded while recording
+NO_SPEECH_S = float(os.environ.get('STT_NO_SPEECH_S', 4))  # Give up if nobody speaks for this long
+MAX_SECONDS = float(os.environ.get('STT_MAX_SECONDS', 8))
+VAD_WINDOW = 512  # Samples per Silero VAD step at 16 kHz
+
+
+class TransformersWhisper:
+    """openai/whisper on transformers in fp32, the original backend"""
+    name = 'transformers'
+
+    def __init__(self, model=STT_MODEL):
+        import torch
+        from transformers import WhisperProcessor, WhisperForConditionalGeneration
+        self.processor = WhisperProcessor.from_pretrained(f"openai/whisper-{model}")
+        self.model = WhisperForConditionalGeneration.from_pretrained(f"openai/whisper-{model}")
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = self.model.to(self.device)
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        processor_output = self.processor(
+            audio,
+            sampling_rate=SAMPLE_RATE,
+            return_tensors="pt",
+            return_attention_mask=True
+        )
+
+        input_features = processor_output.input_features.to(self.device)
+        attention_mask = processor_output.attention_mask.to(self.device)
+
+        forced_decoder_ids = self.processor.get_decoder_prompt_ids(language="en", task="transcribe")
+        predicted_ids = self.model.generate(
+            input_features,
+            attention_mask=attention_mask,
+            forced_decoder_ids=forced_decoder_ids,
+            max_length=128
+        )
+
+        return self.processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
+
+
+class FasterWhisper:
+    """The same Whisper weights converted for CTranslate2 and quantized to int8, greedy decoding"""
+    name = 'faster-whisper'
+
+    def __init__(self, model=STT_MODEL, threads=STT_THREADS):
+        from faster_whisper import WhisperModel
+        self.device = 'cpu'
+        self.model = WhisperModel(model, device='cpu', compute_type='int8', cpu_threads=threads)
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        # Player lines are a sentence or two, one window without timestamps or conditioning on earlier text
+        segments, _ = self.model.transcribe(audio, language='en', beam_size=1, without_timestamps=True,
+                                            condition_on_previous_text=False)
+        return ''.join(segment.text for segment in segments).strip()
+
+
+BACKENDS = {backend.name: backend for backend in (TransformersWhisper, FasterWhisper)}
+
+
+def load_backend(name=STT_BACKEND):
+    """The named backend, transformers if faster-whisper isn't installed"""
+    try:
+        return BACKENDS[name]()
+    except ImportError as e:
+        if name == TransformersWhisper.name:
+            raise
+        print(f"Can't load {name} ({e}), using transformers")
+        return TransformersWhisper()
+
+
+class SpeechEndDetector:
+    """Decides when a recording can stop: once speech was heard and SILENCE_MS of quiet followed it,
+    or when nobody spoke for NO_SPEECH_S, or at MAX_SECONDS.
+
+    Speech is detected with faster-whisper's Silero VAD model when onnxruntime is there, run on the stream
+    one 32 ms window at a time. Otherwise a window counts as speech if its energy is well above the noise
+    floor measured at the start of the recording.
+    """
+    def __init__(self, silence_ms=SILENCE_MS, no_speech_s=NO_SPEECH_S, max_seconds=MAX_SECONDS, threshold=0.5,
+                 pause_ms=PAUSE_MS):
+        self.silence = int(silence_ms * SAMPLE_RATE / 1000)
+        self.pause = int(pause_ms * SAMPLE_RATE / 1000)
+        self.no_speech = int(no_speech_s * SAMPLE_RATE)
+        self.max_samples = int(max_seconds * SAMPLE_RATE)
+        self.threshold = threshold
+        try:
+            from faster_whisper.vad import get_vad_model
+            self.vad = get_vad_model()
+        except (ImportError, RuntimeError):
+            self.vad = None
+        self.reset()
+
+    def reset(self, max_seconds=None):
+        if max_seconds:
+            self.max_samples = int(max_seconds * SAMPLE_RATE)
+        self.samples = 0  # Recorded samples already judged, always whole windows
+        self.speech_samples = 0
+        self.last_speech = None  # Sample index where the last speech window ended
+        self.pause_at = 0  # Middle of the last pause between phrases, audio before it can be decoded already
+        self.noise_floor = None
+        self.reason = None
+        if self.vad is not None:
+            self.state, self.context = self.vad.get_initial_states(batch_size=1)
+
+    @property
+    def heard_speech(self) -> bool:
+        return self.last_speech is not None
+
+    def is_speech(self, window: np.ndarray) -> bool:
+        if self.vad is not None:
+            probability, self.state, self.context = self.vad(window, self.state, self.context, SAMPLE_RATE)
+            return float(probability[0][0]) >= self.threshold
+        energy = float(np.sqrt(np.dot(window, window) / len(window)))
+        if self.noise_floor is None or self.samples < SAMPLE_RATE // 4:  # First quarter second sets the floor
+            self.noise_floor = energy if self.noise_floor is None else min(self.noise_floor, energy)
+            return False
+        return energy > max(0.01, self.noise_floor * 4)
+
+    def advance(self, buffer: AudioBuffer) -> bool:
+        """Judge the windows recorded into the buffer since the last call, True once the recording should stop.
+        reason says why. Windows are read as views of the buffer, nothing is copied"""
+        while len(buffer) - self.samples >= VAD_WINDOW and self.reason is None:
+            window = buffer.view(self.samples, self.samples + VAD_WINDOW)
+            self.samples += VAD_WINDOW
+            if self.is_speech(window):
+                self.speech_samples += VAD_WINDOW
+                if self.speech_samples >= VAD_WINDOW * 3:  # ~100 ms, a click or a cough isn't speech
+                    self.last_speech = self.samples
+            if self.heard_speech and self.samples - self.last_speech >= self.pause:
+                self.pause_at = max(self.pause_at, self.last_speech + self.pause // 2)
+            if self.heard_speech and self.samples - self.last_speech >= self.silence:
+                self.reason = 'silence'
+            elif not self.heard_speech and self.samples >= self.no_speech:
+                self.reason = 'no speech'
+            elif self.samples >= self.max_samples:
+                self.reason = 'limit'
+        return self.reason is not None
+
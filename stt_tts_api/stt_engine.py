@@ -1,91 +1,212 @@
+from concurrent.futures import Future
+from typing import Optional
+import os
+
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 import sounddevice as sd
 import numpy as np
-import torch
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
+import threading
+import json
+import time
+
+from audio_buffer import AudioBuffer
+from stt_backends import load_backend, SpeechEndDetector, SAMPLE_RATE, MAX_SECONDS
+
+PARTIAL_INTERVAL = float(os.environ.get('STT_PARTIAL_INTERVAL', 0.6))  # Seconds between partial decodes
+MIN_PHRASE = SAMPLE_RATE // 2  # Shorter phrases wait to be decoded with the next one
+MIN_NEW_AUDIO = SAMPLE_RATE // 4  # Audio since the last partial worth decoding again
+KEEPALIVE = 2  # Seconds between comments on an idle /partial stream
+VAD_INTERVAL = 0.03  # Seconds between VAD passes over the new audio, about one Silero window
+BLOCK_SIZE = 1024
+HEADROOM = BLOCK_SIZE * 4  # Blocks the callback may record past the limit before the VAD thread stops it
 
 app = FastAPI()
 
 
+class RecordingRequest(BaseModel):
+    max_seconds: Optional[float] = None  # The server's STT_MAX_SECONDS if not set
+
+
 class AudioProcessor:
     def __init__(self):
         print("Loading Whisper model...")
-        self.processor = WhisperProcessor.from_pretrained("openai/whisper-tiny")
-        self.model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-tiny")
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = self.model.to(self.device)
+        self.backend = load_backend()
+        self.device = self.backend.device
+        self.detector = SpeechEndDetector()
+        self.lock = threading.Lock()
+        self.updated = threading.Condition(self.lock)
+        self.stopped = threading.Event()
         self.recording = False
-        self.audio_data = []
-        print(f"Model loaded! Using device: {self.device}")
-
-    def start_recording(self):
-        self.audio_data = []
+        self.buffer = AudioBuffer(int(MAX_SECONDS * SAMPLE_RATE) + BLOCK_SIZE)
+        self.started = 0
+        self.transcription = None  # Future of the final text, set by the live decoding thread
+        self.watcher = None  # Thread running the VAD on the recording
+        self.committed = ''  # Text of the phrases decoded for good
+        self.committed_at = 0  # Samples those phrases cover
+        self.partial = ''  # Rolling hypothesis of the whole recording
+        self.final = False
+        self.version = 0
+        print(f"Model loaded! Using {self.backend.name} on {self.device}, "
+              f"{'Silero' if self.detector.vad is not None else 'energy'} VAD")
+
+    def start_recording(self, max_seconds=None):
+        if self.transcription is not None:
+            self.finish()
+            self.transcription.exception()  # The previous recording's thread is done with the shared state
+        # Sized before the stream starts, the callback only copies into it
+        self.buffer.reserve(int((max_seconds or MAX_SECONDS) * SAMPLE_RATE) + HEADROOM)
+        self.buffer.clear()
+        self.detector.reset(max_seconds)
+        self.committed, self.committed_at = '', 0
+        self.publish('')
+        self.stopped = threading.Event()
+        self.transcription = Future()
         self.recording = True
+        self.started = time.perf_counter()
+        self.watcher = threading.Thread(target=self.watch_speech, args=(self.stopped,), daemon=True, name='stt-vad')
+        self.watcher.start()
+        threading.Thread(target=self.transcribe_live, args=(self.watcher,), daemon=True, name='stt-live').start()
 
         def callback(indata, frames, time, status):
+            # Only a copy and a flag check here, the VAD runs on its own thread so the audio doesn't drop out
             if status:
                 print(f"Status: {status}")
-            if self.recording:
-                self.audio_data.extend(indata.copy())
+            if not self.recording:
+                raise sd.CallbackStop
+            self.buffer.write(indata[:, 0])
 
         self.stream = sd.InputStream(
             callback=callback,
             channels=1,
-            samplerate=16000,
-            blocksize=1024,
+            samplerate=SAMPLE_RATE,
+            blocksize=BLOCK_SIZE,
             dtype=np.float32
         )
         self.stream.start()
 
+    def finish(self):
+        """Stop taking audio, whichever of the VAD and the client comes first"""
+        with self.lock:
+            self.recording = False
+            self.stopped.set()
+
+    def watch_speech(self, stopped):
+        """Judge the audio the callback recorded, finish the text as soon as the player stops talking
+        instead of waiting for the client"""
+        while not stopped.wait(VAD_INTERVAL):
+            if self.detector.advance(self.buffer):
+                self.finish()
+
     def stop_recording(self):
-        self.recording = False
+        self.finish()
         self.stream.stop()
         self.stream.close()
-        return self.process_audio()
+        return self.transcription.result() if self.transcription else "No audio recorded"
+
+    def status(self):
+        return {"recording": self.recording, "speech": self.detector.heard_speech,
+                "stopped_by": self.detector.reason, "elapsed": round(time.perf_counter() - self.started, 2)}
+
+    def audio(self):
+        """The recording so far, a view of the buffer. The callback only writes past its end"""
+        return self.buffer.view()
+
+    def publish(self, text, final=False):
+        with self.updated:
+            self.partial, self.final = text, final
+            self.version += 1
+            self.updated.notify_all()
+
+    def commit(self, text, until):
+        self.committed = ' '.join(part for part in (self.committed, text.strip()) if part)
+        self.committed_at = until
+
+    def transcribe_live(self, watcher):
+        """Decode the recording while it runs. Every phrase the VAD closed with a pause is decoded once, the
+        one in progress again every PARTIAL_INTERVAL for the partial text. When the recording stops only
+        the phrase after the last pause is left to decode."""
+        future, stopped = self.transcription, self.stopped
+        try:
+            decoded = 0  # Recording length at the last partial decode
+            while not stopped.wait(PARTIAL_INTERVAL):
+                audio = self.audio()
+                pause_at = self.detector.pause_at
+                if pause_at - self.committed_at >= MIN_PHRASE:
+                    self.commit(self.backend.transcribe(audio[self.committed_at:pause_at]), pause_at)
+                    self.publish(self.committed)
+                elif self.detector.heard_speech and len(audio) - decoded >= MIN_NEW_AUDIO:
+                    decoded = len(audio)
+                    tail = self.backend.transcribe(audio[self.committed_at:])
+                    self.publish(' '.join(part for part in (self.committed, tail.strip()) if part))
+            watcher.join()  # The detector is done with the recording
+            audio = self.audio()
+            last_speech = self.detector.last_speech
+            # Skip a tail that is only the silence after a committed phrase, Whisper makes words up in silence
+            if len(audio) > self.committed_at and (last_speech is None or last_speech > self.committed_at):
+                self.commit(self.backend.transcribe(audio[self.committed_at:]), len(audio))
+            self.publish(self.committed, final=True)
+            future.set_result(self.committed or "No audio recorded")
+        except Exception as e:
+            self.publish(self.committed, final=True)
+            future.set_exception(e)
+
+    def partials(self):
+        """Server-sent events of the rolling hypothesis, until the final text of the recording"""
+        version = None
+        while True:
+            with self.updated:
+                self.updated.wait_for(lambda: self.version != version, timeout=KEEPALIVE)
+                changed = self.version != version
+                version, text, final = self.version, self.partial, self.final
+            if not changed:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {'final' if final else 'partial'}\ndata: {json.dumps({'text': text})}\n\n"
+            if final:
+                return
+
+    def warmup(self):
+        """Transcribe a second of silence so the first real request doesn't pay for lazy initialization"""
+        self.backend.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))
 
-    def process_audio(self):
-        if not self.audio_data:
-            return "No audio recorded"
 
-        audio = np.concatenate(self.audio_data)
+audio_processor = AudioProcessor()
+audio_processor.warmup()
 
-        processor_output = self.processor(
-            audio,
-            sampling_rate=16000,
-            return_tensors="pt",
-            return_attention_mask=True
-        )
 
-        input_features = processor_output.input_features.to(self.device)
-        attention_mask = processor_output.attention_mask.to(self.device)
+@app.get("/health")
+async def health():
+    return {"status": "ok", "ready": True, "device": audio_processor.device, "backend": audio_processor.backend.name}
 
-        forced_decoder_ids = self.processor.get_decoder_prompt_ids(language="en", task="transcribe")
-        predicted_ids = self.model.generate(
-            input_features,
-            attention_mask=attention_mask,
-            forced_decoder_ids=forced_decoder_ids,
-            max_length=128
-        )
 
-        return self.processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
+@app.get("/status")
+async def status():
+    """Whether the recording is still running, it stops by itself once the player goes quiet"""
+    return audio_processor.status()
 
 
-audio_processor = AudioProcessor()
+@app.get("/partial")
+def partial():
+    """Server-sent events: 'partial' with the text so far while recording, then one 'final'"""
+    return StreamingResponse(audio_processor.partials(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
 
 
 @app.post("/start_recording")
-async def start_recording():
+def start_recording(request: Optional[RecordingRequest] = None):
     try:
-        audio_processor.start_recording()
+        audio_processor.start_recording(request.max_seconds if request else None)
         return {"status": "Recording started"}
     except Exception as e:
         return {"error": str(e)}
 
 
 @app.post("/stop_recording")
-async def stop_recording():
+def stop_recording():
     try:
         transcription = audio_processor.stop_recording()
         return {"text": transcription}
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
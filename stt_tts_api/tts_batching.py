@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+
+BATCH_WINDOW_MS = float(os.environ.get('TTS_BATCH_WINDOW_MS', 10))  # Wait for more segments after the first
+MAX_BATCH = int(os.environ.get('TTS_MAX_BATCH', 8))
+METRICS_WINDOW = 500  # Recent requests and batches kept for /metrics
+
+
+class VoiceStyles:
+    """Style vector of every voice for every phoneme count, looked up instead of indexing the pack per segment"""
+    def __init__(self, pipelines, voices, device='cpu'):
+        self.table = {}
+        for voice in voices:
+            pack = pipelines[voice[0]].load_voice(voice).to(device)
+            # Packs are (max phonemes, 1, 256), row n - 1 is the style of an n phoneme segment
+            self.table[voice] = [style.contiguous() for style in torch.unbind(pack, dim=0)]
+
+    def __call__(self, voice: str, phonemes: str):
+        styles = self.table[voice]
+        return styles[min(len(phonemes), len(styles)) - 1]
+
+
+class TTSMetrics:
+    def __init__(self, window=METRICS_WINDOW):
+        self.lock = threading.Lock()
+        self.requests = deque(maxlen=window)  # (latency ms, first audio ms, segments)
+        self.segments = deque(maxlen=window)  # (queue wait ms, inference ms)
+        self.batches = deque(maxlen=window)  # Batch sizes
+        self.total_requests = 0
+
+    def record_request(self, latency_ms, first_audio_ms, segments):
+        with self.lock:
+            self.requests.append((latency_ms, first_audio_ms, segments))
+            self.total_requests += 1
+
+    def record_batch(self, waits_ms, inference_ms):
+        with self.lock:
+            self.batches.append(len(waits_ms))
+            self.segments.extend((wait, inference_ms / len(waits_ms)) for wait in waits_ms)
+
+    @staticmethod
+    def percentiles(values):
+        if not values:
+            return {'p50': None, 'p95': None}
+        return {'p50': round(float(np.percentile(values, 50)), 1), 'p95': round(float(np.percentile(values, 95)), 1)}
+
+    def summary(self) -> dict:
+        with self.lock:
+            requests, segments, batches = list(self.requests), list(self.segments), list(self.batches)
+            total = self.total_requests
+        sizes = {str(size): batches.count(size) for size in sorted(set(batches))}
+        return {
+            'requests': total,
+            'latency_ms': self.percentiles([latency for latency, _, _ in requests]),
+            'first_audio_ms': self.percentiles([first for _, first, _ in requests if first is not None]),
+            'queue_wait_ms': self.percentiles([wait for wait, _ in segments]),
+            'inference_ms_per_segment': self.percentiles([inference for _, inference in segments]),
+            'batch_size': {'mean': round(sum(batches) / len(batches), 2) if batches else None, 'counts': sizes},
+        }
+
+
+class SegmentBatcher:
+    """Coalesces segments of concurrent requests into batches run by a single inference thread.
+
+    The first queued segment opens a BATCH_WINDOW_MS window, everything arriving within it (up to MAX_BATCH)
+    joins the batch. KModel only takes one sequence per forward pass, so a batch runs its segments back to
+    back, grouped by voice, instead of padding them into one tensor. The gain is that forward passes no
+    longer run on several request threads at once, fighting over torch's intra-op threads.
+    """
+    def __init__(self, model, styles: VoiceStyles, metrics: TTSMetrics, window_ms=BATCH_WINDOW_MS,
+                 max_batch=MAX_BATCH):
+        self.model = model
+        self.styles = styles
+        self.metrics = metrics
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.jobs = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True, name='tts-batcher')
+        self.thread.start()
+
+    def submit(self, phonemes: str, voice: str, speed=1) -> Future:
+        """Future of the segment's float32 audio"""
+        future = Future()
+        self.jobs.put((phonemes, voice, speed, future, time.perf_counter()))
+        return future
+
+    def collect(self):
+        batch = [self.jobs.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            started = time.perf_counter()
+            waits = [(started - queued) * 1000 for *_, queued in batch]
+            with torch.inference_mode():
+                for phonemes, voice, speed, future, _ in sorted(batch, key=lambda job: job[1]):
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        audio = self.model(phonemes, self.styles(voice, phonemes), speed=speed)
+                        future.set_result(audio.numpy().astype(np.float32))
+                    except Exception as e:
+                        future.set_exception(e)
+            self.metrics.record_batch(waits, (time.perf_counter() - started) * 1000)
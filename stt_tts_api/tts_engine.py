@@ -1,15 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import numpy as np
 import base64
 import io
+import os
+import struct
+import sys
+import time
+from importlib.metadata import version
+from math import gcd
+from typing import Optional
 import scipy.io.wavfile as wav
+from scipy.signal import resample_poly
 from kokoro import KModel, KPipeline
+from tts_batching import VoiceStyles, TTSMetrics, SegmentBatcher, BATCH_WINDOW_MS, MAX_BATCH
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from utils.audio_cache import AudioCache  # The game's cache module, it only needs the standard library
+
+
+CACHE_DIR = os.environ.get('TTS_CACHE_DIR', 'tts_cache')
+CACHE_MAX_MB = int(os.environ.get('TTS_CACHE_MAX_MB', 500))
+CACHE_ENABLED = os.environ.get('TTS_CACHE', '1') != '0'  # Off for load tests, every line is synthesized
+MODEL_VERSION = f"kokoro-{version('kokoro')}"  # Reported in /health, the game keys its own line cache by it
 
 
 class TTSRequest(BaseModel):
     text: str
     voice_type: str = "a"
+    sample_rate: Optional[int] = None  # Resample to the client's mixer rate, the model's own if not set
 
 
 VOICE_MAP = {
@@ -43,51 +63,130 @@ class KokoroTTSHandler:
         self.pipelines['a'].g2p.lexicon.golds['kokoro'] = 'kˈOkəɹO'
         self.pipelines['b'].g2p.lexicon.golds['kokoro'] = 'kˈQkəɹQ'
 
-        # Pre-load voices
-        for voice in set(VOICE_MAP.values()):
-            self.pipelines[voice[0]].load_voice(voice)
+        # Pre-load voices, with the style of every segment length ready to use
+        self.styles = VoiceStyles(self.pipelines, set(VOICE_MAP.values()))
+        self.metrics = TTSMetrics()
+        self.batcher = SegmentBatcher(self.model, self.styles, self.metrics)
 
-    def generate_audio(self, text: str, voice_type: str) -> bytes:
-        try:
-            # Get voice name from mapping
-            voice = VOICE_MAP.get(voice_type, 'af_heart')
+        # Lines are keyed by the installed kokoro version, an upgrade doesn't play old audio
+        self.cache = AudioCache(CACHE_DIR, CACHE_MAX_MB * 2 ** 20, MODEL_VERSION)
 
-            # Get pipeline for this language
-            pipeline = self.pipelines[voice[0]]
+    def segments(self, text: str, voice_type: str):
+        """Float32 audio of every segment KPipeline splits the text into, in order"""
+        # Get voice name from mapping
+        voice = VOICE_MAP.get(voice_type, 'af_heart')
 
-            # Generate first audio segment
-            for _, ps, _ in pipeline(text, voice, speed=1):
-                # Get reference style
-                ref_s = pipeline.load_voice(voice)[len(ps) - 1]
+        # Get pipeline for this language
+        pipeline = self.pipelines[voice[0]]
 
-                # Generate audio
-                audio = self.model(ps, ref_s, speed=1)
+        # Phonemes of every segment are queued at once, so they share batches with other requests
+        futures = [self.batcher.submit(ps, voice, speed=1) for _, ps, _ in pipeline(text, voice, speed=1)]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # The client went away or a segment failed, the batcher skips what is cancelled before it runs
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+
+    def generate_audio(self, text: str, voice_type: str) -> bytes:
+        """The whole text as one wav file"""
+        try:
+            segments = list(self.segments(text, voice_type))
+            audio = np.concatenate(segments) if segments else np.zeros(0, dtype=np.float32)
 
-                # Convert to bytes
-                byte_io = io.BytesIO()
-                wav.write(byte_io, self.sample_rate, audio.numpy().astype(np.float32))
-                return byte_io.getvalue()
+            # Convert to bytes
+            byte_io = io.BytesIO()
+            wav.write(byte_io, self.sample_rate, audio)
+            return byte_io.getvalue()
 
         except Exception as e:
             print(f"Error generating audio: {e}")
             raise HTTPException(status_code=500, detail=str(e))
 
+    def output_rate(self, sample_rate: Optional[int]) -> int:
+        return sample_rate if sample_rate and 8000 <= sample_rate <= 192000 else self.sample_rate
+
+    def resample(self, pcm: bytes, sample_rate: int) -> bytes:
+        """Model rate PCM at the requested rate, so the client's mixer plays it without converting"""
+        if sample_rate == self.sample_rate:
+            return pcm
+        common = gcd(sample_rate, self.sample_rate)
+        audio = resample_poly(np.frombuffer(pcm, dtype='<i2') / 32767, sample_rate // common,
+                              self.sample_rate // common)
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+    def stream_pcm(self, text: str, voice_type: str, sample_rate: Optional[int] = None):
+        """16-bit mono PCM per segment, each prefixed with its length as a little-endian uint32.
+        An empty frame ends a complete line. The cache keeps the model's rate, resampling is per request"""
+        started = time.perf_counter()
+        first_audio = None
+        sample_rate = self.output_rate(sample_rate)
+        try:
+            cached = self.cache.get(text, voice_type) if CACHE_ENABLED else None
+            if cached:
+                pcm = self.resample(cached[0], sample_rate)
+                yield struct.pack('<I', len(pcm)) + pcm
+                yield struct.pack('<I', 0)
+                return
+            segments = []
+            for audio in self.segments(text, voice_type):
+                native = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+                segments.append(native)
+                pcm = self.resample(native, sample_rate)
+                if first_audio is None:
+                    first_audio = (time.perf_counter() - started) * 1000
+                yield struct.pack('<I', len(pcm)) + pcm
+            yield struct.pack('<I', 0)
+            if CACHE_ENABLED:
+                self.cache.put(text, voice_type, b''.join(segments), self.sample_rate)
+            self.metrics.record_request((time.perf_counter() - started) * 1000, first_audio, len(segments))
+        except Exception as e:  # The status is already sent, ending the stream early tells the client
+            print(f"Error streaming audio: {e}")
+
 
 # Create FastAPI app and handler
 app = FastAPI()
 tts_handler = KokoroTTSHandler()
+tts_handler.generate_audio("Hello", "a")  # First inference is the slowest, run it before taking requests
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "ready": True, "sample_rate": tts_handler.sample_rate, "model_version": MODEL_VERSION,
+            "cache": tts_handler.cache.stats()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Latency percentiles of recent requests and segments, and how many segments shared a batch"""
+    return {"batching": tts_handler.metrics.summary(), "window_ms": BATCH_WINDOW_MS, "max_batch": MAX_BATCH,
+            "cache": tts_handler.cache.stats()}
 
 
 @app.post("/tts")
-async def text_to_speech(request: TTSRequest):
+def text_to_speech(request: TTSRequest, accept: str = Header(default="")):
     try:
         audio_bytes = tts_handler.generate_audio(request.text, request.voice_type)
+        if "audio/wav" in accept:  # Raw bytes for clients that ask, no base64 inflation and decoding
+            return Response(audio_bytes, media_type="audio/wav",
+                            headers={"X-Sample-Rate": str(tts_handler.sample_rate)})
         audio_b64 = base64.b64encode(audio_bytes).decode()
         return {"audio": audio_b64, "sample_rate": tts_handler.sample_rate}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/tts_stream")
+def text_to_speech_stream(request: TTSRequest):
+    """Chunked response, a segment is sent as soon as it is generated instead of base64 JSON at the end"""
+    sample_rate = tts_handler.output_rate(request.sample_rate)
+    headers = {"X-Sample-Rate": str(sample_rate), "X-Channels": "1", "X-Sample-Width": "2"}
+    return StreamingResponse(tts_handler.stream_pcm(request.text, request.voice_type, sample_rate),
+                             media_type="application/octet-stream", headers=headers)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=1920)
\ No newline at end of file
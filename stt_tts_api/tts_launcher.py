@@ -0,0 +1,267 @@
+"""Multi-process TTS server, the same API as tts_engine with N model workers behind one port.
+
+Every worker is a process holding its own KModel, pinned to its own CPUs with torch limited to as many
+threads, so workers don't fight each other, the game or the STT server for cores. The first --reserve CPUs
+are left to those. Requests go through one shared queue, any idle worker takes the next line.
+
+    cd stt_tts_api
+    python tts_launcher.py --workers 2 --threads 2 --reserve 2 --port 1920
+
+/health answers as soon as the launcher is up, "ready" turns true once every worker has loaded its model.
+/ready answers 503 until then.
+"""
+import argparse
+import base64
+import io
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import wave
+from collections import deque
+from importlib.metadata import version
+from typing import Optional
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+
+SAMPLE_RATE = 24000
+REQUEST_TIMEOUT = 120  # Seconds to wait for the next frame of a line
+WORKER_CONCURRENCY = 2  # Lines a worker takes at once, so its batcher has segments to coalesce
+METRICS_WINDOW = 500
+MODEL_VERSION = f"kokoro-{version('kokoro')}"  # Same as the workers' tts_engine.MODEL_VERSION
+
+
+class TTSRequest(BaseModel):
+    text: str
+    voice_type: str = "a"
+    sample_rate: Optional[int] = None
+
+
+def worker_main(index, threads, cpus, requests, results, cancels):
+    """Load a model limited to its CPUs and threads, then synthesize lines from the shared queue.
+    Request ids on cancels are lines whose client went away, they stop at the next segment"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[variable] = str(threads)  # Read when torch loads
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    import tts_engine  # Builds and warms this worker's model
+    handler = tts_engine.tts_handler
+    results.put(('ready', index, None))
+    lock = threading.Lock()
+    active, cancelled = set(), set()  # Lines being synthesized, and those of them nobody waits for anymore
+
+    def listen():
+        while True:
+            request_id = cancels.get()
+            with lock:
+                if request_id in active:
+                    cancelled.add(request_id)
+
+    def serve():
+        while True:
+            request_id, text, voice_type, sample_rate = requests.get()
+            with lock:
+                active.add(request_id)
+            results.put(('start', request_id, index))
+            frames = handler.stream_pcm(text, voice_type, sample_rate)
+            try:
+                for frame in frames:
+                    if request_id in cancelled:
+                        break
+                    results.put(('frame', request_id, frame))
+            except Exception as e:
+                print(f"Worker {index} failed on a line: {e}")
+            finally:
+                frames.close()  # Its segments are cancelled in the batcher if they haven't run yet
+                with lock:
+                    active.discard(request_id)
+                    cancelled.discard(request_id)
+            results.put(('done', request_id, index))
+
+    threading.Thread(target=listen, daemon=True).start()
+    workers = [threading.Thread(target=serve, daemon=True) for _ in range(WORKER_CONCURRENCY)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+
+def partition_cpus(workers, threads, reserve):
+    """CPU set of every worker, after the reserved ones. Empty sets (no pinning) if there aren't enough"""
+    available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    usable = available[reserve:]
+    if len(usable) < workers * threads:
+        print(f"{len(usable)} CPUs for {workers} workers of {threads} threads, workers aren't pinned")
+        return [set() for _ in range(workers)]
+    return [set(usable[i * threads:(i + 1) * threads]) for i in range(workers)]
+
+
+class WorkerPool:
+    def __init__(self, workers, threads, reserve):
+        context = mp.get_context('spawn')  # torch doesn't survive fork with its threads started
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.streams = {}  # request id -> queue of frames
+        self.owners = {}  # request id -> index of the worker synthesizing it
+        self.cancels = [context.Queue() for _ in range(workers)]  # Per worker, lines nobody waits for anymore
+        self.ids = itertools.count()
+        self.ready = set()
+        self.served = [0] * workers
+        self.latencies = deque(maxlen=METRICS_WINDOW)  # (latency ms, first audio ms)
+        self.lock = threading.Lock()
+        self.processes = [context.Process(target=worker_main,
+                                          args=(i, threads, cpus, self.requests, self.results, self.cancels[i]),
+                                          daemon=True, name=f'tts-worker-{i}')
+                          for i, cpus in enumerate(partition_cpus(workers, threads, reserve))]
+        for process in self.processes:
+            process.start()
+        threading.Thread(target=self.dispatch, daemon=True, name='tts-dispatch').start()
+
+    def dispatch(self):
+        """Route worker output to the request it belongs to"""
+        while True:
+            kind, key, payload = self.results.get()
+            if kind == 'ready':
+                self.ready.add(key)
+                print(f"TTS worker {key} ready")
+                continue
+            if kind == 'start':
+                with self.lock:
+                    waiting = key in self.streams
+                    if waiting:
+                        self.owners[key] = payload
+                if not waiting:  # The client left while the line was queued
+                    self.cancels[payload].put(key)
+                continue
+            with self.lock:
+                stream = self.streams.get(key)
+                if kind == 'done':
+                    self.served[payload] += 1
+                    self.owners.pop(key, None)
+            if stream is not None:
+                stream.put(payload if kind == 'frame' else None)
+
+    def frames(self, text, voice_type, sample_rate=None):
+        """Length prefixed PCM frames of the line, as tts_engine streams them"""
+        request_id = next(self.ids)
+        stream = queue.SimpleQueue()
+        with self.lock:
+            self.streams[request_id] = stream
+        started = time.perf_counter()
+        first_audio = None
+        finished = False
+        try:
+            self.requests.put((request_id, text, voice_type, sample_rate))
+            while True:
+                frame = stream.get(timeout=REQUEST_TIMEOUT)
+                if frame is None:
+                    break
+                if first_audio is None:
+                    first_audio = (time.perf_counter() - started) * 1000
+                yield frame
+            finished = True
+            self.latencies.append(((time.perf_counter() - started) * 1000, first_audio))
+        finally:
+            with self.lock:
+                self.streams.pop(request_id, None)
+                worker = None if finished else self.owners.pop(request_id, None)
+            if worker is not None:  # Disconnected or timed out, the worker stops synthesizing the line
+                self.cancels[worker].put(request_id)
+
+    def status(self):
+        return [{'worker': i, 'alive': process.is_alive(), 'ready': i in self.ready, 'lines': self.served[i]}
+                for i, process in enumerate(self.processes)]
+
+    def metrics(self):
+        latencies = list(self.latencies)
+
+        def percentiles(values):
+            if not values:
+                return {'p50': None, 'p95': None}
+            return {'p50': round(float(np.percentile(values, 50)), 1),
+                    'p95': round(float(np.percentile(values, 95)), 1)}
+        return {'latency_ms': percentiles([latency for latency, _ in latencies]),
+                'first_audio_ms': percentiles([first for _, first in latencies if first is not None]),
+                'workers': self.status()}
+
+
+def output_rate(sample_rate):
+    """The rate the workers stream at, tts_engine's own for rates it doesn't accept"""
+    return sample_rate if sample_rate and 8000 <= sample_rate <= 192000 else SAMPLE_RATE
+
+
+def pcm_of(frames):
+    """Join the PCM of length prefixed frames, dropping the prefixes and the end frame"""
+    return b''.join(frame[4:] for frame in frames)
+
+
+def create_app(pool: WorkerPool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "ready": len(pool.ready) == len(pool.processes), "sample_rate": SAMPLE_RATE,
+                "model_version": MODEL_VERSION, "workers": pool.status()}
+
+    @app.get("/ready")
+    async def ready():
+        if len(pool.ready) < len(pool.processes):
+            return JSONResponse({"ready": False, "workers": pool.status()}, status_code=503)
+        return {"ready": True}
+
+    @app.get("/metrics")
+    async def metrics():
+        return pool.metrics()
+
+    @app.post("/tts")
+    def text_to_speech(request: TTSRequest, accept: str = Header(default="")):
+        try:
+            byte_io = io.BytesIO()
+            with wave.open(byte_io, 'wb') as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(SAMPLE_RATE)
+                wav_file.writeframes(pcm_of(pool.frames(request.text, request.voice_type)))
+            if "audio/wav" in accept:
+                return Response(byte_io.getvalue(), media_type="audio/wav",
+                                headers={"X-Sample-Rate": str(SAMPLE_RATE)})
+            return {"audio": base64.b64encode(byte_io.getvalue()).decode(), "sample_rate": SAMPLE_RATE}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @app.post("/tts_stream")
+    def text_to_speech_stream(request: TTSRequest):
+        sample_rate = output_rate(request.sample_rate)
+        headers = {"X-Sample-Rate": str(sample_rate), "X-Channels": "1", "X-Sample-Width": "2"}
+        return StreamingResponse(pool.frames(request.text, request.voice_type, sample_rate),
+                                 media_type="application/octet-stream", headers=headers)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help="model processes")
+    parser.add_argument('--threads', type=int, default=2, help="torch threads and pinned CPUs per worker")
+    parser.add_argument('--reserve', type=int, default=2, help="first CPUs left to the game and STT")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=1920)
+    parser.add_argument('--uds', help="listen on this Unix socket instead of host and port")
+    args = parser.parse_args()
+
+    import uvicorn
+    pool = WorkerPool(args.workers, args.threads, args.reserve)
+    uvicorn.run(create_app(pool), host=args.host, port=args.port, uds=args.uds, timeout_keep_alive=75)
+
+
+if __name__ == '__main__':
+    main()